@@ -0,0 +1,433 @@
+"""asyncio client for the SDS stream operations used by the sample"""
+
+import asyncio
+import inspect
+import json
+import threading
+from enum import Enum
+
+import aiohttp
+from adh_sample_library_preview import (SdsError, SdsResultPage, SdsStream,
+                                        SdsStreamView, SdsStreamViewMap,
+                                        SdsType)
+
+import json_backend
+from wave_data import JsonPayload, encode_events
+
+
+class AsyncSdsClient:
+    """Sends SDS requests from asyncio code over one pooled HTTP session
+
+    The EDSClient or ADHClient it wraps provides the endpoint, tenant and
+    request headers, including the bearer token. When on_request is set, it
+    is called with the request and response body bytes of every request
+    """
+
+    def __init__(self, sds_client, connection_limit=100):
+        self.on_request = None
+        self.__base_client = sds_client.baseClient
+        self.__base_path = (f'{self.__base_client.uri_API}/Tenants/'
+                            f'{self.__base_client.tenant}/Namespaces/')
+        self.__connection_limit = connection_limit
+        self.__session = None
+        self.Types = AsyncTypes(self)
+        self.Streams = AsyncStreams(self)
+        self.StreamViews = AsyncStreamViews(self)
+
+    @property
+    def uri(self):
+        """The base url of the SDS endpoint"""
+        return self.__base_client.uri
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        """Closes the pooled HTTP connections"""
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    def path(self, namespace_id, collection, *ids):
+        """Builds the url of a collection, or of an object in it"""
+        path = f'{self.__base_path}{namespace_id}/{collection}'
+        for object_id in ids:
+            path += '/' + self.__base_client.encode(object_id)
+        return path
+
+    async def request(self, method, url, message, params=None, data=None):
+        """Sends a request and returns its parsed JSON content, if any"""
+        if self.__session is None:
+            self.__session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.__connection_limit))
+
+        sent = [0]
+        if isinstance(data, JsonPayload):
+            data = iterate(data, sent)
+        elif self.on_request is not None and data is not None:
+            sent[0] = len(data.encode() if isinstance(data, str) else data)
+        async with self.__session.request(
+                method, url, params=query_params(params), data=data,
+                headers=self.__base_client.sdsHeaders()) as response:
+            text = await response.text()
+            if self.on_request is not None:
+                self.on_request(sent[0], len(text.encode()))
+            # 207 only happens on a collection return that is partially successful
+            if (response.status < 200 or response.status >= 300
+                    or response.status == 207):
+                raise SdsError(text, message, StatusCode=response.status,
+                               OperationId=response.headers.get('Operation-Id'),
+                               Url=str(response.url))
+        return json_backend.loads(text) if text else None
+
+
+async def iterate(payload, sent):
+    """Feeds the chunks of a JsonPayload to aiohttp as they are encoded"""
+    for chunk in payload:
+        sent[0] += len(chunk)
+        yield chunk
+
+
+def query_params(params):
+    """Converts request parameters the way requests would send them"""
+    if params is None:
+        return None
+    result = {}
+    for key, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, Enum):
+            value = value.value
+        result[key] = str(value)
+    return result
+
+
+def payload(values):
+    """Converts the values of a write call into its request body"""
+    if isinstance(values, (str, bytes, JsonPayload)):
+        return values
+    return encode_events(values)
+
+
+def resolve(content, value_class):
+    """Converts a response into value_class events, if given"""
+    if value_class is None or content is None:
+        return content
+    if isinstance(content, list):
+        return [value_class.fromJson(value) for value in content]
+    return value_class.fromJson(content)
+
+
+class AsyncTypes:
+    """Async calls for SdsTypes"""
+
+    def __init__(self, client):
+        self.__client = client
+
+    async def getOrCreateType(self, namespace_id, sds_type):
+        """Creates the type, or gets it if an identical one exists"""
+        content = await self.__client.request(
+            'POST', self.__client.path(namespace_id, 'Types', sds_type.Id),
+            f'Failed to create type, {sds_type.Id}.', data=sds_type.toJson())
+        return SdsType.fromJson(content)
+
+    async def getTypes(self, namespace_id, skip=0, count=100, query=''):
+        """Gets the types of a namespace"""
+        content = await self.__client.request(
+            'GET', self.__client.path(namespace_id, 'Types'),
+            'Failed to get all SdsTypes.',
+            params={'skip': skip, 'count': count, 'query': query})
+        return [SdsType.fromJson(sds_type) for sds_type in content]
+
+    async def deleteType(self, namespace_id, type_id):
+        """Deletes a type"""
+        await self.__client.request(
+            'DELETE', self.__client.path(namespace_id, 'Types', type_id),
+            f'Failed to delete SdsType, {type_id}.')
+
+
+class AsyncStreamViews:
+    """Async calls for SdsStreamViews"""
+
+    def __init__(self, client):
+        self.__client = client
+
+    async def getOrCreateStreamView(self, namespace_id, stream_view):
+        """Creates the stream view, or gets it if an identical one exists"""
+        content = await self.__client.request(
+            'POST',
+            self.__client.path(namespace_id, 'StreamViews', stream_view.Id),
+            f'Failed to create SdsStreamView, {stream_view.Id}.',
+            data=stream_view.toJson())
+        return SdsStreamView.fromJson(content)
+
+    async def getStreamViewMap(self, namespace_id, stream_view_id):
+        """Gets the property map of a stream view"""
+        content = await self.__client.request(
+            'GET',
+            self.__client.path(namespace_id, 'StreamViews', stream_view_id) + '/Map',
+            f'Failed to get SdsStreamViewMap, {stream_view_id}.')
+        return SdsStreamViewMap.fromJson(content)
+
+    async def deleteStreamView(self, namespace_id, stream_view_id):
+        """Deletes a stream view"""
+        await self.__client.request(
+            'DELETE',
+            self.__client.path(namespace_id, 'StreamViews', stream_view_id),
+            f'Failed to delete SdsStreamView, {stream_view_id}.')
+
+
+class AsyncStreams:
+    """Async calls for SdsStreams and their data"""
+
+    def __init__(self, client):
+        self.__client = client
+
+    def __stream(self, namespace_id, stream_id, *path):
+        return '/'.join([self.__client.path(namespace_id, 'Streams', stream_id),
+                         *path])
+
+    async def getStream(self, namespace_id, stream_id):
+        """Gets a stream"""
+        content = await self.__client.request(
+            'GET', self.__stream(namespace_id, stream_id),
+            f'Failed to get SdsStream, {stream_id}.')
+        return SdsStream.fromJson(content)
+
+    async def getOrCreateStream(self, namespace_id, stream):
+        """Creates the stream, or gets it if an identical one exists"""
+        content = await self.__client.request(
+            'POST', self.__stream(namespace_id, stream.Id),
+            f'Failed to create SdsStream, {stream.Id}.', data=stream.toJson())
+        return SdsStream.fromJson(content)
+
+    async def createOrUpdateStream(self, namespace_id, stream):
+        """Creates the stream, or updates it if it exists"""
+        await self.__client.request(
+            'PUT', self.__stream(namespace_id, stream.Id),
+            f'Failed to create SdsStream, {stream.Id}.', data=stream.toJson())
+
+    async def updateStreamType(self, namespace_id, stream_id, stream_view_id):
+        """Changes the type of a stream through a stream view"""
+        await self.__client.request(
+            'PUT', self.__stream(namespace_id, stream_id, 'Type'),
+            f'Failed to update SdsStream type, {stream_id}.',
+            params={'streamViewId': stream_view_id})
+
+    async def deleteStream(self, namespace_id, stream_id):
+        """Deletes a stream"""
+        await self.__client.request(
+            'DELETE', self.__stream(namespace_id, stream_id),
+            f'Failed to delete SdsStream, {stream_id}.')
+
+    async def createOrUpdateTags(self, namespace_id, stream_id, tags):
+        """Replaces the tags of a stream"""
+        await self.__client.request(
+            'PUT', self.__stream(namespace_id, stream_id, 'Tags'),
+            f'Failed to create tags for Stream: {stream_id}.',
+            data=json.dumps(tags))
+
+    async def createOrUpdateMetadata(self, namespace_id, stream_id, metadata):
+        """Replaces the metadata of a stream"""
+        await self.__client.request(
+            'PUT', self.__stream(namespace_id, stream_id, 'Metadata'),
+            f'Failed to create metadata for Stream: {stream_id}.',
+            data=json.dumps(metadata))
+
+    async def patchMetadata(self, namespace_id, stream_id, patch):
+        """Applies a JSON patch to the metadata of a stream"""
+        await self.__client.request(
+            'PATCH', self.__stream(namespace_id, stream_id, 'Metadata'),
+            f'Failed to patch metadata for Stream: {stream_id}.',
+            data=json.dumps(patch))
+
+    async def getTags(self, namespace_id, stream_id):
+        """Gets the tags of a stream"""
+        return await self.__client.request(
+            'GET', self.__stream(namespace_id, stream_id, 'Tags'),
+            f'Failed to get tags for Stream: {stream_id}.')
+
+    async def getMetadata(self, namespace_id, stream_id, key):
+        """Gets one metadata value of a stream"""
+        return await self.__client.request(
+            'GET', self.__stream(namespace_id, stream_id, 'Metadata', key),
+            f'Failed to get metadata for Stream: {stream_id}.')
+
+    async def insertValues(self, namespace_id, stream_id, values):
+        """Inserts events, failing on existing indexes"""
+        await self.__client.request(
+            'POST', self.__stream(namespace_id, stream_id, 'Data'),
+            f'Failed to insert multiple values for SdsStream: {stream_id}.',
+            data=payload(values))
+
+    async def updateValues(self, namespace_id, stream_id, values):
+        """Inserts events, overwriting existing indexes"""
+        await self.__client.request(
+            'PUT', self.__stream(namespace_id, stream_id, 'Data'),
+            f'Failed to update values for SdsStream: {stream_id}.',
+            data=payload(values))
+
+    async def replaceValues(self, namespace_id, stream_id, values):
+        """Overwrites events, failing on missing indexes"""
+        await self.__client.request(
+            'PUT', self.__stream(namespace_id, stream_id, 'Data'),
+            f'Failed to replace multiple values for SdsStream: {stream_id}.',
+            params={'allowCreate': 'false'}, data=payload(values))
+
+    async def removeValue(self, namespace_id, stream_id, key):
+        """Removes the event at an index"""
+        await self.__client.request(
+            'DELETE', self.__stream(namespace_id, stream_id, 'Data'),
+            f'Failed to remove values for SdsStream: {stream_id}.',
+            params={'index': key})
+
+    async def removeWindowValues(self, namespace_id, stream_id, start, end):
+        """Removes the events of an index window"""
+        await self.__client.request(
+            'DELETE', self.__stream(namespace_id, stream_id, 'Data'),
+            f'Failed to remove values for SdsStream: {stream_id}.',
+            params={'startIndex': start, 'endIndex': end})
+
+    async def getFirstValue(self, namespace_id, stream_id, value_class=None):
+        """Gets the first event of a stream"""
+        content = await self.__client.request(
+            'GET', self.__stream(namespace_id, stream_id, 'Data', 'First'),
+            f'Failed to get first value for SdsStream: {stream_id}.')
+        return resolve(content, value_class)
+
+    async def getLastValue(self, namespace_id, stream_id, value_class=None):
+        """Gets the last event of a stream"""
+        content = await self.__client.request(
+            'GET', self.__stream(namespace_id, stream_id, 'Data', 'Last'),
+            f'Failed to get last value for SdsStream: {stream_id}.')
+        return resolve(content, value_class)
+
+    async def getWindowValues(self, namespace_id, stream_id, start, end,
+                              value_class=None, filter=''):
+        """Gets the events of an index window"""
+        content = await self.__client.request(
+            'GET', self.__stream(namespace_id, stream_id, 'Data'),
+            f'Failed to get window values for SdsStream: {stream_id}.',
+            params={'startIndex': start, 'endIndex': end, 'filter': filter})
+        return resolve(content, value_class)
+
+    async def getWindowValuesPaged(self, namespace_id, stream_id, start, end,
+                                   count, continuation_token='',
+                                   value_class=None, filter=''):
+        """Gets a page of the events of an index window"""
+        content = await self.__client.request(
+            'GET', self.__stream(namespace_id, stream_id, 'Data'),
+            f'Failed to get window values for SdsStream: {stream_id}.',
+            params={'startIndex': start, 'endIndex': end, 'filter': filter,
+                    'count': count, 'continuationToken': continuation_token})
+        page = SdsResultPage.fromJson(content)
+        page.Results = resolve(page.Results, value_class)
+        return page
+
+    async def getWindowValuesForm(self, namespace_id, stream_id, value_class,
+                                  start, end, form=''):
+        """Gets the events of an index window in another form, like table"""
+        content = await self.__client.request(
+            'GET', self.__stream(namespace_id, stream_id, 'Data'),
+            f'Failed to get window values for SdsStream: {stream_id}.',
+            params={'startIndex': start, 'endIndex': end, 'form': form})
+        return resolve(content, value_class)
+
+    async def getRangeValues(self, namespace_id, stream_id, value_class, start,
+                             skip, count, reversed, boundary_type, filter='',
+                             stream_view_id=''):
+        """Gets count events from a start index"""
+        content = await self.__client.request(
+            'GET', self.__stream(namespace_id, stream_id, 'Data', 'Transform'),
+            f'Failed to get range values for SdsStream: {stream_id}.',
+            params={'startIndex': start, 'skip': skip, 'count': count,
+                    'reversed': reversed, 'boundary_type': boundary_type,
+                    'filter': filter, 'stream_view_id': stream_view_id})
+        return resolve(content, value_class)
+
+    async def getRangeValuesInterpolated(self, namespace_id, stream_id,
+                                         value_class, start, end, count,
+                                         filter=''):
+        """Gets count events interpolated evenly between two indexes"""
+        content = await self.__client.request(
+            'GET',
+            self.__stream(namespace_id, stream_id, 'Data', 'Transform',
+                          'Interpolated'),
+            f'Failed to get range values for SdsStream: {stream_id}.',
+            params={'startIndex': start, 'endIndex': end, 'count': count,
+                    'filter': filter})
+        return resolve(content, value_class)
+
+    async def getSampledValues(self, namespace_id, stream_id, value_class,
+                               start, end, sample_by, intervals, filter='',
+                               stream_view_id=''):
+        """Gets representative events of intervals of an index window"""
+        path = ['Data', 'Transform', 'Sampled'] if stream_view_id else [
+            'Data', 'Sampled']
+        content = await self.__client.request(
+            'GET', self.__stream(namespace_id, stream_id, *path),
+            f'Failed to get sampled values for SdsStream: {stream_id}.',
+            params={'startIndex': start, 'endIndex': end,
+                    'sampleBy': sample_by, 'intervals': intervals,
+                    'filter': filter, 'stream_view_id': stream_view_id})
+        return resolve(content, value_class)
+
+
+class BlockingSdsClient:
+    """Runs the calls of an AsyncSdsClient to completion from blocking code
+
+    The calls run on an event loop in a background thread, so the sample's
+    main() flow can run on the asyncio client unchanged. Anything the async
+    client does not cover is delegated to the wrapped EDSClient or ADHClient
+    """
+
+    def __init__(self, sds_client, connection_limit=100):
+        self.__sds_client = sds_client
+        self.__async_client = AsyncSdsClient(sds_client, connection_limit)
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__loop.run_forever,
+                                         daemon=True)
+        self.__thread.start()
+        self.Types = BlockingProxy(self, self.__async_client.Types,
+                                   sds_client.Types)
+        self.Streams = BlockingProxy(self, self.__async_client.Streams,
+                                     sds_client.Streams)
+        self.StreamViews = BlockingProxy(self, self.__async_client.StreamViews,
+                                         sds_client.StreamViews)
+
+    def __getattr__(self, name):
+        return getattr(self.__sds_client, name)
+
+    @property
+    def async_client(self):
+        """The AsyncSdsClient that serves the calls"""
+        return self.__async_client
+
+    def run(self, coroutine):
+        """Waits for a coroutine to complete on the client's event loop"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.__loop).result()
+
+    def close(self):
+        """Closes the async client and stops its event loop"""
+        self.run(self.__async_client.close())
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+        self.__loop.close()
+
+
+class BlockingProxy:
+    """Exposes the coroutines of an async sub-client as blocking calls"""
+
+    def __init__(self, client, async_calls, calls):
+        self.__client = client
+        self.__async_calls = async_calls
+        self.__calls = calls
+
+    def __getattr__(self, name):
+        call = getattr(self.__async_calls, name, None)
+        if call is None or not inspect.iscoroutinefunction(call):
+            return getattr(self.__calls, name)
+        return lambda *args, **kwargs: self.__client.run(call(*args, **kwargs))
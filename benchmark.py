@@ -0,0 +1,1048 @@
+"""Benchmarks for the hot paths of the SDS Python sample"""
+
+import argparse
+import contextlib
+import inspect
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from adh_sample_library_preview import (EDSClient, SdsBoundaryType, SdsStream,
+                                        SdsStreamView, SdsStreamViewProperty)
+
+import json_backend
+from bulk_writer import bulk_write, summarize
+from compound_index import CompoundIndex
+from delta_update import DeltaUpdater
+from fan_out import fan_out
+from filter_expression import compile_filter, filter_window
+from interpolation import (interpolate, interpolate_count,
+                           interpolation_modes, take)
+from metadata_cache import MetadataCache
+from paging import iter_window, iter_window_batches
+from parallel_waves import generate_waves, share_tracker
+from program import (COMPOUND_TYPE_ID, SAMPLE_INTEGER_TYPE_ID,
+                     SAMPLE_STREAM_ID, SAMPLE_STREAM_VIEW_ID,
+                     SAMPLE_STREAM_VIEW_INT_ID, SAMPLE_TARGET_TYPE_ID,
+                     SAMPLE_TYPE_ID, get_wave_compound_data_type,
+                     get_wave_data_integer_type, get_wave_data_target_type,
+                     get_wave_data_type, main, next_wave, next_waves,
+                     to_string, to_wave_data)
+from sampling import sample
+from sds_stand_in import SdsStandIn
+from secondary_index import IndexedWindow
+from stream_view_map import ViewProjection
+from table_form import decode_table, get_window_table, table_dtypes
+from wave_data import (CompactWaveData, CompactWaveDataCompound,
+                       CompactWaveDataInteger, CompactWaveDataTarget,
+                       WaveBatch, WaveData, WaveDataCompound, WaveDataInteger,
+                       WaveDataTarget, decode_events, encode_events,
+                       iter_json)
+from window_cache import WindowCache
+
+
+def best_time(function, repeat=5):
+    """Returns the best wall time in seconds of several calls to function"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def benchmark_next_wave(count=100_000):
+    """Compares per-event and columnar wave generation"""
+    # Stay below the order at which math.sinh overflows
+    orders = [order % 6400 for order in range(count)]
+
+    def per_event():
+        return [next_wave(order, 2.0) for order in orders]
+
+    def per_event_payload():
+        return json.dumps([wave.toDictionary() for wave in per_event()])
+
+    def columnar():
+        return next_waves(orders, 2.0)
+
+    def columnar_payload():
+        return columnar().toJson()
+
+    return {
+        'count': count,
+        'next_wave': best_time(per_event, 3),
+        'next_waves': best_time(columnar),
+        'next_wave + toDictionary + json.dumps': best_time(per_event_payload, 1),
+        'next_waves + WaveBatch.toJson': best_time(columnar_payload, 3),
+    }
+
+
+def benchmark_window(count=100_000):
+    """Compares decoding and encoding a window as objects and as a WaveBatch"""
+    payload = next_waves(np.arange(count) % 6400, 2.0).toJson()
+    content = json.loads(payload)
+    waves = [WaveData.fromJson(event) for event in content]
+    batch = WaveBatch.fromJson(content, WaveData)
+
+    return {
+        'count': count,
+        'WaveData.fromJson': best_time(
+            lambda: [WaveData.fromJson(event) for event in content], 1),
+        'WaveBatch.fromJson': best_time(
+            lambda: WaveBatch.fromJson(content, WaveData), 3),
+        'WaveData.toDictionary + json.dumps': best_time(
+            lambda: json.dumps([wave.toDictionary() for wave in waves]), 1),
+        'WaveBatch.toJson': best_time(batch.toJson, 3),
+    }
+
+
+def inspect_to_dictionary(wave):
+    """The toDictionary implementation that inspects the class per event"""
+    dictionary = {}
+    for prop in inspect.getmembers(type(wave),
+                                   lambda v: isinstance(v, property)):
+        if hasattr(wave, prop[0]):
+            dictionary[prop[0]] = prop[1].fget(wave)
+    return dictionary
+
+
+def inspect_from_dictionary(wave_class, content):
+    """The fromDictionary implementation that inspects the class per event"""
+    wave = wave_class()
+    for prop in inspect.getmembers(type(wave),
+                                   lambda v: isinstance(v, property)):
+        prop[1].fset(wave, 0)
+        if prop[0] in content:
+            value = content[prop[0]]
+            if value is not None:
+                prop[1].fset(wave, value)
+    return wave
+
+
+def benchmark_codec(count=20_000):
+    """Times per-event encode and decode of every wave class"""
+    results = {'count': count}
+    for wave_class in (WaveData, WaveDataCompound, WaveDataTarget,
+                       WaveDataInteger):
+        name = wave_class.__name__
+        # A non-empty dictionary sets every property to its default of 0
+        wave = wave_class.fromDictionary({'default': None})
+        content = wave.toDictionary()
+        results[f'{name} inspect toDictionary'] = best_time(
+            lambda: [inspect_to_dictionary(wave) for _ in range(count)], 1)
+        results[f'{name} toDictionary'] = best_time(
+            lambda: [wave.toDictionary() for _ in range(count)], 3)
+        results[f'{name} inspect fromDictionary'] = best_time(
+            lambda: [inspect_from_dictionary(wave_class, content)
+                     for _ in range(count)], 1)
+        results[f'{name} fromDictionary'] = best_time(
+            lambda: [wave_class.fromDictionary(content)
+                     for _ in range(count)], 3)
+        payload = wave.toJson()
+        results[f'{name} toJson'] = best_time(
+            lambda: [wave.toJson() for _ in range(count)], 3)
+        results[f'{name} fromJson'] = best_time(
+            lambda: [wave_class.fromJson(json.loads(payload))
+                     for _ in range(count)], 3)
+
+    content = WaveData.fromDictionary({'default': None}).toDictionary()
+    wave = to_wave_data(content)
+    results['to_wave_data'] = best_time(
+        lambda: [to_wave_data(content) for _ in range(count)], 3)
+    results['to_string'] = best_time(
+        lambda: [to_string(wave) for _ in range(count)], 3)
+    return results
+
+
+def benchmark_json_backends(count=1_000_000):
+    """Compares bulk encode and decode throughput of each JSON backend"""
+    batch = next_waves(np.arange(count) % 6400, 2.0)
+    waves = WaveBatch(WaveData, {
+        name: batch.columns[name] for name, _, _ in WaveData.sds_columns})
+    objects = waves.toWaves()
+    selected = json_backend.get_backend().name
+    results = {'count': count}
+    try:
+        for name in json_backend.BACKENDS:
+            json_backend.set_backend(name)
+            payload = waves.toJson()
+            results[f'{name} WaveBatch.toJson'] = best_time(waves.toJson, 1)
+            results[f'{name} encode_events'] = best_time(
+                lambda: encode_events(objects), 1)
+            results[f'{name} WaveBatch.fromJson'] = best_time(
+                lambda: WaveBatch.fromJson(payload, WaveData), 1)
+            results[f'{name} decode_events'] = best_time(
+                lambda: decode_events(payload, WaveData), 1)
+    finally:
+        json_backend.set_backend(selected)
+    return results
+
+
+def allocated_bytes(function):
+    """Returns the bytes still allocated by the result of function"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = function()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return after - before
+
+
+def benchmark_memory(count=100_000):
+    """Measures bytes per decoded event of each wave class and a WaveBatch"""
+    rng = np.random.default_rng(0)
+    results = {'count': count}
+    for wave_class, compact_class in (
+            (WaveData, CompactWaveData),
+            (WaveDataCompound, CompactWaveDataCompound),
+            (WaveDataTarget, CompactWaveDataTarget),
+            (WaveDataInteger, CompactWaveDataInteger)):
+        batch = WaveBatch(wave_class, {
+            name: rng.random(count) * 1000
+            for name, _, _ in wave_class.sds_columns})
+        payload = json.dumps([wave.toDictionary()
+                              for wave in batch.toWaves()])
+        for value_class in (wave_class, compact_class):
+            results[value_class.__name__] = allocated_bytes(
+                lambda: [value_class.fromJson(event)
+                         for event in json.loads(payload)]) / count
+        results[f'WaveBatch of {wave_class.__name__}'] = allocated_bytes(
+            lambda: WaveBatch.fromJson(batch.toJson(), wave_class)) / count
+    return results
+
+
+def peak_bytes(function):
+    """Returns the peak bytes allocated while running function"""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_streaming(count=200_000):
+    """Compares peak memory of building and of streaming a write payload"""
+
+    def generated():
+        # Events are generated lazily, a thousand at a time
+        for start in range(0, count, 1000):
+            yield next_waves(np.arange(start, start + 1000) % 6400, 2.0)
+
+    def drain(chunks):
+        for _ in chunks:
+            pass
+
+    return {
+        'count': count,
+        'WaveBatch.toJson': peak_bytes(
+            lambda: WaveBatch.concatenate(generated()).toJson()) / count,
+        'iter_json': peak_bytes(lambda: drain(iter_json(generated()))) / count,
+    }
+
+
+def benchmark_bulk_write(count=100_000, latency=0.005):
+    """Measures bulk insert throughput by chunk size and concurrency"""
+    stand_in = SdsStandIn(latency=latency).start()
+    sds_client = EDSClient('v1', stand_in.uri)
+    # Keep the compound index of every event unique
+    orders = np.arange(count)
+    waves = next_waves(orders % 6400, orders // 6400 + 1)
+    sds_client.Types.getOrCreateType('default', get_wave_compound_data_type(
+        COMPOUND_TYPE_ID))
+
+    results = {'count': count}
+    try:
+        for max_events in (500, 2000, 10000):
+            for concurrency in (1, 4, 8):
+                sds_client.Streams.createOrUpdateStream('default', SdsStream(
+                    'bulk', COMPOUND_TYPE_ID))
+                start = time.perf_counter()
+                chunks = bulk_write(sds_client, 'default', {'bulk': waves},
+                                    max_events=max_events,
+                                    concurrency=concurrency, ordered=False)
+                seconds = time.perf_counter() - start
+                if summarize(chunks)['failed_chunks']:
+                    raise RuntimeError('Bulk write benchmark chunk failed')
+                results[f'{max_events} events x {concurrency} threads'] = seconds
+                sds_client.Streams.deleteStream('default', 'bulk')
+    finally:
+        stand_in.stop()
+    return results
+
+
+def benchmark_main(latency=0.001, repeat=3):
+    """Times each numbered step of main() against the SDS stand-in
+
+    A non-default tenant is used so the ADH-only steps also run. Returns the
+    best seconds of each step over repeat runs
+    """
+    results = {'runs': repeat}
+    for _ in range(repeat):
+        marks = []
+        with SdsStandIn(latency=latency) as stand_in:
+            with contextlib.redirect_stdout(io.StringIO()):
+                main(True, appsettings=stand_in.appsettings('benchmark'),
+                     on_step=lambda number: marks.append(
+                         (number, time.perf_counter())))
+                marks.append((None, time.perf_counter()))
+        run = {}
+        for (number, start), (_, end) in zip(marks, marks[1:]):
+            run[f'step {number}'] = run.get(f'step {number}', 0) + end - start
+        run['total'] = marks[-1][1] - marks[0][1]
+        for case, seconds in run.items():
+            results[case] = min(seconds, results.get(case, seconds))
+    return results
+
+
+def benchmark_paging(count=50_000, page_size=5000):
+    """Compares reading a window whole and lazily in pages
+
+    Peak memory is that of the whole process, stand-in included
+    """
+    stand_in = SdsStandIn().start()
+    sds_client = EDSClient('v1', stand_in.uri)
+    sds_client.Types.getOrCreateType('default', get_wave_data_type('Wave'))
+    sds_client.Streams.createOrUpdateStream('default',
+                                            SdsStream('Paged', 'Wave'))
+    # Unique orders, with the values of orders below the sinh overflow
+    waves = next_waves(np.arange(count) % 6400, 2.0)
+    waves = WaveBatch(WaveDataCompound, {**waves.columns,
+                                         'Order': np.arange(count)})
+    sds_client.Streams.insertValues('default', 'Paged', waves.toJson())
+
+    def whole():
+        waves = sds_client.Streams.getWindowValues(
+            'default', 'Paged', 0, count, WaveData)
+        return len(waves)
+
+    def paged():
+        return sum(1 for _ in iter_window(sds_client, 'default', 'Paged', 0,
+                                          count, WaveData, page_size))
+
+    def batches():
+        return sum(len(batch) for batch in iter_window_batches(
+            sds_client, 'default', 'Paged', 0, count, WaveData, page_size))
+
+    def first_event(read):
+        start = time.perf_counter()
+        read()
+        return time.perf_counter() - start
+
+    try:
+        results = {'count': count}
+        for name, read, first in (
+                ('getWindowValues', whole, whole),
+                ('iter_window', paged, lambda: next(iter(iter_window(
+                    sds_client, 'default', 'Paged', 0, count, WaveData,
+                    page_size)))),
+                ('iter_window_batches', batches, lambda: next(iter(
+                    iter_window_batches(sds_client, 'default', 'Paged', 0,
+                                        count, WaveData, page_size))))):
+            results[f'{name} seconds'] = best_time(read, 3)
+            results[f'{name} first event seconds'] = best_time(
+                lambda: first_event(first), 3)
+            results[f'{name} peak bytes/event'] = peak_bytes(read) / count
+    finally:
+        stand_in.stop()
+    return results
+
+
+def benchmark_table(count=100_000):
+    """Compares decoding a window as WaveData and from the tableh form"""
+    stand_in = SdsStandIn().start()
+    sds_client = EDSClient('v1', stand_in.uri)
+    sds_client.Types.getOrCreateType('default', get_wave_data_type('Wave'))
+    sds_client.Streams.createOrUpdateStream('default',
+                                            SdsStream('Table', 'Wave'))
+    waves = next_waves(np.arange(count) % 6400, 2.0)
+    waves = WaveBatch(WaveDataCompound, {**waves.columns,
+                                         'Order': np.arange(count)})
+    sds_client.Streams.insertValues('default', 'Table', waves.toJson())
+
+    try:
+        table = get_window_table(sds_client, 'default', 'Table', 0, count)
+        payload = json_backend.dumps(sds_client.Streams.getWindowValues(
+            'default', 'Table', 0, count))
+        dtypes = table_dtypes(WaveData)
+        results = {'count': count}
+        for name, decode in (
+                ('getWindowValues WaveData', lambda: (
+                    sds_client.Streams.getWindowValues(
+                        'default', 'Table', 0, count, WaveData))),
+                ('get_window_table + decode_table', lambda: decode_table(
+                    get_window_table(sds_client, 'default', 'Table', 0,
+                                     count))),
+                ('decode WaveData', lambda: decode_events(payload, WaveData)),
+                ('decode WaveBatch', lambda: WaveBatch.fromJson(payload,
+                                                                WaveData)),
+                ('decode parsed tableh', lambda: decode_table(
+                    json_backend.loads(table), dtypes)),
+                ('decode_table', lambda: decode_table(table, dtypes))):
+            results[f'{name} seconds'] = best_time(decode, 3)
+            if not name.startswith('get'):
+                results[f'{name} peak bytes/event'] = peak_bytes(
+                    decode) / count
+        return results
+    finally:
+        stand_in.stop()
+
+
+def benchmark_interpolation(count=20_000, targets=100_000, queries=100,
+                            latency=0.001):
+    """Compares calculating indexes in SDS and from a window read once
+
+    The count column is the events stored. Each query asks SDS for one
+    calculated index, as a read of the value at a given time would
+    """
+    stand_in = SdsStandIn(latency=latency).start()
+    sds_client = EDSClient('v1', stand_in.uri)
+    sds_type = get_wave_data_type('Wave')
+    sds_client.Types.getOrCreateType('default', sds_type)
+    stream = SdsStream('Interpolated', 'Wave')
+    sds_client.Streams.createOrUpdateStream('default', stream)
+    waves = next_waves(np.arange(count) % 6400, 2.0)
+    waves = WaveBatch(WaveData, {**waves.columns,
+                                 'Order': np.arange(count) * 2})
+    sds_client.Streams.insertValues('default', 'Interpolated',
+                                    waves.toJson())
+    end = 2 * (count - 1)
+    indexes = np.random.default_rng(0).uniform(0, end, queries)
+
+    try:
+        modes = interpolation_modes(sds_type, stream)
+        window = decode_table(get_window_table(
+            sds_client, 'default', 'Interpolated', 0, end),
+            table_dtypes(WaveData))
+        results = {'count': count}
+        for name, calculate in (
+                (f'SDS, {queries} calls of 1 index', lambda: [
+                    sds_client.Streams.getRangeValuesInterpolated(
+                        'default', 'Interpolated', None, index, index, 1)
+                    for index in indexes]),
+                (f'window read + interpolate, {queries} indexes', lambda: interpolate(
+                    decode_table(get_window_table(
+                        sds_client, 'default', 'Interpolated', 0, end),
+                        table_dtypes(WaveData)), indexes, modes=modes)),
+                (f'SDS, 1 call of {targets} indexes', lambda: (
+                    sds_client.Streams.getRangeValuesInterpolated(
+                        'default', 'Interpolated', None, 0, end, targets))),
+                (f'interpolate_count, {targets} indexes', lambda: (
+                    interpolate_count(window, 0, end, targets,
+                                      modes=modes)))):
+            results[f'{name} seconds'] = best_time(calculate, 3)
+        return results
+    finally:
+        stand_in.stop()
+
+
+def benchmark_sampling(count=1_000_000, sds_count=10_000, latency=0.001):
+    """Compares sampling in SDS and from a window read once
+
+    SDS samples sds_count events; the local cases sample count events at
+    several zoom levels
+    """
+    stand_in = SdsStandIn(latency=latency).start()
+    sds_client = EDSClient('v1', stand_in.uri)
+    sds_client.Types.getOrCreateType('default', get_wave_data_type('Wave'))
+    sds_client.Streams.createOrUpdateStream('default',
+                                            SdsStream('Sampled', 'Wave'))
+    waves = next_waves(np.arange(count) % 6400, 2.0)
+    window = {**waves.columns, 'Order': np.arange(count)}
+    sds_client.Streams.insertValues(
+        'default', 'Sampled', WaveBatch(WaveData, window)[:sds_count].toJson())
+
+    try:
+        results = {'count': count}
+        results[f'SDS, {sds_count} events, 100 intervals seconds'] = \
+            best_time(lambda: sds_client.Streams.getSampledValues(
+                'default', 'Sampled', None, 0, sds_count, 'sin', 100), 3)
+        small = {name: column[:sds_count] for name, column in window.items()}
+        results[f'sample, {sds_count} events, 100 intervals seconds'] = \
+            best_time(lambda: sample(small, 0, sds_count, 'sin', 100))
+        for intervals in (10, 1000, 100_000):
+            results[f'sample, {intervals} intervals seconds'] = best_time(
+                lambda: sample(window, 0, count, 'sin', intervals))
+        results['sample, 10 zoom levels seconds'] = best_time(lambda: [
+            sample(window, count // 2 - count // 2 ** level,
+                   count // 2 + count // 2 ** level, 'sin', 1000)
+            for level in range(1, 11)])
+        return results
+    finally:
+        stand_in.stop()
+
+
+def benchmark_window_cache(count=200, span=20_000, size=1000,
+                           latency=0.001):
+    """Compares count overlapping window reads with and without a cache
+
+    The windows hold size events each, at random starts in span events,
+    as a dashboard panning over a stream would read them
+    """
+    stand_in = SdsStandIn(latency=latency).start()
+    sds_client = EDSClient('v1', stand_in.uri)
+    sds_client.Types.getOrCreateType('default', get_wave_data_type('Wave'))
+    sds_client.Streams.createOrUpdateStream('default',
+                                            SdsStream('Cached', 'Wave'))
+    waves = next_waves(np.arange(span) % 6400, 2.0)
+    sds_client.Streams.insertValues('default', 'Cached', WaveBatch(
+        WaveData, {**waves.columns, 'Order': np.arange(span)}).toJson())
+    starts = np.random.default_rng(0).integers(0, span - size, count)
+    caches = []
+
+    def read(client):
+        for start in starts:
+            client.Streams.getWindowValues('default', 'Cached', int(start),
+                                           int(start) + size - 1)
+
+    def cached():
+        caches.append(WindowCache())
+        read(caches[-1].wrap(sds_client))
+
+    try:
+        results = {'count': count * size,
+                   'uncached seconds': best_time(lambda: read(sds_client), 3),
+                   'cached seconds': best_time(cached, 3)}
+        results[COUNTERS] = {f'cached {counter}': value
+                             for counter, value in caches[-1].stats().items()}
+        return results
+    finally:
+        stand_in.stop()
+
+
+def create_definitions(sds_client):
+    """Creates the types, stream and stream views that main() starts with"""
+    wave_type = sds_client.Types.getOrCreateType(
+        'default', get_wave_data_type(SAMPLE_TYPE_ID))
+    target_type = sds_client.Types.getOrCreateType(
+        'default', get_wave_data_target_type(SAMPLE_TARGET_TYPE_ID))
+    integer_type = sds_client.Types.getOrCreateType(
+        'default', get_wave_data_integer_type(SAMPLE_INTEGER_TYPE_ID))
+    sds_client.Types.getOrCreateType(
+        'default', get_wave_compound_data_type(COMPOUND_TYPE_ID))
+    sds_client.Streams.createOrUpdateStream(
+        'default', SdsStream(SAMPLE_STREAM_ID, wave_type.Id))
+    sds_client.StreamViews.getOrCreateStreamView('default', SdsStreamView(
+        SAMPLE_STREAM_VIEW_ID, wave_type.Id, target_type.Id))
+    sds_client.StreamViews.getOrCreateStreamView('default', SdsStreamView(
+        SAMPLE_STREAM_VIEW_INT_ID, wave_type.Id, integer_type.Id,
+        properties=[SdsStreamViewProperty('Order', 'OrderTarget'),
+                    SdsStreamViewProperty('Sin', 'SinInt')]))
+
+
+def benchmark_metadata(latency=0.005, repeat=5):
+    """Compares the setup calls of a worker without and with a metadata cache
+
+    A warm worker loads the cache file another worker wrote; with
+    validation, it checks the definitions in the background
+    """
+    stand_in = SdsStandIn(latency=latency).start()
+    sds_client = EDSClient('v1', stand_in.uri)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'metadata.json')
+
+    def cold():
+        cache = MetadataCache(path)
+        cache.clear()
+        create_definitions(cache.wrap(sds_client))
+
+    def warm(validate=False):
+        cache = MetadataCache(path, validate)
+        create_definitions(cache.wrap(sds_client))
+        return cache
+
+    try:
+        results = {'runs': repeat,
+                   'uncached seconds': best_time(
+                       lambda: create_definitions(sds_client), repeat),
+                   'cold cache seconds': best_time(cold, repeat),
+                   'warm cache seconds': best_time(warm, repeat)}
+        caches = []
+        results['warm cache, validated seconds'] = best_time(
+            lambda: caches.append(warm(True)), repeat)
+        for cache in caches:
+            cache.close()
+        return results
+    finally:
+        stand_in.stop()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+def benchmark_filter(count=100_000, latency=0.001):
+    """Compares filtering a window in SDS and locally with compiled filters"""
+    filters = ['Radians lt 3', 'Sin gt 0.5 and Cos lt 0',
+               'not (Tan ge 1 or Tan le -1)', 'Order lt 50000 and Sin gt 0',
+               'Sinh gt 10 or Tanh lt -0.9']
+    stand_in = SdsStandIn(latency=latency).start()
+    sds_client = EDSClient('v1', stand_in.uri)
+    sds_client.Types.getOrCreateType('default', get_wave_data_type('Wave'))
+    sds_client.Streams.createOrUpdateStream('default',
+                                            SdsStream('Filtered', 'Wave'))
+    waves = next_waves(np.arange(count) % 6400, 2.0)
+    window = {**waves.columns, 'Order': np.arange(count)}
+    sds_client.Streams.insertValues('default', 'Filtered',
+                                    WaveBatch(WaveData, window).toJson())
+
+    try:
+        results = {'count': count}
+        results[f'SDS, {len(filters)} filters seconds'] = best_time(
+            lambda: [sds_client.Streams.getWindowValues(
+                'default', 'Filtered', 0, count, None, text)
+                for text in filters], 3)
+
+        def compiled():
+            compile_filter.cache_clear()
+            return [compile_filter(text) for text in filters]
+        results[f'compile {len(filters)} filters seconds'] = best_time(
+            compiled)
+        results[f'masks of {len(filters)} filters seconds'] = best_time(
+            lambda: [compile_filter(text)(window) for text in filters])
+        results[f'filter_window, {len(filters)} filters seconds'] = \
+            best_time(lambda: [filter_window(window, text)
+                               for text in filters])
+        return results
+    finally:
+        stand_in.stop()
+
+
+def benchmark_stream_views(count=20_000, latency=0.001):
+    """Compares reading a stream through two stream views in SDS with
+    projecting one window read locally
+    """
+    stand_in = SdsStandIn(latency=latency).start()
+    sds_client = EDSClient('v1', stand_in.uri)
+    source_type = sds_client.Types.getOrCreateType(
+        'default', get_wave_data_type(SAMPLE_TYPE_ID))
+    target_type = sds_client.Types.getOrCreateType(
+        'default', get_wave_data_target_type(SAMPLE_TARGET_TYPE_ID))
+    integer_type = sds_client.Types.getOrCreateType(
+        'default', get_wave_data_integer_type(SAMPLE_INTEGER_TYPE_ID))
+    views = [
+        (SdsStreamView(SAMPLE_STREAM_VIEW_ID, source_type.Id,
+                       target_type.Id), target_type),
+        (SdsStreamView(SAMPLE_STREAM_VIEW_INT_ID, source_type.Id,
+                       integer_type.Id, properties=[
+                           SdsStreamViewProperty('Order', 'OrderTarget'),
+                           SdsStreamViewProperty('Sin', 'SinInt'),
+                           SdsStreamViewProperty('Cos', 'CosInt'),
+                           SdsStreamViewProperty('Tan', 'TanInt')]),
+         integer_type)]
+    for stream_view, _ in views:
+        sds_client.StreamViews.getOrCreateStreamView('default', stream_view)
+    sds_client.Streams.createOrUpdateStream(
+        'default', SdsStream(SAMPLE_STREAM_ID, source_type.Id))
+    waves = next_waves(np.arange(count) % 6400, 2.0)
+    sds_client.Streams.insertValues(
+        'default', SAMPLE_STREAM_ID,
+        WaveBatch(WaveData, {**waves.columns,
+                             'Order': np.arange(count)}).toJson())
+
+    try:
+        results = {'count': count}
+        results[f'SDS, {len(views)} views seconds'] = best_time(
+            lambda: [sds_client.Streams.getRangeValues(
+                'default', SAMPLE_STREAM_ID, None, 0, 0, count, False,
+                SdsBoundaryType.Exact, '', stream_view.Id)
+                for stream_view, _ in views], 3)
+
+        def projected():
+            window = decode_table(
+                get_window_table(sds_client, 'default', SAMPLE_STREAM_ID, 0,
+                                 count - 1), table_dtypes(WaveData))
+            return [ViewProjection.fromStreamView(
+                stream_view, source_type, target).apply(window)
+                for stream_view, target in views]
+        results[f'one window, {len(views)} projections seconds'] = \
+            best_time(projected, 3)
+        window = waves.columns
+        projections = [ViewProjection.fromStreamView(stream_view,
+                                                     source_type, target)
+                       for stream_view, target in views]
+        results[f'apply {len(views)} projections seconds'] = best_time(
+            lambda: [projection.apply(window) for projection in projections])
+        return results
+    finally:
+        stand_in.stop()
+
+
+def benchmark_compound_index(count=20_000, queries=100, latency=0.001):
+    """Compares compound key windows from SDS with a local CompoundIndex"""
+    stand_in = SdsStandIn(latency=latency).start()
+    sds_client = EDSClient('v1', stand_in.uri)
+    sds_client.Types.getOrCreateType(
+        'default', get_wave_compound_data_type(COMPOUND_TYPE_ID))
+    sds_client.Streams.createOrUpdateStream(
+        'default', SdsStream('Compound', COMPOUND_TYPE_ID))
+    orders = np.arange(count)
+    waves = next_waves(orders // 10, orders % 10 + 1)
+    sds_client.Streams.insertValues('default', 'Compound', waves.toJson())
+    generator = np.random.default_rng(0)
+    starts = generator.integers(0, count // 10, queries)
+    windows = [(f'{start}|{multiplier}', f'{start + 10}|{multiplier}')
+               for start, multiplier in zip(starts, starts % 10 + 1)]
+
+    try:
+        results = {'count': count}
+        results[f'SDS, {queries} windows seconds'] = best_time(
+            lambda: [sds_client.Streams.getWindowValues(
+                'default', 'Compound', start, end)
+                for start, end in windows], 3)
+        results['build seconds'] = best_time(lambda: CompoundIndex(waves))
+        index = CompoundIndex(waves)
+        keys = [(index.parseKey(start), index.parseKey(end))
+                for start, end in windows]
+        results[f'{queries} windows seconds'] = best_time(
+            lambda: [index.window(start, end) for start, end in keys])
+
+        def insert_batches():
+            grown = CompoundIndex(waves[:count // 2])
+            for batch in range(count // 2, count, count // 20):
+                grown.insert(waves[batch:batch + count // 20])
+        results['10 inserts of 5% seconds'] = best_time(insert_batches)
+        return results
+    finally:
+        stand_in.stop()
+
+
+def benchmark_secondary_index(count=200_000, queries=100):
+    """Compares lookups by Radians with an index and with a scan"""
+    orders = np.arange(count)
+    waves = next_waves(orders % 6400, 2.0)
+    window = {**waves.columns, 'Order': orders}
+    generator = np.random.default_rng(0)
+    lows = generator.uniform(0, 600, queries)
+    bounds = list(zip(lows, lows + 1))
+    radians = window['Radians']
+
+    results = {'count': count}
+    results[f'scan, {queries} lookups seconds'] = best_time(
+        lambda: [take(window, np.flatnonzero((radians >= low)
+                                             & (radians <= high)))
+                 for low, high in bounds])
+    results['index seconds'] = best_time(
+        lambda: IndexedWindow(window, ['Radians']))
+    indexed = IndexedWindow(window, ['Radians'])
+    results[f'index, {queries} lookups seconds'] = best_time(
+        lambda: [indexed.lookup('Radians', low, high)
+                 for low, high in bounds])
+
+    def insert_batches():
+        grown = IndexedWindow(take(window, slice(0, count // 2)),
+                              ['Radians'])
+        for batch in range(count // 2, count, count // 20):
+            grown.insert(take(window, slice(batch, batch + count // 20)))
+    results['10 inserts of 5% seconds'] = best_time(insert_batches)
+    return results
+
+
+def benchmark_fan_out(count=10, sizes=(1, 10, 100, 1000, 10_000),
+                      latency=0.001):
+    """Measures provisioning and writing to more and more streams, with
+    fan_out and, up to 1000 streams, one stream after the other as main()
+    does
+    """
+    waves = next_waves(np.arange(count), 2.0)
+    events = WaveBatch(WaveData, {**waves.columns, 'Order': np.arange(count)})
+    results = {'count': count}
+    for size in sizes:
+        stream_ids = [f'Wave{number}' for number in range(size)]
+        if size <= 1000:
+            with SdsStandIn(latency=latency) as stand_in:
+                sds_client = EDSClient('v1', stand_in.uri)
+                sds_client.Types.getOrCreateType(
+                    'default', get_wave_data_type(SAMPLE_TYPE_ID))
+                start = time.perf_counter()
+                for stream_id in stream_ids:
+                    sds_client.Streams.createOrUpdateStream(
+                        'default', SdsStream(stream_id, SAMPLE_TYPE_ID))
+                results[f'{size} streams, one by one provision seconds'] = \
+                    time.perf_counter() - start
+                start = time.perf_counter()
+                for stream_id in stream_ids:
+                    sds_client.Streams.insertValues('default', stream_id,
+                                                    events.toJson())
+                results[f'{size} streams, one by one write seconds'] = \
+                    time.perf_counter() - start
+
+        with SdsStandIn(latency=latency) as stand_in:
+            sds_client = EDSClient('v1', stand_in.uri)
+            sds_client.Types.getOrCreateType(
+                'default', get_wave_data_type(SAMPLE_TYPE_ID))
+            summary = fan_out(sds_client, 'default', SAMPLE_TYPE_ID,
+                              dict.fromkeys(stream_ids, events))
+            if summary['failed_streams'] or summary['failed_chunks']:
+                raise RuntimeError('Fan-out benchmark write failed')
+            results[f'{size} streams, fan_out provision seconds'] = \
+                summary['provision_seconds']
+            results[f'{size} streams, fan_out write seconds'] = \
+                summary['write_seconds']
+    return results
+
+
+def benchmark_parallel_waves(count=5_000_000):
+    """Compares next_waves with generate_waves by number of processes,
+    with the processes started beforehand
+    """
+    def generate(processes, executor):
+        waves = generate_waves(0, count, multiplier=2.0, processes=processes,
+                               executor=executor)
+        waves.close()
+        waves.unlink()
+
+    results = {'count': count}
+    results['next_waves seconds'] = best_time(
+        lambda: next_waves(range(count), 2.0), 3)
+    cpus = os.cpu_count() or 1
+    share_tracker()
+    for processes in sorted({1, 2, 4, cpus}):
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            # Start the processes before timing
+            list(executor.map(abs, range(processes)))
+            results[f'generate_waves, {processes} processes seconds'] = \
+                best_time(lambda: generate(processes, executor), 3)
+    return results
+
+
+def benchmark_delta_update(count=100_000, changed=0.01, latency=0.001,
+                           bandwidth=10 << 20):
+    """Compares updating every event with sending only the changed ones,
+    at 10 MB/s
+    """
+    stand_in = SdsStandIn(latency=latency, bandwidth=bandwidth).start()
+    sds_client = EDSClient('v1', stand_in.uri)
+    sds_client.Types.getOrCreateType('default',
+                                     get_wave_data_type(SAMPLE_TYPE_ID))
+    sds_client.Streams.createOrUpdateStream(
+        'default', SdsStream(SAMPLE_STREAM_ID, SAMPLE_TYPE_ID))
+    orders = np.arange(count)
+    waves = WaveBatch(WaveData, {**next_waves(orders % 6400, 2.0).columns,
+                                 'Order': orders})
+    sds_client.Streams.insertValues('default', SAMPLE_STREAM_ID,
+                                    waves.toJson())
+    update = WaveBatch(WaveData, {name: column.copy() for name, column
+                                  in waves.columns.items()})
+    rows = np.random.default_rng(0).choice(count, int(count * changed),
+                                           replace=False)
+    update.columns['Sin'][rows] *= 2
+
+    try:
+        results = {'count': count}
+        results['updateValues, every event seconds'] = best_time(
+            lambda: sds_client.Streams.updateValues(
+                'default', SAMPLE_STREAM_ID, update.toJson()), 3)
+        sds_client.Streams.updateValues('default', SAMPLE_STREAM_ID,
+                                        waves.toJson())
+
+        start = time.perf_counter()
+        DeltaUpdater(sds_client, 'default').update(SAMPLE_STREAM_ID, update)
+        results['delta, reading the window seconds'] = \
+            time.perf_counter() - start
+
+        updater = DeltaUpdater(sds_client, 'default')
+        updater.know(SAMPLE_STREAM_ID, waves)
+
+        def known_update():
+            # Knowing the window again, in the timing, keeps 1% changed
+            updater.update(SAMPLE_STREAM_ID, update)
+            updater.know(SAMPLE_STREAM_ID, waves)
+        results['delta, known window seconds'] = best_time(known_update, 3)
+        return results
+    finally:
+        stand_in.stop()
+
+
+def print_measures(name, results):
+    """Prints times in milliseconds, other measures as they are, then the
+    counters
+    """
+    print(f'{name} ({results["count"]} events)')
+    for case, value in results.items():
+        if case.endswith('seconds'):
+            print(f'  {case:<45} {value * 1000:10.2f} ms')
+        elif case not in ('count', COUNTERS):
+            print(f'  {case:<45} {value:10.1f}')
+    for counter, value in results.get(COUNTERS, {}).items():
+        print(f'  {counter:<45} {value:10}')
+
+
+def print_memory(name, results):
+    """Prints one memory benchmark's bytes per event"""
+    print(f'{name} ({results["count"]} events)')
+    for case, size in results.items():
+        if case != 'count':
+            print(f'  {case:<45} {size:10.1f} bytes/event')
+
+
+def print_results(name, results):
+    """Prints one benchmark's timings as events per second"""
+    count = results['count']
+    print(f'{name} ({count} events)')
+    for case, seconds in results.items():
+        if case != 'count':
+            print(f'  {case:<45} {seconds * 1000:10.2f} ms '
+                  f'{count / seconds:14,.0f} events/s')
+
+
+def print_scaling(name, results):
+    """Prints the streams or events per second at each number of streams"""
+    count = results['count']
+    print(f'{name} ({count} events per stream)')
+    for case, seconds in results.items():
+        if case == 'count':
+            continue
+        streams = int(case.split()[0])
+        if 'provision' in case:
+            rate = f'{streams / seconds:14,.0f} streams/s'
+        else:
+            rate = f'{streams * count / seconds:14,.0f} events/s'
+        print(f'  {case:<45} {seconds * 1000:10.2f} ms {rate}')
+
+
+def print_steps(name, results):
+    """Prints the seconds of each step of main()"""
+    print(f'{name} (best of {results["runs"]} runs)')
+    for case, seconds in results.items():
+        if case != 'runs':
+            print(f'  {case:<45} {seconds * 1000:10.2f} ms')
+
+
+# Benchmarks by name: (title, benchmark, printer)
+BENCHMARKS = {
+    'next_wave': ('Wave generation', benchmark_next_wave, print_results),
+    'window': ('Window decode and encode', benchmark_window, print_results),
+    'codec': ('Per-event codec', benchmark_codec, print_results),
+    'json_backends': ('JSON backends', benchmark_json_backends,
+                      print_results),
+    'memory': ('Memory', benchmark_memory, print_memory),
+    'streaming': ('Peak memory of a write payload', benchmark_streaming,
+                  print_memory),
+    'bulk_write': ('Bulk insert, 5 ms latency', benchmark_bulk_write,
+                   print_results),
+    'paging': ('Window reads, whole and paged', benchmark_paging,
+               print_measures),
+    'table': ('Window decode from the tableh form', benchmark_table,
+              print_measures),
+    'interpolation': ('Calculated indexes, 1 ms latency',
+                      benchmark_interpolation, print_measures),
+    'sampling': ('Sampled values, 1 ms latency', benchmark_sampling,
+                 print_measures),
+    'window_cache': ('Overlapping window reads, 1 ms latency',
+                     benchmark_window_cache, print_measures),
+    'metadata': ('Setup calls of a worker, 5 ms latency', benchmark_metadata,
+                 print_steps),
+    'filter': ('Filtered windows, 1 ms latency', benchmark_filter,
+               print_measures),
+    'stream_views': ('Stream view reads, 1 ms latency',
+                     benchmark_stream_views, print_measures),
+    'compound_index': ('Compound key windows, 1 ms latency',
+                       benchmark_compound_index, print_measures),
+    'secondary_index': ('Lookups by a secondary index',
+                        benchmark_secondary_index, print_measures),
+    'fan_out': ('Streams provisioned and written, 1 ms latency',
+                benchmark_fan_out, print_scaling),
+    'parallel_waves': ('Wave generation across processes',
+                       benchmark_parallel_waves, print_results),
+    'delta_update': ('Updates of 1% of the events, 1 ms latency',
+                     benchmark_delta_update, print_measures),
+    'main': ('Steps of main(), 1 ms latency', benchmark_main, print_steps),
+}
+
+# Result keys that describe a benchmark rather than measure it
+SETTINGS = ('count', 'runs')
+
+# Result key of the counters of a run, such as cache hits, which are
+# reported but not compared: more of them is not worse
+COUNTERS = 'counters'
+
+
+def run_benchmarks(names=None):
+    """Runs and prints benchmarks, returning a JSON-ready report"""
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'benchmarks': {},
+    }
+    for name in names or BENCHMARKS:
+        title, benchmark, printer = BENCHMARKS[name]
+        results = benchmark()
+        printer(title, results)
+        report['benchmarks'][name] = results
+    return report
+
+
+def compare(report, baseline, threshold=0.1):
+    """Compares two reports case by case
+
+    Every measure is a time or a size, so larger is worse; the counters
+    of a benchmark, under COUNTERS, and values that are not numbers are
+    not measures and are skipped. Returns (benchmark, case, baseline,
+    current, ratio) for each case in both reports, and the ones more than
+    threshold worse than the baseline
+    """
+    changes = []
+    for name, results in report['benchmarks'].items():
+        previous = baseline['benchmarks'].get(name, {})
+        if any(results.get(key) != previous.get(key) for key in SETTINGS):
+            continue
+        for case, value in results.items():
+            if (case in SETTINGS or case == COUNTERS
+                    or not isinstance(value, (int, float))
+                    or not isinstance(previous.get(case), (int, float))
+                    or not previous[case]):
+                continue
+            changes.append((name, case, previous[case], value,
+                            value / previous[case]))
+    regressions = [change for change in changes
+                   if change[4] > 1 + threshold]
+    return changes, regressions
+
+
+def print_comparison(changes, regressions):
+    """Prints the change of every case and lists the regressions"""
+    print('Comparison with the baseline')
+    for name, case, _, _, ratio in changes:
+        print(f'  {name + ": " + case:<55} {(ratio - 1) * 100:+8.1f}%')
+    for name, case, _, _, ratio in regressions:
+        print(f'Regression: {name}: {case} is {ratio:.2f}x the baseline')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help=f'benchmarks to run: {", ".join(BENCHMARKS)}; '
+                        'all by default')
+    parser.add_argument('--output', help='write the results to a JSON file')
+    parser.add_argument('--compare', help='compare with a JSON results file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown reported as a regression (0.1 = 10%%)')
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name}')
+
+    report = run_benchmarks(args.names)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            changes, regressions = compare(report, json.load(f),
+                                           args.threshold)
+        print_comparison(changes, regressions)
+        if regressions:
+            sys.exit(1)
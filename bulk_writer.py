@@ -0,0 +1,125 @@
+"""Parallel chunked bulk writes of wave events into SDS streams"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from wave_data import iter_json_rows
+
+
+class ChunkResult:
+    """The outcome of writing one chunk of events to a stream"""
+
+    def __init__(self, stream_id, index, events, size):
+        self.stream_id = stream_id
+        self.index = index
+        self.events = events
+        self.bytes = size
+        self.seconds = 0.0
+        self.error = None
+
+    @property
+    def success(self):
+        """Whether the chunk was written"""
+        return self.error is None
+
+    def __repr__(self):
+        outcome = 'ok' if self.success else f'failed: {self.error}'
+        return (f'ChunkResult({self.stream_id} #{self.index}, '
+                f'{self.events} events, {self.bytes} bytes, {outcome})')
+
+
+def chunk_payloads(events, max_events=1000, max_bytes=4 * 1024 * 1024):
+    """Splits events into SDS JSON array payloads bounded by count and size
+
+    Yields (event count, payload) pairs. An event that alone exceeds
+    max_bytes is still sent, in a payload of its own
+    """
+    rows = []
+    size = 2
+    for row in iter_json_rows(events, max_events):
+        row_size = len(row) + (2 if rows else 0)
+        if rows and (len(rows) == max_events or size + row_size > max_bytes):
+            yield len(rows), '[' + ', '.join(rows) + ']'
+            rows = []
+            size = 2
+            row_size = len(row)
+        rows.append(row)
+        size += row_size
+    if rows:
+        yield len(rows), '[' + ', '.join(rows) + ']'
+
+
+def bulk_write(sds_client, namespace_id, streams, operation='insertValues',
+               max_events=1000, max_bytes=4 * 1024 * 1024, concurrency=8,
+               ordered=True):
+    """Writes events to streams in size-bounded chunks across a thread pool
+
+    streams maps each stream id to its events: a WaveBatch or an iterable of
+    wave events. operation names the SdsClient Streams call used for every
+    chunk: insertValues, updateValues or replaceValues. With ordered, the
+    chunks of a stream are written one after the other, in order, and the
+    rest of a stream is skipped once one of its chunks fails; streams are
+    still written in parallel. Otherwise every chunk is written as soon as a
+    worker is free. Returns a ChunkResult for each chunk
+    """
+    write = getattr(sds_client.Streams, operation)
+    results = {stream_id: [] for stream_id in streams}
+
+    def send(result, payload):
+        start = time.perf_counter()
+        try:
+            write(namespace_id, result.stream_id, payload)
+        except Exception as error:
+            result.error = error
+        result.seconds = time.perf_counter() - start
+        return result
+
+    def chunks(stream_id, events):
+        for index, (count, payload) in enumerate(
+                chunk_payloads(events, max_events, max_bytes)):
+            result = ChunkResult(stream_id, index, count, len(payload))
+            results[stream_id].append(result)
+            yield result, payload
+
+    def send_in_order(stream_id, events):
+        failed = None
+        for result, payload in chunks(stream_id, events):
+            if failed is not None:
+                result.error = f'Skipped after chunk {failed} failed'
+            elif not send(result, payload).success:
+                failed = result.index
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+        if ordered:
+            for stream_id, events in streams.items():
+                pending.add(executor.submit(send_in_order, stream_id, events))
+        else:
+            for stream_id, events in streams.items():
+                for result, payload in chunks(stream_id, events):
+                    # Bound the encoded payloads waiting for a worker
+                    if len(pending) >= 2 * concurrency:
+                        _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    pending.add(executor.submit(send, result, payload))
+        wait(pending)
+        for future in pending:
+            future.result()
+
+    return [result for stream_results in results.values()
+            for result in stream_results]
+
+
+def summarize(results, seconds=None):
+    """Aggregates ChunkResults into counts of events, bytes and failures"""
+    summary = {
+        'chunks': len(results),
+        'failed_chunks': sum(not result.success for result in results),
+        'events': sum(result.events for result in results if result.success),
+        'failed_events': sum(result.events for result in results
+                             if not result.success),
+        'bytes': sum(result.bytes for result in results if result.success),
+    }
+    if seconds:
+        summary['events_per_second'] = summary['events'] / seconds
+        summary['bytes_per_second'] = summary['bytes'] / seconds
+    return summary
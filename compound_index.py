@@ -0,0 +1,178 @@
+"""Local sorted index of columnar events with a compound key
+
+A CompoundIndex keeps the events of a stream sorted by their key
+properties, like Order and Multiplier in the compound type of the sample.
+The key columns are held together as one NumPy structured array, whose
+items compare lexicographically, so a window such as '2|1' to '10|8' is
+found with two binary searches and returned as column slices, without
+Python objects per event. Keys are typed tuples rather than '|' separated
+strings, and events can be inserted after the index is built
+"""
+
+import collections
+
+import numpy as np
+
+from interpolation import as_columns, take
+
+COMPOUND_KEYS = ('Order', 'Multiplier')
+
+
+def key_names(sds_type):
+    """Returns the key properties of an SdsType, in key order"""
+    keys = [(prop.Order or 0, position, prop.Id)
+            for position, prop in enumerate(sds_type.Properties)
+            if prop.IsKey]
+    return tuple(prop_id for _, _, prop_id in sorted(keys))
+
+
+class CompoundIndex:
+    """The events of a window, sorted by a compound key
+
+    names lists the key properties, most significant first. Use Key to
+    build typed keys, for example index.Key(Order=2, Multiplier=1), and
+    parseKey and formatKey to convert them from and to SDS index strings
+    """
+
+    def __init__(self, window, names=COMPOUND_KEYS):
+        columns, _ = as_columns(window)
+        self.names = tuple(names)
+        self.Key = collections.namedtuple('Key', self.names)
+        self.key_dtype = np.dtype([(name, columns[name].dtype)
+                                   for name in self.names])
+        keys = self.key_array(columns)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.columns = take(columns, order)
+        self.check_unique(self.keys)
+
+    @classmethod
+    def fromSdsType(cls, sds_type, window):
+        """Creates the index of a window, keyed as an SdsType"""
+        return cls(window, key_names(sds_type))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def key_array(self, columns):
+        """Packs the key columns of a window into a structured array"""
+        keys = np.empty(len(columns[self.names[0]]), dtype=self.key_dtype)
+        for name in self.names:
+            keys[name] = columns[name]
+        return keys
+
+    def as_key(self, key):
+        """Converts a Key, tuple, dict or index string to a typed key"""
+        if isinstance(key, str):
+            key = self.parseKey(key)
+        elif isinstance(key, dict):
+            key = tuple(key[name] for name in self.names)
+        elif not isinstance(key, tuple):
+            key = (key,)
+        if len(key) != len(self.names):
+            raise ValueError(f'Key {key} does not match {self.names}')
+        return np.array(tuple(key), dtype=self.key_dtype)
+
+    def parseKey(self, text):
+        """Parses an SDS index string such as '2|1' into a Key"""
+        parts = str(text).split('|')
+        if len(parts) != len(self.names):
+            raise ValueError(f'Index {text} does not match {self.names}')
+        return self.Key(*(self.key_dtype[name].type(part).item()
+                          for part, name in zip(parts, self.names)))
+
+    def formatKey(self, key):
+        """Formats a key as an SDS index string, for SDS calls"""
+        key = self.as_key(key)
+        return '|'.join(str(key[name]) for name in self.names)
+
+    def keyAt(self, position):
+        """Returns the Key of the event at position"""
+        return self.Key(*self.keys[position].tolist())
+
+    @staticmethod
+    def check_unique(keys):
+        """Raises ValueError if sorted keys repeat, as SDS rejects them"""
+        repeated = np.flatnonzero(keys[1:] == keys[:-1])
+        if len(repeated):
+            raise ValueError(f'Duplicate key {keys[repeated[0]]}')
+
+    def find(self, key):
+        """Returns the position of the event at key, or None"""
+        key = self.as_key(key)
+        position = int(np.searchsorted(self.keys, key, 'left'))
+        if position < len(self.keys) and self.keys[position] == key:
+            return position
+        return None
+
+    def bounds(self, start, end):
+        """Returns the positions of the events from start to end"""
+        low = np.searchsorted(self.keys, self.as_key(start), 'left')
+        high = np.searchsorted(self.keys, self.as_key(end), 'right')
+        return int(low), max(int(low), int(high))
+
+    def window(self, start, end):
+        """Returns the events from start to end, as getWindowValues does
+        with Exact boundaries, as a dict of column views
+        """
+        low, high = self.bounds(start, end)
+        return take(self.columns, slice(low, high))
+
+    def range(self, start, count, skip=0, reverse=False):
+        """Returns count events from start, as getRangeValues does with
+        Exact boundaries
+        """
+        key = self.as_key(start)
+        if reverse:
+            stop = int(np.searchsorted(self.keys, key, 'right')) - skip
+            return take(self.columns,
+                        np.arange(stop - 1, max(stop - count, 0) - 1, -1))
+        position = int(np.searchsorted(self.keys, key, 'left')) + skip
+        return take(self.columns, slice(position, position + count))
+
+    def insert(self, window, replace=False):
+        """Adds the events of a window to the index
+
+        An event whose key is already indexed raises ValueError, as
+        insertValues does, unless replace overwrites it, as updateValues
+        does. Returns the number of new events
+        """
+        inserted, _ = self.merge(window, replace)
+        return len(inserted)
+
+    def merge(self, window, replace=False):
+        """Adds the events of a window as insert does
+
+        Returns the positions before which the new events went, as passed
+        to np.insert, and the positions of the overwritten events, both
+        counted before the merge
+        """
+        columns, _ = as_columns(window)
+        keys = self.key_array(columns)
+        order = np.argsort(keys, kind='stable')
+        keys, columns = keys[order], take(columns, order)
+        self.check_unique(keys)
+
+        positions = np.searchsorted(self.keys, keys, 'left')
+        inside = positions < len(self.keys)
+        existing = np.zeros(len(keys), dtype=bool)
+        existing[inside] = self.keys[positions[inside]] == keys[inside]
+        replaced = positions[existing]
+        if existing.any():
+            if not replace:
+                raise ValueError(
+                    f'Duplicate key {keys[np.argmax(existing)]}')
+            # Replace in copies, so windows returned before keep their values
+            self.columns = {name: column.copy()
+                            for name, column in self.columns.items()}
+            for name, column in self.columns.items():
+                column[replaced] = columns[name][existing]
+
+        added = ~existing
+        inserted = positions[added]
+        self.keys = np.insert(self.keys, inserted, keys[added])
+        self.columns = {
+            name: np.insert(column, inserted,
+                            columns[name][added].astype(column.dtype))
+            for name, column in self.columns.items()}
+        return inserted, replaced
@@ -0,0 +1,189 @@
+"""Updates that send only the events that differ from what SDS holds
+
+A DeltaUpdater keeps, for each stream, the events it knows SDS holds: a
+window given to know, such as one read through a WindowCache, the events
+it read itself, and the events it sent. update compares a batch against
+them column by column with NumPy and sends only the events that are new or
+differ in any property, then reports how many events and bytes it skipped.
+Index ranges the updater does not know yet are read once, in the tableh
+form, before comparing
+"""
+
+import threading
+
+import numpy as np
+
+from compound_index import CompoundIndex
+from interpolation import as_columns, take
+from secondary_index import same
+from table_form import decode_table, get_window_table, table_dtypes
+from wave_data import WaveBatch
+
+# What update returns, and the counters of the updater
+RESULTS = ('events', 'sent', 'skipped', 'bytes', 'skipped_bytes')
+COUNTERS = RESULTS + ('reads',)
+
+# Most skipped events encoded to estimate the bytes they would have taken
+SAMPLE_EVENTS = 1000
+
+
+class DeltaUpdater:
+    """Sends the changed events of updates to the streams of a namespace
+
+    operation names the SdsClient Streams call used: updateValues, or
+    replaceValues when every event is known to exist. names lists the key
+    properties of the streams, the first column by default. Events changed
+    in SDS by other writers are only seen after forget
+    """
+
+    def __init__(self, sds_client, namespace_id, operation='updateValues',
+                 names=None):
+        self.sds_client = sds_client
+        self.namespace_id = namespace_id
+        self.operation = operation
+        self.names = names
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
+        self.__lock = threading.Lock()
+        self.__known = {}
+        self.__ranges = {}
+
+    def stats(self):
+        """Returns the counters of every update so far"""
+        with self.__lock:
+            return {counter: getattr(self, counter) for counter in COUNTERS}
+
+    def know(self, stream_id, window, low=None, high=None):
+        """Records that SDS holds the events of window for a stream
+
+        low and high are the keys the window covers, its first and last by
+        default; the updater reads no index between them
+        """
+        columns, index = as_columns(window)
+        index = CompoundIndex(columns, self.names or (index,))
+        known = self.__known.get(stream_id)
+        if known is None:
+            self.__known[stream_id] = known = index
+        else:
+            known.insert(columns, replace=True)
+        if len(index) or low is not None and high is not None:
+            self.cover(stream_id,
+                       tuple(index.keyAt(0)) if low is None
+                       else tuple(index.as_key(low).tolist()),
+                       tuple(index.keyAt(-1)) if high is None
+                       else tuple(index.as_key(high).tolist()))
+
+    def forget(self, stream_id):
+        """Drops what is known of a stream"""
+        self.__known.pop(stream_id, None)
+        self.__ranges.pop(stream_id, None)
+
+    def cover(self, stream_id, low, high):
+        """Adds low to high to the known ranges of a stream, merging the
+        ones it overlaps
+        """
+        ranges = []
+        for start, end in self.__ranges.get(stream_id, []):
+            if end < low or start > high:
+                ranges.append((start, end))
+            else:
+                low, high = min(low, start), max(high, end)
+        ranges.append((low, high))
+        self.__ranges[stream_id] = sorted(ranges)
+
+    def covers(self, stream_id, low, high):
+        """Tells whether low to high is inside a known range of a stream"""
+        return any(start <= low and high <= end
+                   for start, end in self.__ranges.get(stream_id, []))
+
+    def read(self, stream_id, outgoing, wave_class):
+        """Reads the events of a stream from the first to the last key of
+        outgoing, and knows them
+        """
+        content = get_window_table(
+            self.sds_client, self.namespace_id, stream_id,
+            outgoing.formatKey(outgoing.keyAt(0)),
+            outgoing.formatKey(outgoing.keyAt(-1)))
+        columns = decode_table(content, table_dtypes(wave_class))
+        with self.__lock:
+            self.reads += 1
+        # Compare only the properties both the stream and the batch have
+        known = self.__known.get(stream_id)
+        names = list(known.columns) if known is not None \
+            else [name for name in outgoing.columns if name in columns]
+        self.know(stream_id, {name: columns[name] for name in names},
+                  outgoing.keyAt(0), outgoing.keyAt(-1))
+
+    def changed(self, stream_id, outgoing):
+        """Returns the mask of the events of outgoing that SDS does not
+        hold with the same values, comparing the properties known of the
+        stream
+        """
+        known = self.__known.get(stream_id)
+        if known is None or not len(known):
+            return np.ones(len(outgoing), dtype=bool)
+        positions = np.searchsorted(known.keys, outgoing.keys, 'left')
+        found = positions < len(known)
+        found[found] = known.keys[positions[found]] == outgoing.keys[found]
+        changed = ~found
+        positions = positions[found]
+        # Properties the stream does not hold, such as the Multiplier of
+        # WaveDataCompound events sent to a WaveData stream, are ignored
+        for name, column in known.columns.items():
+            if name not in outgoing.columns:
+                continue
+            changed[found] |= ~same(outgoing.columns[name][found],
+                                    column[positions])
+        return changed
+
+    def update(self, stream_id, values):
+        """Sends the events of values that are new or changed
+
+        values is a WaveBatch or a list of waves. Returns the number of
+        events, of events sent and skipped, and of bytes sent and skipped.
+        Skipped bytes are estimated from up to SAMPLE_EVENTS of the skipped
+        events, evenly spaced, so that they are not all encoded
+        """
+        result = dict.fromkeys(RESULTS, 0)
+        if not hasattr(values, 'columns'):
+            values = list(values)
+            if not values:
+                return result
+            values = WaveBatch.fromWaves(values, type(values[0]))
+        if not len(values):
+            return result
+        outgoing = CompoundIndex(values.columns,
+                                 self.names or (next(iter(values.columns)),))
+        if not self.covers(stream_id, tuple(outgoing.keyAt(0)),
+                           tuple(outgoing.keyAt(-1))):
+            self.read(stream_id, outgoing, values.wave_class)
+
+        changed = self.changed(stream_id, outgoing)
+        sent = int(changed.sum())
+        if sent:
+            payload = WaveBatch(values.wave_class,
+                                take(outgoing.columns, changed)).toJson()
+            getattr(self.sds_client.Streams, self.operation)(
+                self.namespace_id, stream_id, payload)
+            known = self.__known[stream_id]
+            known.insert({name: outgoing.columns[name][changed]
+                          for name in known.columns}, replace=True)
+            result['bytes'] = len(payload)
+
+        skipped = np.flatnonzero(~changed)
+        if len(skipped):
+            sample = skipped[np.linspace(
+                0, len(skipped) - 1,
+                min(len(skipped), SAMPLE_EVENTS)).astype(int)]
+            encoded = WaveBatch(values.wave_class,
+                                take(outgoing.columns, sample)).toJson()
+            # Each event takes its bytes and a separator
+            result['skipped_bytes'] = round(
+                len(skipped) * (len(encoded) - 1) / len(sample))
+        result['events'] = len(outgoing)
+        result['sent'] = sent
+        result['skipped'] = len(skipped)
+        with self.__lock:
+            for counter, value in result.items():
+                setattr(self, counter, getattr(self, counter) + value)
+        return result
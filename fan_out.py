@@ -0,0 +1,197 @@
+"""Provisioning of many streams of one type, and fan-out writes to them
+
+provision_streams lists the streams of a namespace once, then creates the
+missing ones across a thread pool, so streams that exist cost no request.
+A FanOutWriter buffers the events written to any number of streams and
+sends them together with bulk_write, in size-bounded chunks and in
+parallel across streams. fan_out does both and reports the rates
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from adh_sample_library_preview import SdsStream
+
+from bulk_writer import bulk_write, summarize
+from wave_data import WaveBatch, is_batch
+
+
+class StreamResult:
+    """The outcome of provisioning one stream"""
+
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+        self.created = False
+        self.seconds = 0.0
+        self.error = None
+
+    @property
+    def success(self):
+        """Whether the stream exists with the expected type"""
+        return self.error is None
+
+    def __repr__(self):
+        if not self.success:
+            outcome = f'failed: {self.error}'
+        else:
+            outcome = 'created' if self.created else 'existing'
+        return f'StreamResult({self.stream_id}, {outcome})'
+
+
+def existing_streams(sds_client, namespace_id, query='', page_size=1000):
+    """Returns the type id of each stream of a namespace, keyed by stream
+    id, reading the streams in pages
+    """
+    streams = {}
+    skip = 0
+    while True:
+        page = sds_client.Streams.getStreams(namespace_id, query, skip,
+                                             page_size)
+        for stream in page:
+            streams[stream.Id] = stream.TypeId
+        if len(page) < page_size:
+            return streams
+        skip += page_size
+
+
+def provision_streams(sds_client, namespace_id, type_id, stream_ids,
+                      concurrency=16, skip_existing=True, query=''):
+    """Creates streams of type_id across a thread pool
+
+    With skip_existing, the streams of the namespace, or those matching
+    query, are listed first and only the missing ones are created; a
+    stream that exists with another type fails. Returns a StreamResult
+    for each stream, in the order of stream_ids
+    """
+    stream_ids = list(stream_ids)
+    results = {stream_id: StreamResult(stream_id) for stream_id in stream_ids}
+    existing = existing_streams(sds_client, namespace_id, query) \
+        if skip_existing else {}
+
+    def create(result):
+        start = time.perf_counter()
+        try:
+            stream = sds_client.Streams.getOrCreateStream(
+                namespace_id, SdsStream(result.stream_id, type_id))
+            if stream.TypeId == type_id:
+                result.created = True
+            else:
+                result.error = f'Stream exists with type {stream.TypeId}'
+        except Exception as error:
+            result.error = error
+        result.seconds = time.perf_counter() - start
+        return result
+
+    missing = []
+    for stream_id, result in results.items():
+        if stream_id not in existing:
+            missing.append(result)
+        elif existing[stream_id] != type_id:
+            result.error = f'Stream exists with type {existing[stream_id]}'
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in executor.map(create, missing):
+            pass
+    return list(results.values())
+
+
+def summarize_streams(results, seconds=None):
+    """Aggregates StreamResults into counts of created, existing and
+    failed streams
+    """
+    summary = {
+        'streams': len(results),
+        'created': sum(result.created and result.success
+                       for result in results),
+        'existing': sum(not result.created and result.success
+                        for result in results),
+        'failed_streams': sum(not result.success for result in results),
+    }
+    if seconds:
+        summary['streams_per_second'] = summary['streams'] / seconds
+    return summary
+
+
+class FanOutWriter:
+    """Routes events to many streams through shared, batched bulk writes
+
+    Events written to each stream are buffered; once buffer_events are
+    held across all streams, or on flush, every buffered stream is sent
+    with one bulk_write, whose chunks go out in parallel across streams.
+    results holds a ChunkResult for each chunk sent
+    """
+
+    def __init__(self, sds_client, namespace_id, operation='insertValues',
+                 max_events=1000, max_bytes=4 * 1024 * 1024, concurrency=8,
+                 buffer_events=None):
+        self.sds_client = sds_client
+        self.namespace_id = namespace_id
+        self.operation = operation
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        self.buffer_events = buffer_events or 4 * concurrency * max_events
+        self.results = []
+        self.__buffers = {}
+        self.__buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def write(self, stream_id, events):
+        """Buffers events for a stream: a WaveBatch or a list of waves"""
+        if not is_batch(events):
+            events = list(events)
+        self.__buffers.setdefault(stream_id, []).append(events)
+        self.__buffered += len(events)
+        if self.__buffered >= self.buffer_events:
+            self.flush()
+
+    def flush(self):
+        """Sends every buffered event, returning the new ChunkResults"""
+        if not self.__buffers:
+            return []
+        streams = {}
+        for stream_id, parts in self.__buffers.items():
+            if all(is_batch(part) for part in parts):
+                streams[stream_id] = WaveBatch.concatenate(parts)
+            else:
+                streams[stream_id] = [event for part in parts
+                                      for event in part]
+        self.__buffers = {}
+        self.__buffered = 0
+        results = bulk_write(self.sds_client, self.namespace_id, streams,
+                             self.operation, self.max_events, self.max_bytes,
+                             self.concurrency)
+        self.results.extend(results)
+        return results
+
+
+def fan_out(sds_client, namespace_id, type_id, streams, concurrency=16,
+            max_events=1000):
+    """Provisions the streams of type_id in streams, then writes to each
+    the events it maps to through a FanOutWriter
+
+    Streams that fail to provision are not written to. Returns the
+    summary of the streams and of the chunks, with their rates
+    """
+    start = time.perf_counter()
+    provisioned = provision_streams(sds_client, namespace_id, type_id,
+                                    streams, concurrency)
+    provision_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with FanOutWriter(sds_client, namespace_id, max_events=max_events,
+                      concurrency=concurrency) as writer:
+        for result in provisioned:
+            if result.success:
+                writer.write(result.stream_id, streams[result.stream_id])
+    write_seconds = time.perf_counter() - start
+
+    summary = summarize_streams(provisioned, provision_seconds)
+    summary.update(summarize(writer.results, write_seconds))
+    summary['provision_seconds'] = provision_seconds
+    summary['write_seconds'] = write_seconds
+    return summary
@@ -0,0 +1,239 @@
+"""Compilation of SDS filter expressions into NumPy masks
+
+compile_filter turns an expression such as 'Radians lt 3' into a function
+of a columnar window, a WaveBatch or a dict of NumPy columns keyed by SDS
+property name, that returns a boolean mask of the events it keeps. Compiled
+expressions are cached by their text, so filtering a window again costs
+only the array operations
+"""
+
+import functools
+import operator
+import re
+
+import numpy as np
+
+from interpolation import as_columns, take
+
+TOKEN = re.compile(r"\s*(?:(\()|(\))|'((?:[^']|'')*)'|"
+                   r"([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)|"
+                   r"([A-Za-z_][\w.]*))")
+
+COMPARISONS = {
+    'eq': operator.eq, 'ne': operator.ne, 'lt': operator.lt,
+    'le': operator.le, 'gt': operator.gt, 'ge': operator.ge,
+}
+
+ADDITIONS = {'add': operator.add, 'sub': operator.sub}
+
+MULTIPLICATIONS = {'mul': operator.mul, 'div': operator.truediv,
+                   'mod': np.fmod}
+
+LITERALS = {'true': True, 'false': False, 'null': None}
+
+
+def tokenize(text):
+    """Splits a filter into (kind, value) tokens"""
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise ValueError(f'Invalid filter at {position}: {text}')
+        position = match.end()
+        if match.group(1) or match.group(2):
+            tokens.append(('symbol', match.group(1) or match.group(2)))
+        elif match.group(3) is not None:
+            tokens.append(('value', match.group(3).replace("''", "'")))
+        elif match.group(4):
+            number = match.group(4)
+            tokens.append(('value', float(number)
+                           if any(c in number for c in '.eE')
+                           else int(number)))
+        else:
+            tokens.append(('word', match.group(5)))
+    return tokens
+
+
+def column(columns, name):
+    """Returns a column by property name, ignoring case as SDS does"""
+    if name in columns:
+        return columns[name]
+    for key, values in columns.items():
+        if key.lower() == name.lower():
+            return values
+    raise ValueError(f'Unknown property in filter: {name}')
+
+
+def compare(function, left, right, size):
+    """Compares two operands, either of which is null or an array"""
+    if left is None or right is None:
+        other = right if left is None else left
+        if other is None:
+            missing = np.ones(size, dtype=bool)
+        elif isinstance(other, np.ndarray) and other.dtype.kind == 'f':
+            missing = np.isnan(other)
+        elif isinstance(other, np.ndarray) and other.dtype == object:
+            missing = np.array([value is None for value in other], dtype=bool)
+        else:
+            missing = np.zeros(size, dtype=bool)
+        if function is operator.eq:
+            return missing
+        if function is operator.ne:
+            return ~missing
+        return np.zeros(size, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        result = function(left, right)
+    return np.broadcast_to(np.asarray(result, dtype=bool), (size,))
+
+
+class FilterCompiler:
+    """Parses a filter into nested functions of the window columns
+
+    Conditions return a mask; operands return an array or a scalar
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.position = 0
+
+    def compile(self):
+        """Returns the mask function of the whole filter"""
+        condition = self.parse_or()
+        if self.position != len(self.tokens):
+            self.fail()
+        return condition
+
+    def fail(self):
+        raise ValueError(f'Invalid filter: {self.text}')
+
+    def peek_word(self, words):
+        if self.position < len(self.tokens):
+            kind, value = self.tokens[self.position]
+            if kind == 'word' and value.lower() in words:
+                self.position += 1
+                return value.lower()
+        return None
+
+    def next_token(self):
+        if self.position >= len(self.tokens):
+            self.fail()
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse_or(self):
+        condition = self.parse_and()
+        while self.peek_word(('or',)):
+            left, right = condition, self.parse_and()
+            condition = (lambda columns, size, l=left, r=right:
+                         l(columns, size) | r(columns, size))
+        return condition
+
+    def parse_and(self):
+        condition = self.parse_not()
+        while self.peek_word(('and',)):
+            left, right = condition, self.parse_not()
+            condition = (lambda columns, size, l=left, r=right:
+                         l(columns, size) & r(columns, size))
+        return condition
+
+    def parse_not(self):
+        if self.peek_word(('not',)):
+            inner = self.parse_not()
+            return lambda columns, size: ~inner(columns, size)
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        start = self.position
+        if self.tokens[start:start + 1] == [('symbol', '(')]:
+            # A parenthesized condition, or else an operand such as
+            # (Radians add 1)
+            self.position += 1
+            try:
+                condition = self.parse_or()
+                if self.next_token() == ('symbol', ')'):
+                    return condition
+            except ValueError:
+                pass
+            self.position = start
+        left = self.parse_sum()
+        name = self.peek_word(COMPARISONS)
+        if name is None:
+            self.fail()
+        right = self.parse_sum()
+        function = COMPARISONS[name]
+        return (lambda columns, size:
+                compare(function, left(columns), right(columns), size))
+
+    def parse_sum(self):
+        operand = self.parse_product()
+        while True:
+            name = self.peek_word(ADDITIONS)
+            if name is None:
+                return operand
+            operand = self.arithmetic(ADDITIONS[name], operand,
+                                      self.parse_product())
+
+    def parse_product(self):
+        operand = self.parse_operand()
+        while True:
+            name = self.peek_word(MULTIPLICATIONS)
+            if name is None:
+                return operand
+            operand = self.arithmetic(MULTIPLICATIONS[name], operand,
+                                      self.parse_operand())
+
+    @staticmethod
+    def arithmetic(function, left, right):
+        def evaluate(columns):
+            a, b = left(columns), right(columns)
+            if a is None or b is None:
+                return None
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return function(a, b)
+        return evaluate
+
+    def parse_operand(self):
+        kind, value = self.next_token()
+        if (kind, value) == ('symbol', '('):
+            operand = self.parse_sum()
+            if self.next_token() != ('symbol', ')'):
+                self.fail()
+            return operand
+        if kind == 'value':
+            return lambda columns: value
+        if kind != 'word':
+            self.fail()
+        if value.lower() in LITERALS:
+            literal = LITERALS[value.lower()]
+            return lambda columns: literal
+        return lambda columns: column(columns, value)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_filter(text):
+    """Compiles a filter into a function that returns the mask of a window
+
+    The function takes a WaveBatch or a dict of columns. Comparisons with
+    null match NaN in float columns and None in object columns, and other
+    comparisons with them are false, as in SDS
+    """
+    condition = FilterCompiler(text).compile()
+
+    def mask(window):
+        columns, _ = as_columns(window)
+        size = len(next(iter(columns.values()))) if columns else 0
+        return condition(columns, size)
+    mask.text = text
+    return mask
+
+
+def filter_window(window, text):
+    """Returns the rows of a window that a filter keeps, as a dict of
+    columns
+    """
+    columns, _ = as_columns(window)
+    return take(columns, compile_filter(text)(columns))
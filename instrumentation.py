@@ -0,0 +1,289 @@
+"""Per-step and per-operation timing of the SDS calls made by the sample"""
+
+import contextlib
+import contextvars
+import json
+import threading
+import time
+
+# The operation record of the SDS call running in the current context
+CURRENT_OPERATION = contextvars.ContextVar('CURRENT_OPERATION', default=None)
+
+# SDS calls whose third argument is the events they write
+WRITES = {'insertValues', 'updateValues', 'replaceValues'}
+
+METRICS = {
+    'calls': 'SDS client calls',
+    'errors': 'SDS client calls that raised an error',
+    'seconds': 'Wall time in seconds',
+    'requests': 'HTTP requests sent',
+    'request_bytes': 'HTTP request body bytes sent',
+    'response_bytes': 'HTTP response body bytes received',
+    'events_sent': 'Events written',
+    'events_received': 'Events read',
+}
+
+
+# Metrics also recorded per step; a step's seconds are its own wall time
+STEP_METRICS = ('requests', 'request_bytes', 'response_bytes', 'events_sent',
+                'events_received')
+
+
+def new_record():
+    """Returns a record with every metric at zero"""
+    return dict.fromkeys(METRICS, 0)
+
+
+def body_size(data):
+    """Returns the bytes of a request body given as str or bytes"""
+    if isinstance(data, str):
+        return len(data) if data.isascii() else len(data.encode())
+    return len(data)
+
+
+def count_events(content):
+    """Counts the events of a write payload or of a read result
+
+    JSON text is counted by its objects, which for flat events such as the
+    wave classes is one per event
+    """
+    if content is None:
+        return 0
+    if isinstance(content, (str, bytes)):
+        return content.count('{' if isinstance(content, str) else b'{')
+    if hasattr(content, 'Results'):
+        return len(content.Results)
+    if isinstance(content, dict) or not hasattr(content, '__len__'):
+        return 1
+    return len(content)
+
+
+class Instrumentation:
+    """Records wall time, requests, bytes and events per step and operation
+
+    Pass it to main() to instrument a run, then read report() or
+    prometheus(). Nothing is wrapped or recorded without it, so a run that
+    is not instrumented pays nothing
+    """
+
+    def __init__(self):
+        self.steps = {}
+        self.operations = {}
+        self.__lock = threading.Lock()
+        self.__step = None
+        self.__step_start = None
+
+    def step(self, number):
+        """Ends the running step and starts step number, if not None"""
+        now = time.perf_counter()
+        with self.__lock:
+            if self.__step is not None:
+                self.__step['seconds'] += now - self.__step_start
+            self.__step = None
+            if number is not None:
+                self.__step = self.steps.setdefault(str(number), new_record())
+                self.__step_start = now
+
+    def stop(self):
+        """Ends the running step"""
+        self.step(None)
+
+    def add(self, operation=None, **values):
+        """Adds values to an operation record and to the running step"""
+        with self.__lock:
+            if operation is not None:
+                for key, value in values.items():
+                    operation[key] += value
+            if self.__step is not None:
+                for key in STEP_METRICS:
+                    self.__step[key] += values.get(key, 0)
+
+    def record_request(self, request_bytes, response_bytes):
+        """Records one HTTP request of the operation running in context
+
+        A request made outside SDS calls, such as a raw table read through
+        baseClient, is recorded as a call of baseClient.request
+        """
+        operation = CURRENT_OPERATION.get()
+        calls = 0
+        if operation is None:
+            with self.__lock:
+                operation = self.operations.setdefault('baseClient.request',
+                                                       new_record())
+            calls = 1
+        self.add(operation, calls=calls, requests=1,
+                 request_bytes=request_bytes, response_bytes=response_bytes)
+
+    def instrument(self, sds_client):
+        """Returns sds_client with every SDS call and request recorded
+
+        Works with an EDSClient, an ADHClient or a BlockingSdsClient. The
+        requests of the client are recorded until restore; a client that is
+        already instrumented raises ValueError, as its requests would be
+        counted twice
+        """
+        base_client = sds_client.baseClient
+        if base_client.__dict__.get('_instrumentation') is not None:
+            raise ValueError('The client is already instrumented')
+        # The request the client had of its own, if any, to restore
+        base_client._instrumentation = (self,
+                                        base_client.__dict__.get('request'))
+        base_client.request = self.timed_request(base_client.request)
+        async_client = getattr(sds_client, 'async_client', None)
+        if async_client is not None:
+            async_client.on_request = self.record_request
+        return InstrumentedClient(self, sds_client)
+
+    def restore(self, sds_client):
+        """Stops recording the requests of a client instrumented by this
+        Instrumentation, or of one wrapping it
+        """
+        base_client = sds_client.baseClient
+        instrumentation = base_client.__dict__.get('_instrumentation')
+        if instrumentation is None or instrumentation[0] is not self:
+            return
+        if instrumentation[1] is None:
+            del base_client.request
+        else:
+            base_client.request = instrumentation[1]
+        del base_client._instrumentation
+        async_client = getattr(sds_client, 'async_client', None)
+        if async_client is not None:
+            async_client.on_request = None
+
+    @contextlib.contextmanager
+    def instrumented(self, sds_client):
+        """Instruments sds_client for the duration of a with block"""
+        try:
+            yield self.instrument(sds_client)
+        finally:
+            self.restore(sds_client)
+
+    def timed_request(self, request):
+        """Wraps BaseClient.request to record request and response bytes"""
+        def call(method, url, params=None, data=None, *args, **kwargs):
+            sent = [0]
+            if isinstance(data, (str, bytes)):
+                sent[0] = body_size(data)
+            elif data is not None:
+                data = self.counted(data, sent)
+            response = request(method, url, params, data, *args, **kwargs)
+            self.record_request(sent[0], len(response.content))
+            return response
+        return call
+
+    @staticmethod
+    def counted(chunks, sent):
+        """Counts the bytes of a streamed request body as it is sent"""
+        for chunk in chunks:
+            sent[0] += len(chunk)
+            yield chunk
+
+    def timed_call(self, name, call):
+        """Wraps an SDS client call to record its time and events"""
+        operation = name.split('.')[-1]
+        with self.__lock:
+            record = self.operations.setdefault(name, new_record())
+
+        def timed(*args, **kwargs):
+            token = CURRENT_OPERATION.set(record)
+            start = time.perf_counter()
+            error = 0
+            result = None
+            try:
+                result = call(*args, **kwargs)
+                return result
+            except Exception:
+                error = 1
+                raise
+            finally:
+                CURRENT_OPERATION.reset(token)
+                sent = 0
+                if operation in WRITES:
+                    sent = count_events(args[2] if len(args) > 2
+                                        else kwargs.get('values'))
+                received = 0
+                if 'Value' in operation and operation not in WRITES:
+                    received = count_events(result)
+                self.add(record, calls=1, errors=error,
+                         seconds=time.perf_counter() - start,
+                         events_sent=sent, events_received=received)
+        return timed
+
+    def totals(self):
+        """Sums the operation records"""
+        totals = new_record()
+        with self.__lock:
+            for record in self.operations.values():
+                for key, value in record.items():
+                    totals[key] += value
+        return totals
+
+    def report(self):
+        """Returns the records as a JSON-ready dictionary"""
+        with self.__lock:
+            steps = {number: dict(record)
+                     for number, record in self.steps.items()}
+            operations = {name: dict(record)
+                          for name, record in self.operations.items()}
+        return {'steps': steps, 'operations': operations,
+                'totals': self.totals()}
+
+    def toJson(self):
+        """Converts the report into JSON"""
+        return json.dumps(self.report(), indent=2)
+
+    def prometheus(self, prefix='sds_sample'):
+        """Formats the records in the Prometheus text exposition format"""
+        report = self.report()
+        lines = []
+        for label, records in (('step', report['steps']),
+                               ('operation', report['operations'])):
+            for metric, description in METRICS.items():
+                if label == 'step' and metric not in (*STEP_METRICS,
+                                                      'seconds'):
+                    continue
+                name = f'{prefix}_{label}_{metric}_total'
+                lines.append(f'# HELP {name} {description} per {label}')
+                lines.append(f'# TYPE {name} counter')
+                for key, record in records.items():
+                    lines.append(f'{name}{{{label}="{key}"}} {record[metric]}')
+        return '\n'.join(lines) + '\n'
+
+
+class InstrumentedClient:
+    """An SDS client whose sub-client calls are recorded by Instrumentation"""
+
+    def __init__(self, instrumentation, sds_client):
+        self.__instrumentation = instrumentation
+        self.__sds_client = sds_client
+        self.__proxies = {}
+
+    def __getattr__(self, name):
+        value = getattr(self.__sds_client, name)
+        if (name == 'baseClient' or not name[:1].isupper()
+                or type(value).__module__ == 'builtins'):
+            return value
+        if name not in self.__proxies:
+            self.__proxies[name] = InstrumentedProxy(
+                self.__instrumentation, name, value)
+        return self.__proxies[name]
+
+
+class InstrumentedProxy:
+    """Records the calls of one sub-client, such as Streams"""
+
+    def __init__(self, instrumentation, name, calls):
+        self.__instrumentation = instrumentation
+        self.__name = name
+        self.__calls = calls
+        self.__timed = {}
+
+    def __getattr__(self, name):
+        call = getattr(self.__calls, name)
+        if not callable(call):
+            return call
+        if name not in self.__timed:
+            self.__timed[name] = self.__instrumentation.timed_call(
+                f'{self.__name}.{name}', call)
+        return self.__timed[name]
@@ -0,0 +1,241 @@
+"""Local interpolation of columnar windows, as SDS calculates indexes
+
+The functions work on a WaveBatch, or on a dict of NumPy columns keyed by
+SDS property name, sorted by a single index column. They evaluate every
+requested index in one vectorized pass, so a window read once can be
+resampled without further SDS calls. Values that SDS returns as null are
+NaN, and an integer column that has any is returned as float64
+"""
+
+import numpy as np
+from adh_sample_library_preview import (SdsBoundaryType, SdsExtrapolationMode,
+                                        SdsInterpolationMode)
+
+CONTINUOUS = SdsInterpolationMode.Continuous
+LEADING = SdsInterpolationMode.StepwiseContinuousLeading
+TRAILING = SdsInterpolationMode.StepwiseContinuousTrailing
+DISCRETE = SdsInterpolationMode.Discrete
+NULLABLE_LEADING = SdsInterpolationMode.ContinuousNullableLeading
+NULLABLE_TRAILING = SdsInterpolationMode.ContinuousNullableTrailing
+
+
+def as_mode(value, enum, default):
+    """Reads an SDS enumeration given as a member, a value or a name, with
+    names matched ignoring case as SDS does
+    """
+    if value is None:
+        return default
+    if isinstance(value, enum):
+        return value
+    if isinstance(value, str) and not value.isdigit():
+        for name, member in enum.__members__.items():
+            if name.lower() == value.lower():
+                return member
+        raise ValueError(f'Unknown {enum.__name__} {value}')
+    return enum(int(value))
+
+
+def interpolation_modes(sds_type, stream=None):
+    """Returns the SdsInterpolationMode of each property of a type
+
+    Stream property overrides come first, then the property's own mode, the
+    stream's, the type's and finally Continuous, as in SDS
+    """
+    default = as_mode(getattr(sds_type, 'InterpolationMode', None),
+                      SdsInterpolationMode, CONTINUOUS)
+    if stream is not None:
+        default = as_mode(getattr(stream, 'InterpolationMode', None),
+                          SdsInterpolationMode, default)
+    modes = {prop.Id: as_mode(prop.InterpolationMode, SdsInterpolationMode,
+                              default)
+             for prop in sds_type.Properties}
+    for override in getattr(stream, 'PropertyOverrides', None) or []:
+        if override.InterpolationMode is not None:
+            modes[override.SdsTypePropertyId] = as_mode(
+                override.InterpolationMode, SdsInterpolationMode, None)
+    return modes
+
+
+def extrapolation_mode(sds_type, stream=None):
+    """Returns the SdsExtrapolationMode of a stream, or of its type"""
+    mode = as_mode(getattr(sds_type, 'ExtrapolationMode', None),
+                   SdsExtrapolationMode, SdsExtrapolationMode.All)
+    return as_mode(getattr(stream, 'ExtrapolationMode', None),
+                   SdsExtrapolationMode, mode)
+
+
+def as_columns(window, index=None):
+    """Returns the columns of a window and the name of its index column"""
+    columns = window.columns if hasattr(window, 'columns') else dict(window)
+    return columns, index or next(iter(columns))
+
+
+def interpolate(window, indexes, index=None, modes=None,
+                extrapolation=SdsExtrapolationMode.All):
+    """Calculates the events of a window at each of indexes
+
+    Stored events are returned where an index matches one. Elsewhere each
+    property follows its mode in modes, Continuous by default, and indexes
+    before the first or after the last event follow extrapolation. Returns
+    a dict of columns in the order of indexes
+    """
+    columns, index = as_columns(window, index)
+    keys = columns[index]
+    targets = np.asarray(indexes, dtype=np.float64)
+    modes = modes or {}
+    size = len(keys)
+
+    result = {index: np.asarray(indexes).astype(keys.dtype, copy=False)}
+    if size == 0:
+        for name, column in columns.items():
+            if name != index:
+                result[name] = np.full(len(targets), np.nan)
+        return result
+
+    after = np.searchsorted(keys, targets, 'left')
+    clipped = np.minimum(after, size - 1)
+    exact = keys[clipped] == targets
+    before = np.maximum(after - 1, 0)
+    first = (after == 0) & ~exact
+    last = after == size
+    inside = ~exact & ~first & ~last
+    low = keys[before].astype(np.float64)
+    high = keys[clipped].astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = np.where(inside, (targets - low) / (high - low), 0.0)
+
+    backward = extrapolation in (SdsExtrapolationMode.All,
+                                 SdsExtrapolationMode.Backward)
+    forward = extrapolation in (SdsExtrapolationMode.All,
+                                SdsExtrapolationMode.Forward)
+
+    for name, column in columns.items():
+        if name == index:
+            continue
+        mode = as_mode(modes.get(name), SdsInterpolationMode, CONTINUOUS)
+        values = column.astype(np.float64, copy=False)
+        previous, following = values[before], values[clipped]
+        if mode == DISCRETE:
+            calculated = np.full(len(targets), np.nan)
+        elif mode == LEADING:
+            calculated = previous
+        elif mode == TRAILING:
+            calculated = following
+        else:
+            with np.errstate(invalid='ignore'):
+                calculated = previous + fraction * (following - previous)
+            missing = np.isnan(previous) | np.isnan(following)
+            if mode == NULLABLE_LEADING:
+                calculated = np.where(missing, previous, calculated)
+            elif mode == NULLABLE_TRAILING:
+                calculated = np.where(missing, following, calculated)
+
+        if mode != DISCRETE:
+            calculated = np.where(first, values[0] if backward else np.nan,
+                                  calculated)
+            calculated = np.where(last, values[-1] if forward else np.nan,
+                                  calculated)
+        calculated = np.where(exact, following, calculated)
+
+        if np.issubdtype(column.dtype, np.integer) and \
+                not np.isnan(calculated).any():
+            calculated = np.rint(calculated).astype(column.dtype)
+        result[name] = calculated
+    return result
+
+
+def interpolate_count(window, start, end, count, index=None, modes=None,
+                      extrapolation=SdsExtrapolationMode.All):
+    """Calculates count evenly spaced events from start to end, as
+    getRangeValuesInterpolated does
+    """
+    return interpolate(window, np.linspace(float(start), float(end), count),
+                       index, modes, extrapolation)
+
+
+def concatenate(parts):
+    """Joins dicts of columns that share their names"""
+    return {name: np.concatenate([part[name] for part in parts])
+            for name in parts[0]}
+
+
+def take(columns, positions):
+    """Returns the rows of columns at positions"""
+    return {name: column[positions] for name, column in columns.items()}
+
+
+def window_values(window, start, end, boundary_type=SdsBoundaryType.Exact,
+                  index=None, modes=None,
+                  extrapolation=SdsExtrapolationMode.All):
+    """Returns the events from start to end, as getWindowValues does with
+    a boundary type
+
+    Outside adds the stored event just beyond each boundary without an
+    exact match; ExactOrCalculated calculates one at that boundary instead
+    """
+    columns, index = as_columns(window, index)
+    keys = columns[index]
+    boundary_type = as_mode(boundary_type, SdsBoundaryType,
+                            SdsBoundaryType.Exact)
+    low = np.searchsorted(keys, start, 'left')
+    high = np.searchsorted(keys, end, 'right')
+    start_exact = low < len(keys) and keys[low] == start
+    end_exact = high > 0 and keys[high - 1] == end
+
+    if boundary_type == SdsBoundaryType.Outside:
+        low -= 0 if start_exact or low == 0 else 1
+        high += 0 if end_exact or high == len(keys) else 1
+    selected = take(columns, slice(low, high))
+    if boundary_type != SdsBoundaryType.ExactOrCalculated:
+        return selected
+
+    parts = [selected]
+    if not start_exact:
+        parts.insert(0, interpolate(columns, [start], index, modes,
+                                    extrapolation))
+    if not end_exact and end != start:
+        parts.append(interpolate(columns, [end], index, modes, extrapolation))
+    return concatenate(match_dtypes(parts))
+
+
+def range_values(window, start, count, skip=0, reverse=False,
+                 boundary_type=SdsBoundaryType.Exact, index=None, modes=None,
+                 extrapolation=SdsExtrapolationMode.All):
+    """Returns count events from start, as getRangeValues does
+
+    Outside starts with the stored event just before start (after it when
+    reverse) without an exact match; ExactOrCalculated calculates one at
+    start instead
+    """
+    columns, index = as_columns(window, index)
+    keys = columns[index]
+    boundary_type = as_mode(boundary_type, SdsBoundaryType,
+                            SdsBoundaryType.Exact)
+    position = np.searchsorted(keys, start, 'left')
+    exact = position < len(keys) and keys[position] == start
+
+    if reverse:
+        stop = position + 1 if exact else position
+        if boundary_type == SdsBoundaryType.Outside and not exact:
+            stop = min(stop + 1, len(keys))
+        positions = np.arange(stop - 1, -1, -1)
+    else:
+        if boundary_type == SdsBoundaryType.Outside and not exact:
+            position = max(position - 1, 0)
+        positions = np.arange(position, len(keys))
+    selected = take(columns, positions)
+
+    if boundary_type == SdsBoundaryType.ExactOrCalculated and not exact \
+            and len(keys):
+        selected = concatenate(match_dtypes([
+            interpolate(columns, [start], index, modes, extrapolation),
+            selected]))
+    return take(selected, slice(skip, skip + count))
+
+
+def match_dtypes(parts):
+    """Promotes the columns of several parts to common dtypes"""
+    dtypes = {name: np.result_type(*(part[name] for part in parts))
+              for name in parts[0]}
+    return [{name: column.astype(dtypes[name], copy=False)
+             for name, column in part.items()} for part in parts]
@@ -0,0 +1,117 @@
+"""Pluggable JSON backend for encoding and decoding wave events
+
+orjson is used when it is installed, the standard library json otherwise.
+Set the WAVE_JSON_BACKEND environment variable, or call set_backend, to
+choose one explicitly
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StdlibBackend:
+    """Encodes and decodes JSON with the standard library"""
+
+    name = 'json'
+
+    @staticmethod
+    def dumps(content):
+        """Converts content into a JSON string"""
+        return json.dumps(content)
+
+    @staticmethod
+    def loads(content):
+        """Parses a JSON string or bytes"""
+        return json.loads(content)
+
+    @staticmethod
+    def dumps_rows(names, columns):
+        """Converts columns of finite numbers into one JSON object per row"""
+        # Formatting a template is faster than json.dumps for flat numbers
+        row = '{' + ', '.join(f'"{name}": %r' for name in names) + '}'
+        return [row % values for values in zip(*columns)]
+
+    @classmethod
+    def dumps_table(cls, names, columns):
+        """Converts columns of finite numbers into a JSON array of objects"""
+        return '[' + ', '.join(cls.dumps_rows(names, columns)) + ']'
+
+
+class OrjsonBackend:
+    """Encodes and decodes JSON with orjson
+
+    orjson writes NaN and Infinity as null, where json writes the
+    non-standard NaN and Infinity literals. Decoding falls back to json for
+    documents that contain them
+    """
+
+    name = 'orjson'
+
+    @staticmethod
+    def dumps(content):
+        """Converts content into a JSON string"""
+        # NumPy scalars and arrays are encoded as numbers and lists
+        return orjson.dumps(
+            content, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+    @staticmethod
+    def loads(content):
+        """Parses a JSON string or bytes"""
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return json.loads(content)
+
+    @staticmethod
+    def dumps_rows(names, columns):
+        """Converts columns of finite numbers into one JSON object per row"""
+        encode = orjson.dumps
+        return [encode(dict(zip(names, values))).decode()
+                for values in zip(*columns)]
+
+    @staticmethod
+    def dumps_table(names, columns):
+        """Converts columns of finite numbers into a JSON array of objects"""
+        return orjson.dumps([dict(zip(names, values))
+                             for values in zip(*columns)]).decode()
+
+
+BACKENDS = {'json': StdlibBackend}
+if orjson is not None:
+    BACKENDS['orjson'] = OrjsonBackend
+
+backend = None
+
+
+def set_backend(name):
+    """Selects the JSON backend by name: orjson or json"""
+    global backend
+    if name == 'orjson' and orjson is None:
+        raise ValueError('The orjson backend needs orjson installed')
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown JSON backend {name}')
+    backend = BACKENDS[name]()
+
+
+def get_backend():
+    """Returns the JSON backend in use"""
+    return backend
+
+
+def dumps(content):
+    """Converts content into a JSON string with the backend in use"""
+    return backend.dumps(content)
+
+
+def loads(content):
+    """Parses a JSON string or bytes with the backend in use"""
+    return backend.loads(content)
+
+
+set_backend(os.environ.get('WAVE_JSON_BACKEND')
+            or ('orjson' if orjson is not None else 'json'))
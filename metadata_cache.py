@@ -0,0 +1,382 @@
+"""Persistent cache of the SDS types, streams and stream views a run creates
+
+Wrap an SDS client with MetadataCache.wrap before the setup calls. A call
+that creates a definition whose content hash matches the one recorded on
+disk for the same server, namespace and id is answered from the file
+without a request. Deletes through the wrapper forget the definition. With
+validate, each answer from the file is checked against SDS in the
+background, and a definition that is missing or differs is created again
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl; its files are locked with msvcrt
+    fcntl = None
+    import msvcrt
+
+from adh_sample_library_preview import SdsStreamView, SdsType
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'sds_sample_metadata.json')
+
+COUNTERS = ('hits', 'misses', 'validations', 'repairs')
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Holds an exclusive lock on the file at path, across processes and
+    threads; the lock is released if the process ends
+    """
+    with open(path, 'a+b') as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def content_hash(content):
+    """Hashes a definition dictionary independently of its key order"""
+    text = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def apply_changes(entries, changes):
+    """Records and forgets the changes of a MetadataCache in entries, and
+    returns them
+    """
+    for key, entry in changes.items():
+        if entry is None:
+            entries.pop(key, None)
+        else:
+            entries[key] = entry
+    return entries
+
+
+class MetadataCache:
+    """Records the SDS definitions created through wrapped clients in a file
+
+    Several processes may share the file. Each save merges the definitions
+    recorded and forgotten since the previous one into the file as it is
+    then, under a lock, so that processes keep each other's changes and a
+    definition forgotten by one is not written back by another
+    """
+
+    def __init__(self, path=DEFAULT_PATH, validate=False):
+        self.path = path
+        self.validate = validate
+        self.errors = []
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
+        self.__lock = threading.Lock()
+        self.__save_lock = threading.Lock()
+        # Definitions recorded since the last save, and None for those
+        # forgotten since then
+        self.__changes = {}
+        self.__executor = None
+        self.__pending = []
+        self.__entries = self.load()
+
+    def load(self):
+        """Reads the recorded definitions, or none if the file is unusable"""
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                return json.load(file).get('entries', {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def save(self):
+        """Merges the changes since the last save into the cache file
+
+        Under a lock on the file path + '.lock', the file is read again, the
+        changes are applied to it, and the result is written to a temporary
+        file that is moved over the cache file. The recorded definitions then
+        become those of the file, with the changes made during the save
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self.__save_lock, file_lock(self.path + '.lock'):
+            with self.__lock:
+                changes, self.__changes = self.__changes, {}
+            entries = self.load()
+            apply_changes(entries, changes)
+            content = json.dumps({'version': 1, 'entries': entries})
+            descriptor, temporary = tempfile.mkstemp(dir=directory,
+                                                     suffix='.tmp')
+            try:
+                with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+                    file.write(content)
+                os.replace(temporary, self.path)
+            except OSError:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                with self.__lock:
+                    self.__changes = {**changes, **self.__changes}
+                raise
+            with self.__lock:
+                self.__entries = apply_changes(entries, self.__changes)
+
+    def wrap(self, sds_client):
+        """Returns sds_client with its setup calls answered from the cache"""
+        return MetadataClient(self, sds_client)
+
+    def stats(self):
+        """Returns the counters and the number of recorded definitions"""
+        with self.__lock:
+            stats = {counter: getattr(self, counter) for counter in COUNTERS}
+            stats['entries'] = len(self.__entries)
+            stats['errors'] = len(self.errors)
+            return stats
+
+    def clear(self):
+        """Forgets every definition and removes the file"""
+        with self.__save_lock, file_lock(self.path + '.lock'):
+            with self.__lock:
+                self.__entries = {}
+                self.__changes = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def wait(self):
+        """Waits for the pending background validations"""
+        while True:
+            with self.__lock:
+                pending, self.__pending = self.__pending, []
+            if not pending:
+                return
+            for future in pending:
+                future.result()
+
+    def close(self):
+        """Waits for the pending validations and stops their thread"""
+        self.wait()
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+
+    @staticmethod
+    def key(sds_client, namespace_id, kind, object_id):
+        """Identifies a definition by server, tenant, namespace and id"""
+        base_client = sds_client.baseClient
+        return '|'.join((base_client.uri_API, str(base_client.tenant),
+                         namespace_id, kind, object_id))
+
+    def forget(self, key):
+        """Removes a recorded definition, also from the file if another
+        process recorded it
+        """
+        with self.__lock:
+            self.__entries.pop(key, None)
+            self.__changes[key] = None
+        self.save()
+
+    def record(self, key, definition, content):
+        """Records a definition and the content SDS answered it with"""
+        entry = {'hash': content_hash(definition), 'content': content}
+        with self.__lock:
+            self.__entries[key] = entry
+            self.__changes[key] = entry
+        self.save()
+
+    def create(self, key, definition, create, get=None):
+        """Runs a create call unless definition is recorded under key
+
+        create sends the definition and returns the SDS content for it, and
+        get reads the content from SDS to validate a recorded definition.
+        Returns the recorded or created content
+        """
+        digest = content_hash(definition)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            hit = entry is not None and entry['hash'] == digest
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not hit:
+            content = create()
+            self.record(key, definition, content)
+            return content
+        if self.validate and get is not None:
+            self.check(key, definition, entry['content'], create, get)
+        return entry['content']
+
+    def check(self, key, definition, content, create, get):
+        """Validates a recorded definition against SDS in the background"""
+        def validate():
+            try:
+                try:
+                    current = get()
+                except Exception:
+                    current = None
+                with self.__lock:
+                    self.validations += 1
+                if current is not None \
+                        and content_hash(current) == content_hash(content):
+                    return
+                self.record(key, definition, create())
+                with self.__lock:
+                    self.repairs += 1
+            except Exception as error:
+                self.forget(key)
+                with self.__lock:
+                    self.errors.append((key, error))
+
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='metadata-validation')
+            self.__pending.append(self.__executor.submit(validate))
+
+
+class MetadataClient:
+    """An SDS client whose setup calls go through a MetadataCache"""
+
+    def __init__(self, cache, sds_client):
+        self.__sds_client = sds_client
+        self.__types = MetadataTypes(cache, sds_client)
+        self.__streams = MetadataStreams(cache, sds_client)
+        self.__stream_views = MetadataStreamViews(cache, sds_client)
+
+    def __getattr__(self, name):
+        if name == 'Types':
+            return self.__types
+        if name == 'Streams':
+            return self.__streams
+        if name == 'StreamViews':
+            return self.__stream_views
+        return getattr(self.__sds_client, name)
+
+
+class MetadataTypes:
+    """The Types calls of a MetadataClient"""
+
+    def __init__(self, cache, sds_client):
+        self.__cache = cache
+        self.__sds_client = sds_client
+        self.__types = sds_client.Types
+
+    def __getattr__(self, name):
+        return getattr(self.__types, name)
+
+    def getOrCreateType(self, namespace_id, sds_type):
+        """Gets or creates a type, unless it is recorded unchanged"""
+        content = self.__cache.create(
+            self.__cache.key(self.__sds_client, namespace_id, 'Type',
+                             sds_type.Id),
+            sds_type.toDictionary(),
+            lambda: self.__types.getOrCreateType(
+                namespace_id, sds_type).toDictionary(),
+            lambda: self.__types.getType(namespace_id,
+                                         sds_type.Id).toDictionary())
+        return SdsType.fromJson(content)
+
+    def deleteType(self, namespace_id, type_id):
+        """Deletes a type and forgets it"""
+        try:
+            return self.__types.deleteType(namespace_id, type_id)
+        finally:
+            self.__cache.forget(self.__cache.key(
+                self.__sds_client, namespace_id, 'Type', type_id))
+
+
+class MetadataStreams:
+    """The Streams calls of a MetadataClient"""
+
+    def __init__(self, cache, sds_client):
+        self.__cache = cache
+        self.__sds_client = sds_client
+        self.__streams = sds_client.Streams
+
+    def __getattr__(self, name):
+        return getattr(self.__streams, name)
+
+    def createOrUpdateStream(self, namespace_id, stream):
+        """Creates or updates a stream, unless it is recorded unchanged"""
+        definition = stream.toDictionary()
+
+        def create():
+            self.__streams.createOrUpdateStream(namespace_id, stream)
+            return definition
+
+        self.__cache.create(
+            self.__cache.key(self.__sds_client, namespace_id, 'Stream',
+                             stream.Id),
+            definition, create,
+            lambda: self.__streams.getStream(namespace_id,
+                                             stream.Id).toDictionary())
+
+    def updateStreamType(self, namespace_id, stream_id, stream_view_id):
+        """Changes the type of a stream and forgets its definition"""
+        try:
+            return self.__streams.updateStreamType(namespace_id, stream_id,
+                                                   stream_view_id)
+        finally:
+            self.__cache.forget(self.__cache.key(
+                self.__sds_client, namespace_id, 'Stream', stream_id))
+
+    def deleteStream(self, namespace_id, stream_id):
+        """Deletes a stream and forgets it"""
+        try:
+            return self.__streams.deleteStream(namespace_id, stream_id)
+        finally:
+            self.__cache.forget(self.__cache.key(
+                self.__sds_client, namespace_id, 'Stream', stream_id))
+
+
+class MetadataStreamViews:
+    """The StreamViews calls of a MetadataClient"""
+
+    def __init__(self, cache, sds_client):
+        self.__cache = cache
+        self.__sds_client = sds_client
+        self.__stream_views = sds_client.StreamViews
+
+    def __getattr__(self, name):
+        return getattr(self.__stream_views, name)
+
+    def getOrCreateStreamView(self, namespace_id, stream_view):
+        """Gets or creates a stream view, unless it is recorded unchanged"""
+        content = self.__cache.create(
+            self.__cache.key(self.__sds_client, namespace_id, 'StreamView',
+                             stream_view.Id),
+            stream_view.toDictionary(),
+            lambda: self.__stream_views.getOrCreateStreamView(
+                namespace_id, stream_view).toDictionary(),
+            lambda: self.__stream_views.getStreamView(
+                namespace_id, stream_view.Id).toDictionary())
+        return SdsStreamView.fromJson(content)
+
+    def createOrUpdateStreamView(self, namespace_id, stream_view):
+        """Creates or updates a stream view and records it"""
+        self.__stream_views.createOrUpdateStreamView(namespace_id,
+                                                     stream_view)
+        self.__cache.record(
+            self.__cache.key(self.__sds_client, namespace_id, 'StreamView',
+                             stream_view.Id),
+            stream_view.toDictionary(), stream_view.toDictionary())
+
+    def deleteStreamView(self, namespace_id, stream_view_id):
+        """Deletes a stream view and forgets it"""
+        try:
+            return self.__stream_views.deleteStreamView(namespace_id,
+                                                        stream_view_id)
+        finally:
+            self.__cache.forget(self.__cache.key(
+                self.__sds_client, namespace_id, 'StreamView',
+                stream_view_id))
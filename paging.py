@@ -0,0 +1,65 @@
+"""Lazy iteration over SDS window reads, one page at a time"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from wave_data import WaveBatch
+
+
+def iter_window_pages(sds_client, namespace_id, stream_id, start, end,
+                      page_size=1000, filter='', prefetch=True):
+    """Yields the pages of a window read as lists of JSON events
+
+    Pages are requested with the continuation token of the previous one, so
+    only page_size events are held at a time. With prefetch, the next page
+    is requested while the current one is being consumed, holding at most
+    two pages
+    """
+    def get(token):
+        page = sds_client.Streams.getWindowValuesPaged(
+            namespace_id, stream_id, start, end, page_size, token or '',
+            None, filter)
+        return page.Results or [], page.ContinuationToken
+
+    if not prefetch:
+        results, token = get(None)
+        while True:
+            if results:
+                yield results
+            if not token:
+                return
+            results, token = get(token)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        results, token = get(None)
+        while True:
+            pending = executor.submit(get, token) if token else None
+            if results:
+                yield results
+            if pending is None:
+                return
+            results, token = pending.result()
+
+
+def iter_window(sds_client, namespace_id, stream_id, start, end,
+                value_class=None, page_size=1000, filter='', prefetch=True):
+    """Yields the events of a window lazily, page by page
+
+    Events are converted with value_class.fromJson, if given, as
+    getWindowValues does
+    """
+    for results in iter_window_pages(sds_client, namespace_id, stream_id,
+                                     start, end, page_size, filter, prefetch):
+        if value_class is None:
+            yield from results
+        else:
+            for event in results:
+                yield value_class.fromJson(event)
+
+
+def iter_window_batches(sds_client, namespace_id, stream_id, start, end,
+                        wave_class, page_size=10000, filter='',
+                        prefetch=True):
+    """Yields the events of a window as one WaveBatch per page"""
+    for results in iter_window_pages(sds_client, namespace_id, stream_id,
+                                     start, end, page_size, filter, prefetch):
+        yield WaveBatch.fromJson(results, wave_class)
@@ -0,0 +1,170 @@
+"""Wave generation across a process pool, into shared memory
+
+generate_waves splits a range of orders between worker processes. Each
+attaches to one multiprocessing.shared_memory block that holds every
+column of the result and fills its slice in place, so nothing is pickled
+back. The parent gets a WaveBatch whose columns are views of the block.
+The values match next_waves for the same orders and multiplier
+"""
+
+import contextlib
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from wave_data import WaveBatch, WaveDataCompound, check_waves
+
+# Column offsets in a block are multiples of this, a cache line
+ALIGNMENT = 64
+
+# Functions of Radians that fill the columns of the same name
+WAVE_FUNCTIONS = (('Sin', np.sin), ('Cos', np.cos), ('Tan', np.tan),
+                  ('Sinh', np.sinh), ('Cosh', np.cosh), ('Tanh', np.tanh))
+
+
+def column_layout(wave_class, size):
+    """Returns the (name, dtype, offset) of each column of a block, and the
+    size of the block
+    """
+    layout = []
+    offset = 0
+    for name, _, dtype in wave_class.sds_columns:
+        dtype = np.dtype(dtype)
+        layout.append((name, dtype, offset))
+        offset += -(-size * dtype.itemsize // ALIGNMENT) * ALIGNMENT
+    return layout, offset
+
+
+class SharedWaves:
+    """A WaveBatch of wave_class whose columns live in one shared memory
+    block
+
+    Without name, a new block is created and owned; otherwise the block of
+    that name is attached. Release views of the columns before close
+    """
+
+    def __init__(self, wave_class, size, name=None):
+        self.wave_class = wave_class
+        self.size = size
+        layout, nbytes = column_layout(wave_class, size)
+        self.owner = name is None
+        self.__memory = shared_memory.SharedMemory(
+            name, create=self.owner, size=max(nbytes, 1))
+        self.batch = WaveBatch(wave_class, {
+            name: np.ndarray(size, dtype, self.__memory.buf, offset)
+            for name, dtype, offset in layout})
+
+    @property
+    def name(self):
+        """The name other processes attach to the block with"""
+        return self.__memory.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        if self.owner:
+            self.unlink()
+
+    def close(self):
+        """Detaches from the block, dropping the batch"""
+        self.batch = None
+        self.__memory.close()
+
+    def unlink(self):
+        """Frees the block once every process has closed it"""
+        self.__memory.unlink()
+
+
+def share_tracker():
+    """Starts the shared memory tracker of this process, on POSIX
+
+    Worker processes forked afterwards share it, rather than each start one
+    that reports the blocks it attached as leaked. Call it before starting
+    an executor passed to generate_waves
+    """
+    if os.name == 'posix':
+        resource_tracker.ensure_running()
+
+
+def fill_waves(columns, orders, multiplier):
+    """Writes the wave columns of orders in place, as next_waves computes
+    them; values beyond float64 are infinite
+    """
+    columns['Order'][...] = orders
+    if 'Multiplier' in columns:
+        columns['Multiplier'][...] = multiplier
+    radians = columns['Radians']
+    np.multiply(orders, math.pi, out=radians)
+    np.divide(radians, 32, out=radians)
+    np.divide(radians, 2 * math.pi, out=columns['Tau'])
+    with np.errstate(over='ignore'):
+        for name, function in WAVE_FUNCTIONS:
+            column = columns[name]
+            function(radians, out=column)
+            np.multiply(multiplier, column, out=column)
+
+
+def fill_slice(name, wave_class, size, start, step, multiplier, low, high,
+               block):
+    """Fills rows low to high of a SharedWaves block, block rows at a time
+    so that each one stays in cache
+    """
+    waves = SharedWaves(wave_class, size, name)
+    try:
+        for first in range(low, high, block):
+            last = min(first + block, high)
+            rows = slice(first, last)
+            fill_waves({key: column[rows]
+                        for key, column in waves.batch.columns.items()},
+                       np.arange(start + first * step, start + last * step,
+                                 step, dtype=np.int64), multiplier)
+    finally:
+        waves.close()
+
+
+def generate_waves(start, stop, step=1, multiplier=1.0, processes=None,
+                   wave_class=WaveDataCompound, block=1 << 16, executor=None):
+    """Generates the waves of range(start, stop, step) across processes
+
+    The range is split in equal slices, one for each of processes, all the
+    CPUs by default. executor, a ProcessPoolExecutor started after
+    share_tracker, can be reused across calls to save starting the
+    processes. Orders that the Order column of wave_class cannot hold raise
+    ValueError, as do multipliers that are not whole numbers when
+    wave_class has a Multiplier. Returns the SharedWaves, whose batch holds
+    the waves; close and unlink it, or use it as a context manager, when
+    done
+    """
+    orders = range(start, stop, step)
+    size = len(orders)
+    if size:
+        check_waves(wave_class, min(orders[0], orders[-1]),
+                    max(orders[0], orders[-1]), multiplier)
+    processes = processes or os.cpu_count() or 1
+    if processes > 1 or executor is not None:
+        share_tracker()
+    waves = SharedWaves(wave_class, size)
+    bounds = np.linspace(0, size, processes + 1).astype(int).tolist()
+    arguments = [(waves.name, wave_class, size, start, step, multiplier,
+                  low, high, block)
+                 for low, high in zip(bounds[:-1], bounds[1:]) if high > low]
+    try:
+        if processes == 1 and executor is None:
+            for slice_arguments in arguments:
+                fill_slice(*slice_arguments)
+        else:
+            with contextlib.nullcontext(executor) if executor is not None \
+                    else ProcessPoolExecutor(max_workers=processes) as pool:
+                for future in [pool.submit(fill_slice, *slice_arguments)
+                               for slice_arguments in arguments]:
+                    future.result()
+    except BaseException:
+        waves.close()
+        waves.unlink()
+        raise
+    return waves
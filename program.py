@@ -1,10 +1,13 @@
 """This sample script demonstrates how to invoke the Sequential Data Store REST API"""
 
-import inspect
 import json
 import jsonpatch
 import math
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 from adh_sample_library_preview import (SdsType, SdsTypeCode, SdsTypeProperty,
                                         EDSClient, ADHClient, SdsStream, SdsBoundaryType,
@@ -12,8 +15,11 @@ from adh_sample_library_preview import (SdsType, SdsTypeCode, SdsTypeProperty,
                                         SdsStreamViewProperty, SdsStreamView,
                                         SdsStreamIndex, SdsInterpolationMode, Role)
 
-from wave_data import (WaveData, WaveDataCompound, WaveDataInteger,
-                       WaveDataTarget)
+from async_client import BlockingSdsClient
+from paging import iter_window
+from table_form import decode_table, get_window_table
+from wave_data import (WaveBatch, WaveData, WaveDataCompound, WaveDataInteger,
+                       WaveDataTarget, check_waves, property_codec)
 
 
 def get_appsettings():
@@ -165,6 +171,39 @@ def next_wave(order, multiplier):
     return new_wave
 
 
+def next_waves(orders, multiplier, wave_class=WaveDataCompound):
+    """Creates a WaveBatch of wave_class events, WaveDataCompound by default
+
+    orders can be a range, an array of indexes or a single index, multiplier
+    a scalar or an array that is broadcast against orders (as used for the
+    compound index). Orders that the Order of wave_class cannot hold, and
+    multipliers that are not whole numbers for WaveDataCompound, whose
+    Multiplier is an integer key, raise ValueError; values beyond float64
+    are infinite, as generate_waves makes them
+    """
+    if isinstance(orders, range):
+        orders = np.arange(orders.start, orders.stop, orders.step)
+    order, multiplier = np.broadcast_arrays(
+        np.atleast_1d(orders), np.asarray(multiplier))
+    if len(order):
+        check_waves(wave_class, order.min(), order.max(), multiplier)
+    radians = order * math.pi/32
+
+    with np.errstate(over='ignore'):
+        return WaveBatch(wave_class, {
+            'Order': order,
+            'Multiplier': multiplier,
+            'Tau': radians / (2 * math.pi),
+            'Radians': radians,
+            'Sin': multiplier * np.sin(radians),
+            'Cos': multiplier * np.cos(radians),
+            'Tan': multiplier * np.tan(radians),
+            'Sinh': multiplier * np.sinh(radians),
+            'Cosh': multiplier * np.cosh(radians),
+            'Tanh': multiplier * np.tanh(radians),
+        })
+
+
 def suppress_error(sds_call):
     """Suppress an error thrown by SDS"""
     try:
@@ -173,23 +212,43 @@ def suppress_error(sds_call):
         print(f'Encountered Error: {error}')
 
 
-def is_prop(value):
-    """Check whether a field is a property of an object"""
-    return isinstance(value, property)
+def delete_in_tiers(tiers, concurrency=8):
+    """Runs SDS delete calls tier by tier, in parallel within each tier
+
+    tiers is a list of lists of (name, delete call) pairs. Every call of a
+    tier completes before the next tier starts. Returns (name, error or
+    None, seconds) for each call, in order
+    """
+    def timed(sds_call):
+        start = time.perf_counter()
+        try:
+            sds_call()
+            error = None
+        except Exception as sds_error:
+            error = sds_error
+        return error, time.perf_counter() - start
+
+    outcomes = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for tier in tiers:
+            results = executor.map(timed, [sds_call for _, sds_call in tier])
+            outcomes.extend((name, error, seconds) for (name, _), (error, seconds)
+                            in zip(tier, results))
+    return outcomes
 
 
 def to_string(event):
     """Converts an event into a string"""
     string = ''
-    props = inspect.getmembers(type(event), is_prop)
+    props = property_codec(type(event))
     print_order = [2, 3, 4, 0, 6, 5, 1, 7, 8]
     ordered_props = [props[i] for i in print_order]
-    for prop in ordered_props:
-        value = prop[1].fget(event)
+    for name, getter, _ in ordered_props:
+        value = getter(event)
         if value is None:
-            string += f'{prop[0]}: , '
+            string += f'{name}: , '
         else:
-            string += f'{prop[0]}: {value}, '
+            string += f'{name}: {value}, '
     return string[:-2]
 
 
@@ -198,15 +257,10 @@ def to_wave_data(json_obj):
     # Many JSON implementations leave default values out.  We compensate for
     # WaveData, knowing  that all values should be filled in
     wave = WaveData()
-    properties = inspect.getmembers(type(wave), is_prop)
-    for prop in properties:
+    for name, _, setter in property_codec(type(wave)):
         # Pre-Assign the default
-        prop[1].fset(wave, 0)
-
-        if prop[0] in json_obj:
-            value = json_obj[prop[0]]
-            if value is not None:
-                prop[1].fset(wave, value)
+        value = json_obj.get(name)
+        setter(wave, 0 if value is None else value)
     return wave
 
 
@@ -222,13 +276,32 @@ STREAM_ID_COMPOUND = 'SampleStream_Compound_Python'
 COMPOUND_TYPE_ID = 'SampleType_Compound_Python'
 
 
-def main(test=False):
-    """This function is the main body of the SDS sample script"""
+def main(test=False, use_async=False, appsettings=None, on_step=None,
+         instrumentation=None, cache=None, metadata_cache=None):
+    """This function is the main body of the SDS sample script
+
+    With use_async, the SDS calls go through the asyncio client instead.
+    appsettings overrides the contents of appsettings.json, and on_step is
+    called with the number of each step as it starts. An Instrumentation
+    records the time, requests, bytes and events of every step and SDS call.
+    A WindowCache serves repeated window and range reads without requests,
+    and a MetadataCache skips creating definitions unchanged since a
+    previous run
+    """
+    def step(number):
+        if on_step is not None:
+            on_step(number)
+        if instrumentation is not None:
+            instrumentation.step(number)
+
     exception = None
+    sds_client = None
     try:
-        appsettings = get_appsettings()
+        if appsettings is None:
+            appsettings = get_appsettings()
 
         # Step 1
+        step(1)
         tenant_id = appsettings.get('TenantId')
         namespace_id = appsettings.get('NamespaceId')
         community_id = appsettings.get('CommunityId')
@@ -245,6 +318,15 @@ def main(test=False):
                 appsettings.get('ClientId'),
                 appsettings.get('ClientSecret'))
 
+        if use_async:
+            sds_client = BlockingSdsClient(sds_client)
+        if instrumentation is not None:
+            sds_client = instrumentation.instrument(sds_client)
+        if cache is not None:
+            sds_client = cache.wrap(sds_client)
+        if metadata_cache is not None:
+            sds_client = metadata_cache.wrap(sds_client)
+
         print(r'------------------------------------------')
         print(r'  _________    .___     __________        ')
         print(r' /   _____/  __| _/_____\______   \___.__.')
@@ -257,6 +339,7 @@ def main(test=False):
         print()
 
         # Step 2
+        step(2)
         #######################################################################
         # SdsType get or creation
         #######################################################################
@@ -266,6 +349,7 @@ def main(test=False):
         assert wave_type.Id == SAMPLE_TYPE_ID, 'Error getting back wave Type'
 
         # Step 3
+        step(3)
         #######################################################################
         # Sds Stream creation
         #######################################################################
@@ -275,6 +359,7 @@ def main(test=False):
         sds_client.Streams.createOrUpdateStream(namespace_id, stream)
 
         # Step 4
+        step(4)
         #######################################################################
         # CRUD operations for events
         #######################################################################
@@ -284,13 +369,14 @@ def main(test=False):
         event = next_wave(0, 2.0)
         sds_client.Streams.insertValues(namespace_id, stream.Id, [event])
 
-        # Insert a list of events
-        waves = []
-        for error in range(2, 20, 2):
-            waves.append(next_wave(error, 2.0))
-        sds_client.Streams.insertValues(namespace_id, stream.Id, waves)
+        # Insert a list of events, generated and serialized as a WaveBatch of
+        # the type of the stream
+        waves = next_waves(range(2, 20, 2), 2.0, WaveData)
+        sds_client.Streams.insertValues(
+            namespace_id, stream.Id, waves.toJson())
 
         # Step 5
+        step(5)
         # Get the last inserted event in a stream
         print('Getting latest event')
         wave = sds_client.Streams.getLastValue(
@@ -298,23 +384,31 @@ def main(test=False):
         print(to_string(wave))
         print()
 
-        # Get all the events
-        waves = sds_client.Streams.getWindowValues(
-            namespace_id, stream.Id, 0, 180, WaveData)
+        # Get all the events, a page at a time
         print('Getting all events')
-        print(f'Total events found: {str(len(waves))}')
-        for wave in waves:
+        total = 0
+        for wave in iter_window(sds_client, namespace_id, stream.Id, 0, 180,
+                                WaveData, page_size=100):
             print(to_string(wave))
+            total += 1
+        print(f'Total events found: {str(total)}')
         print()
 
         # Step 6
-        # get all values with headers
-        waves = sds_client.Streams.getWindowValuesForm(
-            namespace_id, stream.Id, None, 0, 180, 'tableh')
+        step(6)
+        # get all values with headers, as the raw response body
+        waves = get_window_table(sds_client, namespace_id, stream.Id, 0, 180)
         print('Getting all events in table format')
-        print(waves)
+        print(waves.decode())
+
+        # Decode the table into NumPy columns for analysis, parsing the
+        # numbers of the body in one pass
+        columns = decode_table(waves)
+        print(f'Decoded {len(columns.get("Order", []))} rows into the '
+              f'columns {", ".join(columns)}')
 
         # Step 7
+        step(7)
         print('Updating events')
         # Update the first event
         event = next_wave(0, 4.0)
@@ -322,44 +416,42 @@ def main(test=False):
 
         # Update the rest of the events, adding events that have no prior
         # index entry
-        updated_events = []
-        for error in range(2, 40, 2):
-            event = next_wave(error, 4.0)
-            updated_events.append(event)
+        updated_events = next_waves(range(2, 40, 2), 4.0, WaveData)
         sds_client.Streams.updateValues(
-            namespace_id, stream.Id, updated_events)
+            namespace_id, stream.Id, updated_events.toJson())
 
         # Get all the events
-        waves = sds_client.Streams.getWindowValues(namespace_id, stream.Id,
-                                                   0, 40, WaveData)
         print('Getting updated events')
-        print(f'Total events found: {str(len(waves))}')
-        for wave in waves:
+        total = 0
+        for wave in iter_window(sds_client, namespace_id, stream.Id, 0, 40,
+                                WaveData, page_size=100):
             print(to_string(wave))
+            total += 1
+        print(f'Total events found: {str(total)}')
         print()
 
         # Step 8
+        step(8)
         print('Replacing events')
         # replace one value
         event = next_wave(0, 5.0)
         sds_client.Streams.replaceValues(namespace_id, stream.Id, [event])
 
         # replace multiple values
-        replaced_events = []
-        for error in range(2, 40, 2):
-            event = next_wave(error, 5.0)
-            replaced_events.append(event)
+        replaced_events = next_waves(range(2, 40, 2), 5.0, WaveData)
         sds_client.Streams.replaceValues(
-            namespace_id, stream.Id, replaced_events)
+            namespace_id, stream.Id, replaced_events.toJson())
 
         # Step 9
+        step(9)
         # Get all the events
-        waves = sds_client.Streams.getWindowValues(namespace_id, stream.Id,
-                                                   0, 180, WaveData)
         print('Getting replaced events')
-        print(f'Total events found: {str(len(waves))}')
-        for wave in waves:
+        total = 0
+        for wave in iter_window(sds_client, namespace_id, stream.Id, 0, 180,
+                                WaveData, page_size=100):
             print(to_string(wave))
+            total += 1
+        print(f'Total events found: {str(total)}')
         print()
 
         retrieved_interpolated = sds_client.Streams.getRangeValuesInterpolated(
@@ -370,6 +462,7 @@ def main(test=False):
         print()
 
         # Step 10
+        step(10)
         # Filtering from all values
         print('Getting filtered events')
         filtered_events = sds_client.Streams.getWindowValues(
@@ -381,6 +474,7 @@ def main(test=False):
         print()
 
         # Step 11
+        step(11)
         # Sampling from all values
         print('Getting sampled values')
         sampled_waves = sds_client.Streams.getSampledValues(
@@ -392,6 +486,7 @@ def main(test=False):
         print()
 
         # Step 12
+        step(12)
         #######################################################################
         # Property Overrides
         #######################################################################
@@ -437,6 +532,7 @@ def main(test=False):
                 f'Order: {wave.order}: Radians: {wave.radians} Cos: {wave.cos}')
 
         # Step 13
+        step(13)
         #######################################################################
         # Stream Views
         #######################################################################
@@ -527,6 +623,7 @@ def main(test=False):
                 print(f'{prop.SourceId} => Not mapped')
 
         # Step 14
+        step(14)
         print('We will now update the stream type based on the streamview')
 
         first_val = sds_client.Streams.getFirstValue(namespace_id, stream.Id,
@@ -547,6 +644,7 @@ def main(test=False):
             f'{str(first_val_updated)}')
 
         # Step 15
+        step(15)
         types = sds_client.Types.getTypes(namespace_id, 0, 100)
         types_query = sds_client.Types.getTypes(
             namespace_id, 0, 100, 'Id:*Target*')
@@ -562,6 +660,7 @@ def main(test=False):
 
         if tenant_id != 'default':
             # Step 16
+            step(16)
             #######################################################################
             # Tags and Metadata (ADH ONLY)
             #######################################################################
@@ -596,6 +695,7 @@ def main(test=False):
             print()
 
             # Step 17
+            step(17)
             #######################################################################
             # Update Metadata (ADH ONLY)
             #######################################################################
@@ -630,6 +730,7 @@ def main(test=False):
         #######################################################################
         if (community_id):
             # Step 18
+            step(18)
             print()
             print('Get tenant roles')
             roles = sds_client.Roles.getRoles()
@@ -655,6 +756,7 @@ def main(test=False):
                 namespace_id, SAMPLE_STREAM_ID, patch)
 
             # Step 19
+            step(19)
             print()
             print('Searching the community')
             community_streams = sds_client.Communities.getCommunityStreams(
@@ -664,6 +766,7 @@ def main(test=False):
                 print(s.Id)
 
             # Step 20
+            step(20)
             print()
             print('Getting stream data from the community stream')
             community_stream = community_streams[0]
@@ -673,6 +776,7 @@ def main(test=False):
             print(community_data.toJson())
 
         # Step 21
+        step(21)
         #######################################################################
         # Delete events
         #######################################################################
@@ -693,6 +797,7 @@ def main(test=False):
         print('All values deleted successfully!')
 
         # Step 22
+        step(22)
         print('Adding a stream with a secondary index.')
         index = SdsStreamIndex('Radians')
         secondary = SdsStream(STREAM_ID_SECONDARY,
@@ -740,6 +845,7 @@ def main(test=False):
             f'New one: {secondary_length}')
 
         # Step 23
+        step(23)
         # Adding Compound Index Type
         print('Creating an SdsType with a compound index')
         type_compound = get_wave_compound_data_type(COMPOUND_TYPE_ID)
@@ -751,16 +857,11 @@ def main(test=False):
         sds_client.Streams.createOrUpdateStream(namespace_id, stream_compound)
 
         # Step 24
+        step(24)
         print('Inserting data')
-        waves = []
-        waves.append(next_wave(1, 10))
-        waves.append(next_wave(2, 2))
-        waves.append(next_wave(3, 1))
-        waves.append(next_wave(10, 3))
-        waves.append(next_wave(10, 8))
-        waves.append(next_wave(10, 10))
+        waves = next_waves([1, 2, 3, 10, 10, 10], [10, 2, 1, 3, 8, 10])
         sds_client.Streams.insertValues(
-            namespace_id, STREAM_ID_COMPOUND, waves)
+            namespace_id, STREAM_ID_COMPOUND, waves.toJson())
 
         latest_compound = sds_client.Streams.getLastValue(
             namespace_id, STREAM_ID_COMPOUND, None)
@@ -783,35 +884,45 @@ def main(test=False):
 
     finally:
         # Step 25
+        step(25)
 
         #######################################################################
         # SdsType, SdsStream, and SdsStreamView deletion
         #######################################################################
         # Clean up the remaining artifacts
         print('Cleaning up')
-        print('Deleting the stream')
-        suppress_error(lambda: sds_client.Streams.deleteStream(
-            namespace_id, SAMPLE_STREAM_ID))
-        suppress_error(lambda: sds_client.Streams.deleteStream(
-            namespace_id, STREAM_ID_SECONDARY))
-        suppress_error(lambda: sds_client.Streams.deleteStream(
-            namespace_id, STREAM_ID_COMPOUND))
-
-        print('Deleting the streamViews')
-        suppress_error(lambda: sds_client.Streams.deleteStreamView(
-            namespace_id, SAMPLE_STREAM_VIEW_ID))
-        suppress_error(lambda: sds_client.Streams.deleteStreamView(
-            namespace_id, SAMPLE_STREAM_VIEW_INT_ID))
-
-        print('Deleting the types')
-        suppress_error(lambda: sds_client.Types.deleteType(
-            namespace_id, SAMPLE_TYPE_ID))
-        suppress_error(lambda: sds_client.Types.deleteType(
-            namespace_id, SAMPLE_TARGET_TYPE_ID))
-        suppress_error(lambda: sds_client.Types.deleteType(
-            namespace_id, SAMPLE_INTEGER_TYPE_ID))
-        suppress_error(lambda: sds_client.Types.deleteType(
-            namespace_id, COMPOUND_TYPE_ID))
+        streams = [SAMPLE_STREAM_ID, STREAM_ID_SECONDARY, STREAM_ID_COMPOUND]
+        stream_views = [SAMPLE_STREAM_VIEW_ID, SAMPLE_STREAM_VIEW_INT_ID]
+        types = [SAMPLE_TYPE_ID, SAMPLE_TARGET_TYPE_ID, SAMPLE_INTEGER_TYPE_ID,
+                 COMPOUND_TYPE_ID]
+
+        # Streams must be gone before the streamViews and types they use
+        outcomes = delete_in_tiers([
+            [(f'stream {stream_id}',
+              lambda stream_id=stream_id: sds_client.Streams.deleteStream(
+                  namespace_id, stream_id))
+             for stream_id in streams],
+            [(f'streamView {view_id}',
+              lambda view_id=view_id: sds_client.StreamViews.deleteStreamView(
+                  namespace_id, view_id))
+             for view_id in stream_views],
+            [(f'type {type_id}',
+              lambda type_id=type_id: sds_client.Types.deleteType(
+                  namespace_id, type_id))
+             for type_id in types],
+        ])
+        for name, error, seconds in outcomes:
+            if error is None:
+                print(f'Deleted the {name} in {seconds * 1000:.0f} ms')
+            else:
+                print(f'Encountered Error deleting the {name}: {error}')
+
+        if use_async and sds_client is not None:
+            sds_client.close()
+        if instrumentation is not None:
+            if sds_client is not None:
+                instrumentation.restore(sds_client)
+            instrumentation.stop()
 
         if test and exception is not None:
             raise exception
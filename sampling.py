@@ -0,0 +1,71 @@
+"""Local sampling of columnar windows, as SDS samples a stream
+
+The functions work on a WaveBatch, or on a dict of NumPy columns keyed by
+SDS property name, sorted by a single index column. Each interval is
+reduced with NumPy, without Python objects per event, so a window read once
+can be sampled again at every zoom level without further SDS calls
+"""
+
+import numpy as np
+
+from interpolation import as_columns, take
+
+
+def sample_positions(keys, values, start, end, intervals):
+    """Returns the sorted positions of the events sampled from keys
+
+    start to end is split into intervals of equal width, and the first,
+    last, minimum and maximum event of each is kept, where values holds the
+    columns to take the minimum and maximum of. NaN values are ignored, and
+    ties keep the first event, as getSampledValues does
+    """
+    low = np.searchsorted(keys, start, 'left')
+    high = np.searchsorted(keys, end, 'right')
+    if high <= low or intervals < 1:
+        return np.empty(0, dtype=np.intp)
+
+    # Each interval holds the events from its lower edge, up to the next
+    # edge; the last interval also holds the events at end
+    width = (end - start) / intervals
+    edges = start + width * np.arange(intervals)
+    bounds = np.append(np.searchsorted(keys[low:high], edges, 'left'),
+                       high - low)
+    starts, stops = bounds[:-1], bounds[1:]
+    filled = stops > starts
+    starts, stops = starts[filled], stops[filled]
+
+    picks = [starts, stops - 1]
+    lengths = stops - starts
+    for column in values:
+        column = column[low:high]
+        if not (np.issubdtype(column.dtype, np.number)
+                and not np.issubdtype(column.dtype, np.complexfloating)):
+            continue
+        for reduce in (np.fmin, np.fmax):
+            extremes = reduce.reduceat(column, starts)
+            matches = np.flatnonzero(column == np.repeat(extremes, lengths))
+            # The first match at or after the start of each interval, when
+            # it is inside the interval; an interval of NaN has none
+            found = np.searchsorted(matches, starts, 'left')
+            found = np.minimum(found, len(matches) - 1)
+            if len(matches):
+                positions = matches[found]
+                picks.append(positions[positions < stops])
+    return low + np.unique(np.concatenate(picks))
+
+
+def sample(window, start, end, sample_by, intervals, index=None):
+    """Samples the events of a window from start to end
+
+    sample_by names the properties to take the minimum and maximum of, as a
+    comma separated string or a list, as getSampledValues does. Returns a
+    dict of the sampled rows, in index order
+    """
+    columns, index = as_columns(window, index)
+    if isinstance(sample_by, str):
+        sample_by = sample_by.split(',')
+    names = {name.lower(): name for name in columns}
+    values = [columns[names[name.strip().lower()]] for name in sample_by]
+    positions = sample_positions(columns[index], values, start, end,
+                                 intervals)
+    return take(columns, positions)
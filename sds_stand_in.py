@@ -0,0 +1,949 @@
+"""In-process stand-in for the SDS REST endpoints exercised by the sample
+
+The stand-in keeps types, streams, stream views and stream data in memory
+and serves them over HTTP on localhost, so main() and the benchmarks can run
+without an SDS tenant. It is not a complete SDS implementation: it covers the
+calls the sample makes, with the default behaviors the sample relies on.
+"""
+
+import bisect
+import fnmatch
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import jsonpatch
+
+INTEGER_CODES = {'Int16', 'Int32', 'Int64', 'UInt16', 'UInt32', 'UInt64',
+                 'Byte', 'SByte'}
+FLOAT_CODES = {'Double', 'Single', 'Decimal'}
+INTERPOLATION_MODES = ['Continuous', 'StepwiseContinuousLeading',
+                       'StepwiseContinuousTrailing', 'Discrete',
+                       'ContinuousNullableLeading',
+                       'ContinuousNullableTrailing']
+BOUNDARY_TYPES = ['Exact', 'Inside', 'Outside', 'ExactOrCalculated']
+EXTRAPOLATION_MODES = ['All', 'None', 'Forward', 'Backward']
+FIELD_REMOVE = 2
+FIELD_RENAME = 4
+FIELD_CONVERSION = 16
+
+
+class StandInError(Exception):
+    """An SDS error response"""
+
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+def enum_name(value, names, default):
+    """Reads an SDS enumeration sent either by name or by value"""
+    if value is None or value == '':
+        return default
+    if isinstance(value, int) or str(value).isdigit():
+        return names[int(value)]
+    for name in names:
+        if name.lower() == str(value).lower():
+            return name
+    raise StandInError(400, f'Unknown value {value}')
+
+
+def type_code(sds_type):
+    """Returns the SdsTypeCode name of a type definition"""
+    code = sds_type.get('SdsTypeCode', 'Object')
+    return code if isinstance(code, str) else str(code)
+
+
+def convert(value, code):
+    """Converts a JSON value into the Python value of an SdsTypeCode"""
+    if value is None:
+        return None
+    if code in INTEGER_CODES:
+        return int(round(float(value)))
+    if code in FLOAT_CODES:
+        return float(value)
+    if code == 'Boolean':
+        return value if isinstance(value, bool) else str(value).lower() == 'true'
+    return value
+
+
+def default_value(code):
+    """Returns the default value SDS stores for a missing property"""
+    if code in INTEGER_CODES:
+        return 0
+    if code in FLOAT_CODES:
+        return 0.0
+    if code == 'Boolean':
+        return False
+    return None
+
+
+class TypeLayout:
+    """The properties and key of a stored SdsType"""
+
+    def __init__(self, sds_type):
+        self.id = sds_type['Id']
+        self.properties = sds_type.get('Properties') or []
+        self.ids = [prop['Id'] for prop in self.properties]
+        self.codes = {prop['Id']: type_code(prop.get('SdsType') or {})
+                      for prop in self.properties}
+        self.by_lower = {prop_id.lower(): prop_id for prop_id in self.ids}
+        keys = [(prop.get('Order') or 0, position, prop['Id'])
+                for position, prop in enumerate(self.properties)
+                if prop.get('IsKey')]
+        self.keys = [prop_id for _, _, prop_id in sorted(keys)]
+        self.modes = {
+            prop['Id']: enum_name(prop.get('InterpolationMode'),
+                                  INTERPOLATION_MODES, None)
+            for prop in self.properties}
+        self.default_mode = enum_name(sds_type.get('InterpolationMode'),
+                                      INTERPOLATION_MODES, 'Continuous')
+        self.extrapolation = enum_name(sds_type.get('ExtrapolationMode'),
+                                       EXTRAPOLATION_MODES, 'All')
+
+    def property_id(self, name):
+        """Finds a property by name, ignoring case as SDS does"""
+        prop_id = self.by_lower.get(str(name).lower())
+        if prop_id is None:
+            raise StandInError(400, f'Type {self.id} has no property {name}')
+        return prop_id
+
+    def event(self, content):
+        """Converts posted JSON into a stored event of this type"""
+        if not isinstance(content, dict):
+            raise StandInError(400, 'Events must be JSON objects')
+        values = {name.lower(): value for name, value in content.items()}
+        event = {}
+        for prop_id in self.ids:
+            code = self.codes[prop_id]
+            value = values.get(prop_id.lower())
+            event[prop_id] = (default_value(code) if value is None
+                              else convert(value, code))
+        return event
+
+    def key(self, event):
+        """Returns the index key of an event, as a tuple"""
+        return tuple(event[prop_id] for prop_id in self.keys)
+
+    def parse_key(self, text):
+        """Parses an index from a query string, like '10' or '2|1'"""
+        parts = str(text).split('|')
+        if len(parts) != len(self.keys):
+            raise StandInError(400, f'Index {text} does not match {self.id}')
+        try:
+            return tuple(convert(part, self.codes[prop_id])
+                         for part, prop_id in zip(parts, self.keys))
+        except ValueError:
+            raise StandInError(400, f'Index {text} is not valid for {self.id}')
+
+
+class StreamData:
+    """The events of a stream, ordered by their index key"""
+
+    def __init__(self):
+        self.keys = []
+        self.events = []
+
+    def find(self, key):
+        """Returns the position of key, or None"""
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return position
+        return None
+
+    def put(self, key, event):
+        """Inserts or overwrites the event at key"""
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            self.events[position] = event
+        else:
+            self.keys.insert(position, key)
+            self.events.insert(position, event)
+
+    def remove(self, position):
+        """Removes the event at a position"""
+        del self.keys[position]
+        del self.events[position]
+
+    def window(self, start, end):
+        """Returns the positions of the events from start to end, inclusive"""
+        return range(bisect.bisect_left(self.keys, start),
+                     bisect.bisect_right(self.keys, end))
+
+
+class Namespace:
+    """The SDS objects of one tenant namespace"""
+
+    def __init__(self):
+        self.types = {}
+        self.streams = {}
+        self.stream_views = {}
+        self.data = {}
+        self.tags = {}
+        self.metadata = {}
+
+
+class FilterParser:
+    """Parses the SDS filter syntax into a predicate over events"""
+
+    TOKEN = re.compile(r"\s*(?:(\()|(\))|'((?:[^']|'')*)'|"
+                       r"([-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)|([A-Za-z_][\w.]*))")
+    COMPARISONS = {
+        'eq': lambda a, b: a == b, 'ne': lambda a, b: a != b,
+        'lt': lambda a, b: a < b, 'le': lambda a, b: a <= b,
+        'gt': lambda a, b: a > b, 'ge': lambda a, b: a >= b,
+    }
+
+    def __init__(self, text, layout):
+        self.layout = layout
+        self.tokens = []
+        position = 0
+        text = text.strip()
+        while position < len(text):
+            match = self.TOKEN.match(text, position)
+            if match is None or match.end() == position:
+                raise StandInError(400, f'Invalid filter: {text}')
+            position = match.end()
+            if match.group(1) or match.group(2):
+                self.tokens.append(('symbol', match.group(1) or match.group(2)))
+            elif match.group(3) is not None:
+                self.tokens.append(('value', match.group(3).replace("''", "'")))
+            elif match.group(4):
+                self.tokens.append(('value', float(match.group(4))))
+            else:
+                self.tokens.append(('word', match.group(5)))
+        self.position = 0
+
+    def parse(self):
+        """Returns the predicate of the whole filter"""
+        predicate = self.parse_or()
+        if self.position != len(self.tokens):
+            raise StandInError(400, 'Invalid filter')
+        return predicate
+
+    def peek_word(self, *words):
+        if self.position < len(self.tokens):
+            kind, value = self.tokens[self.position]
+            if kind == 'word' and value.lower() in words:
+                self.position += 1
+                return value.lower()
+        return None
+
+    def parse_or(self):
+        predicate = self.parse_and()
+        while self.peek_word('or'):
+            left, right = predicate, self.parse_and()
+            predicate = lambda event, l=left, r=right: l(event) or r(event)
+        return predicate
+
+    def parse_and(self):
+        predicate = self.parse_not()
+        while self.peek_word('and'):
+            left, right = predicate, self.parse_not()
+            predicate = lambda event, l=left, r=right: l(event) and r(event)
+        return predicate
+
+    def parse_not(self):
+        if self.peek_word('not'):
+            inner = self.parse_not()
+            return lambda event: not inner(event)
+        return self.parse_comparison()
+
+    def next_token(self):
+        if self.position >= len(self.tokens):
+            raise StandInError(400, 'Invalid filter')
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse_comparison(self):
+        kind, value = self.next_token()
+        if (kind, value) == ('symbol', '('):
+            predicate = self.parse_or()
+            if self.next_token() != ('symbol', ')'):
+                raise StandInError(400, 'Invalid filter')
+            return predicate
+        if kind != 'word':
+            raise StandInError(400, 'Invalid filter')
+        prop_id = self.layout.property_id(value)
+        operator = self.peek_word(*self.COMPARISONS)
+        if operator is None:
+            raise StandInError(400, 'Invalid filter')
+        _, operand = self.next_token()
+        compare = self.COMPARISONS[operator]
+
+        def predicate(event):
+            try:
+                return bool(compare(event[prop_id], operand))
+            except TypeError:
+                return False
+        return predicate
+
+
+class SdsStandIn:
+    """Serves the SDS endpoints used by the sample from memory
+
+    latency is added to every request in seconds, and bandwidth, in bytes per
+    second, limits how fast request and response bodies are transferred
+    """
+
+    def __init__(self, latency=0.0, bandwidth=None, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.request_count = 0
+        self.lock = threading.RLock()
+        self.namespaces = {}
+        self.__server = ThreadingHTTPServer((host, port), StandInHandler)
+        self.__server.daemon_threads = True
+        self.__server.stand_in = self
+        self.__thread = None
+
+    @property
+    def uri(self):
+        """The base url to give an EDSClient or ADHClient"""
+        host, port = self.__server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """Starts serving requests on a background thread"""
+        self.__thread = threading.Thread(target=self.__server.serve_forever,
+                                         daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving requests"""
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def appsettings(self, tenant_id='default', namespace_id='default'):
+        """Returns appsettings for main() pointing at the stand-in
+
+        Any tenant other than default is served as a CONNECT data services
+        tenant, with the stand-in also issuing client credential tokens
+        """
+        return {
+            'Resource': self.uri,
+            'ApiVersion': 'v1',
+            'TenantId': tenant_id,
+            'NamespaceId': namespace_id,
+            'CommunityId': None,
+            'ClientId': None if tenant_id == 'default' else 'stand-in',
+            'ClientSecret': None if tenant_id == 'default' else 'stand-in',
+        }
+
+    def namespace(self, tenant_id, namespace_id):
+        """Returns the objects of a namespace, creating it on first use"""
+        return self.namespaces.setdefault((tenant_id.lower(), namespace_id),
+                                          Namespace())
+
+    def throttle(self, size):
+        """Waits out the injected latency and bandwidth of a request"""
+        delay = self.latency
+        if self.bandwidth:
+            delay += size / self.bandwidth
+        if delay > 0:
+            time.sleep(delay)
+
+    def handle(self, method, path, query, body):
+        """Serves one request, returning (status, JSON content)"""
+        segments = [unquote(segment) for segment in path.strip('/').split('/')]
+        if segments[:1] == ['identity']:
+            return self.identity(method, segments)
+        if (len(segments) < 7 or segments[0] != 'api'
+                or segments[2].lower() != 'tenants'
+                or segments[4].lower() != 'namespaces'):
+            raise StandInError(404, f'No route for {path}')
+        namespace = self.namespace(segments[3], segments[5])
+        collection, rest = segments[6].lower(), segments[7:]
+        with self.lock:
+            if collection == 'types':
+                return self.types(namespace, method, rest, query, body)
+            if collection == 'streams':
+                return self.streams(namespace, method, rest, query, body)
+            if collection == 'streamviews':
+                return self.stream_views(namespace, method, rest, body)
+        raise StandInError(404, f'No route for {path}')
+
+    def identity(self, method, segments):
+        """Serves client credential tokens for CONNECT data services tenants"""
+        if segments[1:] == ['.well-known', 'openid-configuration']:
+            return 200, {'token_endpoint': f'{self.uri}/identity/connect/token'}
+        if segments[1:] == ['connect', 'token'] and method == 'POST':
+            return 200, {'access_token': 'stand-in', 'expires_in': 3600,
+                         'token_type': 'Bearer'}
+        raise StandInError(404, 'No such identity route')
+
+    # Types
+
+    def types(self, namespace, method, rest, query, body):
+        """Serves /Types"""
+        if not rest:
+            if method != 'GET':
+                raise StandInError(405, 'Method not allowed')
+            return 200, page(list(namespace.types.values()), query)
+        type_id = rest[0]
+        if method == 'GET':
+            return 200, self.lookup(namespace.types, type_id, 'type')
+        if method == 'POST':
+            if type_id in namespace.types:
+                return 200, namespace.types[type_id]
+            sds_type = json.loads(body)
+            if sds_type.get('Id') != type_id:
+                raise StandInError(400, 'The type id does not match the url')
+            TypeLayout(sds_type)
+            namespace.types[type_id] = sds_type
+            return 201, sds_type
+        if method == 'DELETE':
+            self.lookup(namespace.types, type_id, 'type')
+            users = [stream['Id'] for stream in namespace.streams.values()
+                     if stream['TypeId'] == type_id]
+            users += [view['Id'] for view in namespace.stream_views.values()
+                      if type_id in (view['SourceTypeId'], view['TargetTypeId'])]
+            if users:
+                raise StandInError(
+                    409, f'Type {type_id} is in use by {", ".join(users)}')
+            del namespace.types[type_id]
+            return 204, None
+        raise StandInError(405, 'Method not allowed')
+
+    # Stream views
+
+    def stream_views(self, namespace, method, rest, body):
+        """Serves /StreamViews"""
+        if not rest:
+            if method != 'GET':
+                raise StandInError(405, 'Method not allowed')
+            return 200, list(namespace.stream_views.values())
+        view_id = rest[0]
+        if rest[1:] == ['Map'] and method == 'GET':
+            view = self.lookup(namespace.stream_views, view_id, 'stream view')
+            return 200, self.view_map(namespace, view)
+        if method == 'GET':
+            return 200, self.lookup(namespace.stream_views, view_id,
+                                    'stream view')
+        if method in ('POST', 'PUT'):
+            if method == 'POST' and view_id in namespace.stream_views:
+                return 200, namespace.stream_views[view_id]
+            view = json.loads(body)
+            for type_id in (view.get('SourceTypeId'), view.get('TargetTypeId')):
+                if type_id not in namespace.types:
+                    raise StandInError(400, f'Type {type_id} does not exist')
+            namespace.stream_views[view_id] = view
+            return (201, view) if method == 'POST' else (204, None)
+        if method == 'DELETE':
+            self.lookup(namespace.stream_views, view_id, 'stream view')
+            del namespace.stream_views[view_id]
+            return 204, None
+        raise StandInError(405, 'Method not allowed')
+
+    def view_map(self, namespace, view):
+        """Resolves which target property each source property maps to"""
+        source = TypeLayout(namespace.types[view['SourceTypeId']])
+        target = TypeLayout(namespace.types[view['TargetTypeId']])
+        mapping = {}
+        for prop in view.get('Properties') or []:
+            mapping[source.property_id(prop['SourceId'])] = \
+                target.property_id(prop['TargetId'])
+        # Unmapped properties match by name, then by position and type
+        unused = [prop_id for prop_id in target.ids
+                  if prop_id not in mapping.values()]
+        for prop_id in source.ids:
+            if prop_id not in mapping and prop_id.lower() in (
+                    candidate.lower() for candidate in unused):
+                mapping[prop_id] = target.property_id(prop_id)
+                unused.remove(mapping[prop_id])
+        if not view.get('Properties'):
+            for prop_id in source.ids:
+                if prop_id in mapping:
+                    continue
+                for candidate in unused:
+                    if target.codes[candidate] == source.codes[prop_id]:
+                        mapping[prop_id] = candidate
+                        unused.remove(candidate)
+                        break
+
+        properties = []
+        for prop_id in source.ids:
+            if prop_id not in mapping:
+                properties.append({'SourceId': prop_id, 'Mode': FIELD_REMOVE})
+                continue
+            target_id = mapping[prop_id]
+            mode = 0
+            if target_id != prop_id:
+                mode |= FIELD_RENAME
+            if target.codes[target_id] != source.codes[prop_id]:
+                mode |= FIELD_CONVERSION
+            properties.append({'SourceId': prop_id, 'TargetId': target_id,
+                               'Mode': mode})
+        return {'SourceTypeId': source.id, 'TargetTypeId': target.id,
+                'Properties': properties}
+
+    def view_events(self, namespace, view_id, events):
+        """Maps events of a stream view's source type onto its target type"""
+        view = self.lookup(namespace.stream_views, view_id, 'stream view')
+        target = TypeLayout(namespace.types[view['TargetTypeId']])
+        mapped = []
+        properties = [(prop['SourceId'], prop['TargetId'])
+                      for prop in self.view_map(namespace, view)['Properties']
+                      if 'TargetId' in prop]
+        for event in events:
+            mapped.append(target.event(
+                {target_id: event[source_id]
+                 for source_id, target_id in properties}))
+        return mapped
+
+    # Streams
+
+    def streams(self, namespace, method, rest, query, body):
+        """Serves /Streams"""
+        if not rest:
+            if method != 'GET':
+                raise StandInError(405, 'Method not allowed')
+            return 200, page(list(namespace.streams.values()), query)
+        stream_id, rest = rest[0], rest[1:]
+        if not rest:
+            return self.stream(namespace, method, stream_id, body)
+
+        stream = self.lookup(namespace.streams, stream_id, 'stream')
+        resource = rest[0].lower()
+        if resource == 'data':
+            return self.data(namespace, stream, method, [
+                part.lower() for part in rest[1:]], query, body)
+        if resource == 'type' and method == 'PUT':
+            return self.update_stream_type(namespace, stream,
+                                           first(query, 'streamViewId'))
+        if resource == 'type' and method == 'GET':
+            return 200, self.lookup(namespace.types, stream['TypeId'], 'type')
+        if resource == 'tags':
+            if method == 'PUT':
+                namespace.tags[stream_id] = json.loads(body)
+                return 204, None
+            if method == 'GET':
+                return 200, namespace.tags.get(stream_id, [])
+        if resource == 'metadata':
+            metadata = namespace.metadata.setdefault(stream_id, {})
+            if method == 'PUT':
+                namespace.metadata[stream_id] = json.loads(body)
+                return 204, None
+            if method == 'PATCH':
+                namespace.metadata[stream_id] = jsonpatch.apply_patch(
+                    metadata, json.loads(body))
+                return 204, None
+            if method == 'GET' and len(rest) == 2:
+                if rest[1] not in metadata:
+                    raise StandInError(404, f'No metadata {rest[1]}')
+                return 200, metadata[rest[1]]
+            if method == 'GET':
+                return 200, metadata
+        raise StandInError(404, f'No route for stream {stream_id}')
+
+    def stream(self, namespace, method, stream_id, body):
+        """Serves /Streams/{id}"""
+        if method == 'GET':
+            return 200, self.lookup(namespace.streams, stream_id, 'stream')
+        if method == 'DELETE':
+            self.lookup(namespace.streams, stream_id, 'stream')
+            del namespace.streams[stream_id]
+            namespace.data.pop(stream_id, None)
+            namespace.tags.pop(stream_id, None)
+            namespace.metadata.pop(stream_id, None)
+            return 204, None
+        if method not in ('POST', 'PUT'):
+            raise StandInError(405, 'Method not allowed')
+
+        stream = json.loads(body)
+        if stream.get('Id') != stream_id:
+            raise StandInError(400, 'The stream id does not match the url')
+        existing = namespace.streams.get(stream_id)
+        if method == 'POST' and existing is not None:
+            if existing['TypeId'] != stream.get('TypeId'):
+                raise StandInError(
+                    409, f'Stream {stream_id} exists with another type')
+            return 200, existing
+        if stream.get('TypeId') not in namespace.types:
+            raise StandInError(400, f'Type {stream.get("TypeId")} does not exist')
+        if existing is not None and existing['TypeId'] != stream['TypeId']:
+            raise StandInError(
+                400, 'Change the type of a stream through its Type endpoint')
+        layout = TypeLayout(namespace.types[stream['TypeId']])
+        for index in stream.get('Indexes') or []:
+            layout.property_id(index['SdsTypePropertyId'])
+        stream.setdefault('Indexes', [])
+        stream.setdefault('PropertyOverrides', [])
+        # SDS returns the enumerations of a stream by value
+        for content, key, names in (
+                [(stream, 'InterpolationMode', INTERPOLATION_MODES),
+                 (stream, 'ExtrapolationMode', EXTRAPOLATION_MODES)]
+                + [(override, 'InterpolationMode', INTERPOLATION_MODES)
+                   for override in stream['PropertyOverrides']]):
+            if content.get(key) is not None:
+                content[key] = names.index(enum_name(content[key], names,
+                                                     None))
+        namespace.streams[stream_id] = stream
+        namespace.data.setdefault(stream_id, StreamData())
+        return (201, stream) if method == 'POST' else (204, None)
+
+    def update_stream_type(self, namespace, stream, view_id):
+        """Converts a stream and its data to the target type of a view"""
+        view = self.lookup(namespace.stream_views, view_id, 'stream view')
+        if view['SourceTypeId'] != stream['TypeId']:
+            raise StandInError(
+                400, f'Stream view {view_id} does not apply to this stream')
+        old = namespace.data[stream['Id']]
+        target = TypeLayout(namespace.types[view['TargetTypeId']])
+        data = StreamData()
+        for event in self.view_events(namespace, view_id, old.events):
+            data.put(target.key(event), event)
+        namespace.data[stream['Id']] = data
+        stream['TypeId'] = target.id
+        stream['Indexes'] = []
+        stream['PropertyOverrides'] = []
+        return 204, None
+
+    # Stream data
+
+    def data(self, namespace, stream, method, route, query, body):
+        """Serves /Streams/{id}/Data and the read routes beneath it"""
+        layout = TypeLayout(namespace.types[stream['TypeId']])
+        data = namespace.data[stream['Id']]
+
+        if method in ('POST', 'PUT'):
+            events = [layout.event(event) for event in json.loads(body)]
+            keys = [layout.key(event) for event in events]
+            if method == 'POST':
+                duplicates = [key for key in keys if data.find(key) is not None]
+                if duplicates or len(set(keys)) != len(keys):
+                    raise StandInError(409, 'Events already exist at an index')
+            elif first(query, 'allowCreate', 'true').lower() == 'false':
+                if any(data.find(key) is None for key in keys):
+                    raise StandInError(404, 'Events to replace do not exist')
+            for key, event in zip(keys, events):
+                data.put(key, event)
+            return 204, None
+
+        if method == 'DELETE':
+            if 'index' in query:
+                for text in query['index']:
+                    position = data.find(layout.parse_key(text))
+                    if position is None:
+                        raise StandInError(404, f'No event at index {text}')
+                    data.remove(position)
+            else:
+                positions = data.window(
+                    layout.parse_key(first(query, 'startIndex')),
+                    layout.parse_key(first(query, 'endIndex')))
+                for position in reversed(positions):
+                    data.remove(position)
+            return 204, None
+
+        if method != 'GET':
+            raise StandInError(405, 'Method not allowed')
+        events = self.read(namespace, stream, layout, data, route, query)
+        view_id = first(query, 'streamViewId') or first(query, 'stream_view_id')
+        if view_id and isinstance(events, list):
+            events = self.view_events(namespace, view_id, events)
+        return 200, events
+
+    def read(self, namespace, stream, layout, data, route, query):
+        """Serves the GET routes of stream data"""
+        predicate = None
+        text = first(query, 'filter')
+        if text:
+            predicate = FilterParser(text, layout).parse()
+
+        if route == ['first']:
+            return data.events[0] if data.events else None
+        if route == ['last']:
+            return data.events[-1] if data.events else None
+        if route in (['transform', 'interpolated'], ['interpolated']):
+            return self.interpolated(stream, layout, data, query)
+        if route in (['sampled'], ['transform', 'sampled']):
+            return self.sampled(layout, data, query, predicate)
+        if route == ['transform']:
+            return self.range(stream, layout, data, query, predicate)
+        if route:
+            raise StandInError(404, 'No such data route')
+
+        if 'index' in query:
+            position = data.find(layout.parse_key(first(query, 'index')))
+            return None if position is None else data.events[position]
+
+        start = first(query, 'startIndex')
+        end = first(query, 'endIndex')
+        positions = data.window(layout.parse_key(start), layout.parse_key(end))
+        if 'count' in query:
+            return self.paged(data, positions, predicate, query)
+        events = [data.events[position] for position in positions]
+        if predicate is not None:
+            events = [event for event in events if predicate(event)]
+
+        form = (first(query, 'form') or '').lower()
+        if form in ('table', 'tableh'):
+            rows = [[event[prop_id] for prop_id in layout.ids]
+                    for event in events]
+            if form == 'tableh':
+                rows.insert(0, list(layout.ids))
+            return {'Name': layout.id,
+                    'Columns': {prop_id: layout.codes[prop_id]
+                                for prop_id in layout.ids},
+                    'Rows': rows}
+        return events
+
+    def paged(self, data, positions, predicate, query):
+        """Returns a page of a window and the token of the next one"""
+        count = int(first(query, 'count'))
+        token = first(query, 'continuationToken')
+        start = positions.start
+        if token:
+            after = tuple(json.loads(token))
+            start = max(start, bisect.bisect_right(data.keys, after))
+        results = []
+        next_token = None
+        for position in range(start, positions.stop):
+            event = data.events[position]
+            if predicate is not None and not predicate(event):
+                continue
+            if len(results) == count:
+                next_token = json.dumps(list(data.keys[position - 1]))
+                break
+            results.append(event)
+        return {'Results': results, 'ContinuationToken': next_token}
+
+    def range(self, stream, layout, data, query, predicate):
+        """Returns count events from a start index"""
+        start = layout.parse_key(first(query, 'startIndex'))
+        skip = int(first(query, 'skip', '0'))
+        count = int(first(query, 'count', '100'))
+        backwards = first(query, 'reversed', 'false').lower() == 'true'
+        boundary = enum_name(first(query, 'boundaryType')
+                             or first(query, 'boundary_type'),
+                             BOUNDARY_TYPES, 'Exact')
+
+        if backwards:
+            positions = range(bisect.bisect_right(data.keys, start) - 1, -1, -1)
+        else:
+            positions = range(bisect.bisect_left(data.keys, start),
+                              len(data.keys))
+        events = [data.events[position] for position in positions]
+        exact = data.find(start) is not None
+        if boundary == 'ExactOrCalculated' and not exact and data.events:
+            events.insert(0, self.calculate(stream, layout, data, start))
+        elif boundary == 'Outside' and not exact:
+            outside = positions.start + (1 if backwards else -1)
+            if 0 <= outside < len(data.events):
+                events.insert(0, data.events[outside])
+        if predicate is not None:
+            events = [event for event in events if predicate(event)]
+        return events[skip:skip + count]
+
+    def interpolated(self, stream, layout, data, query):
+        """Returns events interpolated at evenly spaced or listed indexes"""
+        if len(layout.keys) != 1:
+            raise StandInError(400, 'Interpolation needs a single index')
+        if 'index' in query:
+            indexes = [layout.parse_key(text) for text in query['index']]
+        else:
+            start = layout.parse_key(first(query, 'startIndex'))[0]
+            end = layout.parse_key(first(query, 'endIndex'))[0]
+            count = int(first(query, 'count'))
+            step = (end - start) / (count - 1) if count > 1 else 0
+            code = layout.codes[layout.keys[0]]
+            indexes = [(convert(start + step * position, code),)
+                       for position in range(count)]
+        if not data.events:
+            return []
+        return [self.calculate(stream, layout, data, index)
+                for index in indexes]
+
+    def calculate(self, stream, layout, data, key):
+        """Returns the stored or interpolated event at an index"""
+        position = data.find(key)
+        if position is not None:
+            return data.events[position]
+
+        after = bisect.bisect_left(data.keys, key)
+        before = data.events[after - 1] if after > 0 else None
+        following = data.events[after] if after < len(data.events) else None
+        modes = dict(layout.modes)
+        for override in stream.get('PropertyOverrides') or []:
+            prop_id = layout.property_id(override['SdsTypePropertyId'])
+            modes[prop_id] = enum_name(override.get('InterpolationMode'),
+                                       INTERPOLATION_MODES, modes[prop_id])
+
+        default_mode = enum_name(stream.get('InterpolationMode'),
+                                 INTERPOLATION_MODES, layout.default_mode)
+        extrapolation = enum_name(stream.get('ExtrapolationMode'),
+                                  EXTRAPOLATION_MODES, layout.extrapolation)
+        extrapolated = (
+            before is None and extrapolation in ('All', 'Backward')
+            or following is None and extrapolation in ('All', 'Forward'))
+
+        index = key[0]
+        event = {}
+        for prop_id in layout.ids:
+            code = layout.codes[prop_id]
+            if prop_id == layout.keys[0]:
+                event[prop_id] = index
+                continue
+            mode = modes[prop_id] or default_mode
+            if mode == 'Discrete':
+                value = None
+            elif before is None or following is None:
+                # Extrapolate the first or last value, if the mode allows it
+                value = (following or before)[prop_id] if extrapolated \
+                    else None
+            elif mode == 'StepwiseContinuousLeading':
+                value = before[prop_id]
+            elif mode == 'StepwiseContinuousTrailing':
+                value = following[prop_id]
+            elif code in INTEGER_CODES or code in FLOAT_CODES:
+                low = before[layout.keys[0]]
+                high = following[layout.keys[0]]
+                fraction = (index - low) / (high - low)
+                value = convert(before[prop_id] + fraction
+                                * (following[prop_id] - before[prop_id]), code)
+            else:
+                value = before[prop_id]
+            event[prop_id] = value
+        return event
+
+    def sampled(self, layout, data, query, predicate):
+        """Returns the first, last, min and max events of each interval"""
+        if len(layout.keys) != 1:
+            raise StandInError(400, 'Sampling needs a single index')
+        start = layout.parse_key(first(query, 'startIndex'))
+        end = layout.parse_key(first(query, 'endIndex'))
+        sample_by = [layout.property_id(name) for name
+                     in first(query, 'sampleBy').split(',')]
+        intervals = int(first(query, 'intervals'))
+        positions = data.window(start, end)
+        events = [data.events[position] for position in positions]
+        if predicate is not None:
+            events = [event for event in events if predicate(event)]
+
+        width = (end[0] - start[0]) / intervals
+        selected = {}
+        for interval in range(intervals):
+            low = start[0] + width * interval
+            high = start[0] + width * (interval + 1)
+            inside = [event for event in events
+                      if low <= event[layout.keys[0]] < high
+                      or (interval == intervals - 1
+                          and event[layout.keys[0]] == high)]
+            if not inside:
+                continue
+            picks = [inside[0], inside[-1]]
+            for prop_id in sample_by:
+                values = [event for event in inside
+                          if isinstance(event[prop_id], (int, float))
+                          and not math.isnan(event[prop_id])]
+                if values:
+                    picks.append(min(values, key=lambda e: e[prop_id]))
+                    picks.append(max(values, key=lambda e: e[prop_id]))
+            for event in picks:
+                selected[layout.key(event)] = event
+        return [selected[key] for key in sorted(selected)]
+
+    @staticmethod
+    def lookup(collection, object_id, kind):
+        """Returns an object of a collection, or raises a 404"""
+        if object_id not in collection:
+            raise StandInError(404, f'The {kind} {object_id} does not exist')
+        return collection[object_id]
+
+
+def first(query, name, default=None):
+    """Returns the first value of a query parameter, ignoring case"""
+    for key, values in query.items():
+        if key.lower() == name.lower():
+            return values[0]
+    return default
+
+
+def page(objects, query):
+    """Applies the skip, count and query parameters of a collection GET"""
+    text = first(query, 'query', '')
+    if text:
+        field, _, pattern = text.rpartition(':')
+        fields = [field] if field else ['Id', 'Name']
+        objects = [obj for obj in objects
+                   if any(fnmatch.fnmatch(str(obj.get(name, '')).lower(),
+                                          pattern.lower() if '*' in pattern
+                                          else f'*{pattern.lower()}*')
+                          for name in fields)]
+    skip = int(first(query, 'skip', '0'))
+    count = int(first(query, 'count', '100'))
+    return objects[skip:skip + count]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Routes HTTP requests to the SdsStandIn of the server"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; don't let them wait for ACKs
+    disable_nagle_algorithm = True
+
+    def read_body(self):
+        """Reads a request body, chunked or sized by Content-Length"""
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def serve(self):
+        """Serves the request with the stand-in and writes the response"""
+        stand_in = self.server.stand_in
+        url = urlsplit(self.path)
+        body = self.read_body()
+        try:
+            status, content = stand_in.handle(
+                self.command, url.path, parse_qs(url.query,
+                                                 keep_blank_values=True), body)
+        except StandInError as error:
+            status, content = error.status, {
+                'OperationId': None, 'Error': 'Stand-in error',
+                'Reason': error.reason, 'Resolution': 'Check the request'}
+        except (ValueError, KeyError) as error:
+            status, content = 400, {
+                'OperationId': None, 'Error': 'Bad request',
+                'Reason': str(error), 'Resolution': 'Check the request'}
+        except Exception as error:
+            # Any other failure still answers, so clients see a status code
+            status, content = 500, {
+                'OperationId': None, 'Error': 'Stand-in failure',
+                'Reason': repr(error), 'Resolution': 'Report the request'}
+
+        response = b'' if status == 204 else json.dumps(content).encode()
+        with stand_in.lock:
+            stand_in.request_count += 1
+        stand_in.throttle(len(body) + len(response))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = serve
+
+    def log_message(self, *args):
+        """Keeps request logging off the console"""
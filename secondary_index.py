@@ -0,0 +1,162 @@
+"""Local secondary indexes over columnar events, as SdsStreamIndex declares
+
+An IndexedWindow holds the events of a stream in key order, with a
+CompoundIndex, and a SecondaryIndex for each indexed property: the
+positions of the events sorted by that property. A lookup by secondary
+value is two binary searches and a gather of the matching rows, without
+scanning the window. Inserts and replacements merge into every index
+instead of sorting it again
+"""
+
+import numpy as np
+
+from compound_index import CompoundIndex, key_names
+from interpolation import as_columns, take
+
+
+def same(left, right):
+    """Compares values, with NaN equal to NaN as it sorts with them"""
+    equal = left == right
+    if left.dtype.kind == 'f':
+        equal |= np.isnan(left) & np.isnan(right)
+    return equal
+
+
+class SecondaryIndex:
+    """The positions of the events of a window, sorted by one property
+
+    order holds the positions and values the property at each of them.
+    Events of equal value keep their key order
+    """
+
+    def __init__(self, property_id, column):
+        self.property_id = property_id
+        self.order = np.argsort(column, kind='stable')
+        self.values = column[self.order]
+
+    def __len__(self):
+        return len(self.order)
+
+    def positions(self, low, high):
+        """Returns the positions of the events from low to high"""
+        start = np.searchsorted(self.values, low, 'left')
+        stop = np.searchsorted(self.values, high, 'right')
+        return self.order[start:max(start, stop)]
+
+    def update(self, column, inserted, replaced):
+        """Merges the events of a CompoundIndex.merge into the index
+
+        column is the indexed property after the merge, and inserted and
+        replaced are the positions merge returns
+        """
+        order, values = self.order, self.values
+        if len(replaced):
+            kept = ~np.isin(order, replaced)
+            order, values = order[kept], values[kept]
+        # Each position moves past the events inserted before it
+        order = order + np.searchsorted(inserted, order, 'right')
+        changed = np.concatenate([
+            inserted + np.arange(len(inserted)),
+            replaced + np.searchsorted(inserted, replaced, 'right')])
+        changed = np.sort(changed)
+        sorting = np.argsort(column[changed], kind='stable')
+        changed = changed[sorting]
+        new_values = column[changed]
+
+        at = self.insertion_points(order, values, changed, new_values)
+        self.order = np.insert(order, at, changed)
+        self.values = np.insert(values, at, new_values)
+
+    @staticmethod
+    def insertion_points(order, values, positions, new_values):
+        """Returns where events go in sorted values, after the events of
+        lower value and among equal ones by position
+        """
+        at = np.searchsorted(values, new_values, 'left')
+        if not len(values):
+            return at
+        tied = same(values[np.minimum(at, len(values) - 1)], new_values)
+        tied &= at < len(values)
+        if tied.any():
+            # Runs of equal values, ranked so that one search places an
+            # event by value, then by position
+            runs = np.concatenate(
+                ([0], np.cumsum(~same(values[1:], values[:-1]))))
+            size = max(int(order.max()), int(positions.max())) + 1
+            ranks = runs.astype(np.int64) * size + order
+            at[tied] = np.searchsorted(
+                ranks, runs[at[tied]].astype(np.int64) * size
+                + positions[tied], 'left')
+        return at
+
+
+class IndexedWindow:
+    """The events of a window, by key and by each indexed property
+
+    keys lists the key properties, the first column by default, and
+    indexes the indexed properties, as SdsStreamIndex objects or ids
+    """
+
+    def __init__(self, window, indexes=(), keys=None):
+        columns, index = as_columns(window)
+        self.primary = CompoundIndex(columns, keys or (index,))
+        self.indexes = {}
+        for stream_index in indexes:
+            self.addIndex(stream_index)
+
+    @classmethod
+    def fromStream(cls, stream, window, sds_type=None):
+        """Creates the window with the indexes of an SdsStream, keyed as
+        sds_type if given
+        """
+        return cls(window, stream.Indexes or (),
+                   key_names(sds_type) if sds_type is not None else None)
+
+    def __len__(self):
+        return len(self.primary)
+
+    @property
+    def columns(self):
+        """Returns the columns of the events, in key order"""
+        return self.primary.columns
+
+    def property_id(self, stream_index):
+        """Finds the property of an SdsStreamIndex or id, ignoring case"""
+        name = getattr(stream_index, 'SdsTypePropertyId', stream_index)
+        for prop_id in self.columns:
+            if prop_id.lower() == str(name).lower():
+                return prop_id
+        raise ValueError(f'Unknown property {name}')
+
+    def addIndex(self, stream_index):
+        """Indexes a property"""
+        prop_id = self.property_id(stream_index)
+        self.indexes[prop_id] = SecondaryIndex(prop_id, self.columns[prop_id])
+
+    def dropIndex(self, stream_index):
+        """Removes the index of a property"""
+        self.indexes.pop(self.property_id(stream_index), None)
+
+    def window(self, start, end):
+        """Returns the events from start to end, by key"""
+        return self.primary.window(start, end)
+
+    def lookup(self, stream_index, low, high=None):
+        """Returns the events whose indexed property is from low to high,
+        or equal to low, sorted by that property, then by key
+        """
+        prop_id = self.property_id(stream_index)
+        if prop_id not in self.indexes:
+            raise ValueError(f'Property {prop_id} is not indexed')
+        positions = self.indexes[prop_id].positions(
+            low, low if high is None else high)
+        return take(self.columns, positions)
+
+    def insert(self, window, replace=False):
+        """Adds events as CompoundIndex.insert does, and updates every
+        index. Returns the number of new events
+        """
+        inserted, replaced = self.primary.merge(window, replace)
+        for prop_id, index in self.indexes.items():
+            index.update(self.columns[prop_id], inserted, replaced)
+        return len(inserted)
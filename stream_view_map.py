@@ -0,0 +1,168 @@
+"""Local projection of columnar windows through SDS stream views
+
+A ViewProjection applies a stream view to the columns of a window read
+from its source type, as SDS does for reads with a stream view: properties
+are renamed, dropped when unmapped, and converted to the target type with
+NumPy casts. One window read can so be projected onto many target types
+without further SDS calls
+"""
+
+import numpy as np
+from adh_sample_library_preview import SdsStreamViewMode
+
+from interpolation import as_columns
+from table_form import TYPE_CODE_DTYPES
+from wave_data import WaveBatch
+
+
+def type_code(prop):
+    """Returns the SdsTypeCode name of an SdsTypeProperty"""
+    code = prop.SdsType.SdsTypeCode
+    return getattr(code, 'name', code)
+
+
+def type_dtypes(sds_type):
+    """Returns the dtype of each property of an SdsType, keyed by id"""
+    return {prop.Id: TYPE_CODE_DTYPES.get(type_code(prop), object)
+            for prop in sds_type.Properties}
+
+
+def find_id(ids, name):
+    """Finds a property id, ignoring case as SDS does"""
+    for prop_id in ids:
+        if prop_id.lower() == str(name).lower():
+            return prop_id
+    return None
+
+
+def view_properties(stream_view, source_type, target_type):
+    """Resolves which target property each source property maps to
+
+    Explicit stream view properties come first, then properties of the same
+    name. Without explicit properties, the remaining ones map by position
+    onto target properties of the same type code. Returns a list of
+    (source id, target id) pairs
+    """
+    source_codes = {prop.Id: type_code(prop)
+                    for prop in source_type.Properties}
+    target_codes = {prop.Id: type_code(prop)
+                    for prop in target_type.Properties}
+    mapping = {}
+    for prop in stream_view.Properties or []:
+        source_id = find_id(source_codes, prop.SourceId)
+        target_id = find_id(target_codes, prop.TargetId)
+        if source_id is None or target_id is None:
+            raise ValueError(f'Stream view {stream_view.Id} maps unknown '
+                             f'property {prop.SourceId} or {prop.TargetId}')
+        mapping[source_id] = target_id
+
+    unused = [prop_id for prop_id in target_codes
+              if prop_id not in mapping.values()]
+    for source_id in source_codes:
+        target_id = None if source_id in mapping \
+            else find_id(unused, source_id)
+        if target_id is not None:
+            mapping[source_id] = target_id
+            unused.remove(target_id)
+    if not stream_view.Properties:
+        for source_id, code in source_codes.items():
+            if source_id in mapping:
+                continue
+            target_id = next((candidate for candidate in unused
+                              if target_codes[candidate] == code), None)
+            if target_id is not None:
+                mapping[source_id] = target_id
+                unused.remove(target_id)
+    return [(source_id, mapping[source_id]) for source_id in source_codes
+            if source_id in mapping]
+
+
+def cast(column, dtype):
+    """Converts a column to dtype as SDS converts values
+
+    Floats are rounded to the nearest integer, NaN becomes 0, and values
+    beyond the range of an integer dtype are clipped to it
+    """
+    dtype = np.dtype(dtype)
+    if column.dtype == dtype:
+        return column
+    if dtype.kind in 'iu' and column.dtype.kind == 'f':
+        limits = np.iinfo(dtype)
+        column = np.clip(np.nan_to_num(np.rint(column)), limits.min,
+                         limits.max)
+    elif dtype.kind == 'b' and column.dtype.kind == 'f':
+        column = np.nan_to_num(column)
+    return column.astype(dtype)
+
+
+def default_column(dtype, size):
+    """Returns a column of the value SDS gives unmapped properties"""
+    if np.dtype(dtype) == object:
+        return np.full(size, None, dtype=object)
+    return np.zeros(size, dtype=dtype)
+
+
+class ViewProjection:
+    """Projects the columns of a stream view's source type onto its target
+
+    properties lists (source id, target id) pairs, and dtypes holds the
+    dtype of each target property, keyed by id in target order. Target
+    properties without a source hold their default value, as in SDS
+    """
+
+    def __init__(self, properties, dtypes=None):
+        self.properties = list(properties)
+        self.dtypes = dict(dtypes or {})
+
+    @classmethod
+    def fromStreamView(cls, stream_view, source_type, target_type):
+        """Creates the projection of an SdsStreamView between two SdsTypes"""
+        return cls(view_properties(stream_view, source_type, target_type),
+                   type_dtypes(target_type))
+
+    @classmethod
+    def fromStreamViewMap(cls, stream_view_map, target=None):
+        """Creates the projection of a getStreamViewMap result
+
+        target gives the target dtypes: an SdsType, a wave class or a dict
+        of dtypes. Without it, mapped columns keep their dtype
+        """
+        properties = [
+            (prop.SourceId, prop.TargetId)
+            for prop in stream_view_map.Properties
+            if prop.TargetId and not (prop.Mode is not None and
+                                      SdsStreamViewMode.FieldRemove
+                                      in prop.Mode)]
+        if hasattr(target, 'Properties'):
+            dtypes = type_dtypes(target)
+        elif hasattr(target, 'sds_columns'):
+            dtypes = {name: dtype for name, _, dtype in target.sds_columns}
+        else:
+            dtypes = target
+        return cls(properties, dtypes)
+
+    def apply(self, window, wave_class=None):
+        """Projects a window, returning a dict of target columns, or a
+        WaveBatch of wave_class if given
+        """
+        columns, _ = as_columns(window)
+        size = len(next(iter(columns.values()))) if columns else 0
+        projected = {}
+        for source_id, target_id in self.properties:
+            source = find_id(columns, source_id)
+            if source is None:
+                continue
+            dtype = self.dtypes.get(target_id)
+            column = columns[source]
+            projected[target_id] = column if dtype is None \
+                else cast(column, dtype)
+
+        if self.dtypes:
+            # Keep the target order and fill the unmapped target properties
+            projected = {target_id: projected[target_id]
+                         if target_id in projected
+                         else default_column(dtype, size)
+                         for target_id, dtype in self.dtypes.items()}
+        if wave_class is None:
+            return projected
+        return WaveBatch(wave_class, projected)
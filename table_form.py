@@ -0,0 +1,192 @@
+"""Decoding of SDS table form window reads into NumPy columns"""
+
+import json
+import re
+
+import numpy as np
+
+import json_backend
+
+# NumPy dtype of each SdsTypeCode a table column can have
+TYPE_CODE_DTYPES = {
+    'Boolean': np.bool_,
+    'Byte': np.uint8,
+    'SByte': np.int8,
+    'Int16': np.int16,
+    'UInt16': np.uint16,
+    'Int32': np.int32,
+    'UInt32': np.uint32,
+    'Int64': np.int64,
+    'UInt64': np.uint64,
+    'Single': np.float32,
+    'Double': np.float64,
+}
+
+# Types whose values all parse exactly as float64
+FLOAT_EXACT = {'Byte', 'SByte', 'Int16', 'UInt16', 'Int32', 'UInt32',
+               'Single', 'Double'}
+
+WHITESPACE = re.compile(r'\s*')
+ROWS_END = re.compile(r'\]\s*\]')
+BRACKETS = str.maketrans('[]', '  ')
+CHUNK_SIZE = 1 << 20
+
+
+def table_dtypes(wave_class):
+    """Returns the column dtypes of a wave class, keyed by SDS name"""
+    return {name: dtype for name, _, dtype in wave_class.sds_columns}
+
+
+def get_window_table(sds_client, namespace_id, stream_id, start, end):
+    """Reads a window in the tableh form and returns the raw response body
+
+    getWindowValuesForm parses the response into Python lists; the raw body
+    can be decoded by decode_table without them
+    """
+    base_client = sds_client.baseClient
+    url = (f'{base_client.uri_API}/Tenants/{base_client.tenant}/Namespaces/'
+           f'{namespace_id}/Streams/{base_client.encode(stream_id)}/Data')
+    response = base_client.request(
+        'get', url, params={'startIndex': start, 'endIndex': end,
+                            'form': 'tableh'})
+    base_client.checkResponse(
+        response, f'Failed to get window values for SdsStream: {stream_id}.')
+    return response.content
+
+
+def decode_table(content, dtypes=None):
+    """Decodes a tableh window into a dict of NumPy columns by header name
+
+    content is the response body, or its parsed JSON. Column dtypes come
+    from the table's column types, unless given in dtypes. When the body has
+    only numbers, the rows are parsed by NumPy in one pass, without Python
+    objects per row or value
+    """
+    if isinstance(content, bytes):
+        content = content.decode()
+    if isinstance(content, str):
+        columns = decode_numeric_table(content, dtypes)
+        if columns is not None:
+            return columns
+        content = json_backend.loads(content)
+    return decode_table_content(content, dtypes)
+
+
+def column_dtypes(header, types, dtypes):
+    """Resolves the dtype of each column of a table"""
+    dtypes = dtypes or {}
+    return [dtypes.get(name) or TYPE_CODE_DTYPES.get(types.get(name), object)
+            for name in header]
+
+
+def decode_table_content(content, dtypes=None):
+    """Decodes a parsed tableh window into a dict of NumPy columns"""
+    rows = content.get('Rows') or []
+    if not rows:
+        return {}
+    header, rows = rows[0], rows[1:]
+    types = content.get('Columns') or {}
+    columns = {}
+    for index, (name, dtype) in enumerate(
+            zip(header, column_dtypes(header, types, dtypes))):
+        values = (row[index] for row in rows)
+        if dtype is object:
+            columns[name] = np.fromiter(values, object, len(rows))
+            continue
+        # Null values become NaN in float columns and 0 otherwise
+        default = np.nan if np.issubdtype(dtype, np.floating) else 0
+        columns[name] = np.fromiter(
+            (default if value is None else value for value in values),
+            dtype, len(rows))
+    return columns
+
+
+def decode_numeric_table(text, dtypes=None):
+    """Decodes a tableh body whose rows hold only numbers
+
+    Returns None when the body needs a JSON parser: columns that are not
+    numeric, rows with strings, nulls or booleans, or 64-bit integer columns
+    that float64 cannot hold exactly
+    """
+    try:
+        return scan_numeric_table(text, dtypes)
+    except ValueError:
+        # The scanner splits rows by hand; a body it misreads, such as one
+        # whose strings hold ']]', goes to the JSON parser
+        return None
+
+
+def numeric_columns(types):
+    """Tells whether every column type of a table parses as float64"""
+    return all(code in FLOAT_EXACT for code in types.values())
+
+
+def scan_numeric_table(text, dtypes=None):
+    """Decodes a tableh body as decode_numeric_table does, raising
+    ValueError on a body it cannot read
+    """
+    decoder = json.JSONDecoder()
+    parts = {}
+    index = WHITESPACE.match(text).end()
+    if text[index:index + 1] != '{':
+        return None
+    index += 1
+    while True:
+        index = WHITESPACE.match(text, index).end()
+        if text[index:index + 1] == '}':
+            break
+        key, index = decoder.raw_decode(text, index)
+        index = WHITESPACE.match(text, index).end()
+        index = WHITESPACE.match(text, index + 1).end()
+        if key != 'Rows':
+            parts[key], index = decoder.raw_decode(text, index)
+            if key == 'Columns' and not numeric_columns(parts[key] or {}):
+                return None
+        else:
+            # The header row is the first row, then only numbers follow
+            index = WHITESPACE.match(text, index + 1).end()
+            if text[index] == ']':
+                return {}
+            parts['Header'], index = decoder.raw_decode(text, index)
+            end = text.find(']]', index)
+            if end < 0:
+                match = ROWS_END.search(text, index)
+                if match is None:
+                    return None
+                end = match.start()
+            parts['Rows'] = (index, end + 1)
+            index = WHITESPACE.match(text, end + 1).end() + 1
+        index = WHITESPACE.match(text, index).end()
+        if text[index:index + 1] == ',':
+            index += 1
+
+    header = parts.get('Header')
+    if header is None:
+        return {}
+    types = parts.get('Columns') or {}
+    resolved = column_dtypes(header, types, dtypes)
+    if (any(dtype is object for dtype in resolved)
+            or not numeric_columns(types)
+            or any(name not in types for name in header)):
+        return None
+
+    start, end = parts['Rows']
+    chunks = []
+    while start < end:
+        # Parse about CHUNK_SIZE characters at a time, ending at a row end
+        stop = text.find(']', min(start + CHUNK_SIZE, end - 1), end) + 1
+        rows = text.count('[', start, stop)
+        body = text[start:stop].translate(BRACKETS).lstrip(' \t\r\n,')
+        start = stop
+        if not body.strip():
+            continue
+        # Strings, nulls and booleans do not parse as floats and raise a
+        # ValueError
+        chunk = np.array(body.split(','), dtype=np.float64)
+        if len(chunk) != rows * len(header):
+            return None
+        chunks.append(chunk)
+    values = np.concatenate(chunks) if chunks else np.empty(0)
+    values = values.reshape(-1, len(header))
+    return {name: np.ascontiguousarray(values[:, index], dtype=dtype)
+            for index, (name, dtype) in enumerate(zip(header, resolved))}
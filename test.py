@@ -1,7 +1,35 @@
 """This script tests the SDS Python sample script"""
 
+import json
+import math
+import os
+import tempfile
 import unittest
-from .program import main
+import numpy as np
+from adh_sample_library_preview import (EDSClient, SdsBoundaryType,
+                                        SdsExtrapolationMode, SdsStream,
+                                        SdsStreamIndex, SdsStreamView,
+                                        SdsStreamViewProperty)
+from .bulk_writer import chunk_payloads
+from .compound_index import CompoundIndex
+from .delta_update import DeltaUpdater
+from .fan_out import fan_out
+from .filter_expression import compile_filter, filter_window
+from .instrumentation import Instrumentation
+from .interpolation import interpolate, range_values
+from .json_backend import BACKENDS
+from .metadata_cache import MetadataCache
+from .paging import iter_window, iter_window_batches
+from .parallel_waves import generate_waves
+from .program import (delete_in_tiers, get_wave_data_integer_type,
+                      get_wave_data_type, main, next_wave, next_waves)
+from .sampling import sample
+from .sds_stand_in import SdsStandIn
+from .secondary_index import IndexedWindow
+from .stream_view_map import ViewProjection
+from .table_form import decode_numeric_table, decode_table
+from .wave_data import CompactWaveData, JsonPayload, WaveBatch, WaveData
+from .window_cache import WindowCache
 
 
 class SDSPythonSampleTests(unittest.TestCase):
@@ -12,6 +40,408 @@ class SDSPythonSampleTests(unittest.TestCase):
         """Tests the SDS Python main sample script"""
         main(True)
 
+    def test_main_stand_in(self):
+        """Tests the sample script against the in-process SDS stand-in"""
+        steps = []
+        with SdsStandIn() as stand_in:
+            cache = WindowCache()
+            main(True, appsettings=stand_in.appsettings(),
+                 on_step=steps.append, cache=cache)
+            instrumentation = Instrumentation()
+            with tempfile.TemporaryDirectory() as directory:
+                main(True, use_async=True,
+                     appsettings=stand_in.appsettings('stand-in-tenant'),
+                     instrumentation=instrumentation,
+                     metadata_cache=MetadataCache(
+                         os.path.join(directory, 'metadata.json')))
+        # The ADH only steps are skipped for the default tenant
+        self.assertEqual(steps, [*range(1, 16), *range(21, 26)])
+        self.assertGreater(cache.stats()['hits'], 0)
+        self.assertGreater(cache.stats()['invalidations'], 0)
+        report = instrumentation.report()
+        self.assertIn('16', report['steps'])
+        self.assertEqual(report['totals']['requests'],
+                         sum(step['requests']
+                             for step in report['steps'].values()))
+        self.assertIn('sds_sample_operation_requests_total'
+                      '{operation="Streams.insertValues"}',
+                      instrumentation.prometheus())
+
+    def test_instrumentation(self):
+        """Tests that an instrumented client is restored and not wrapped
+        twice
+        """
+        with SdsStandIn() as stand_in:
+            sds_client = EDSClient('v1', stand_in.uri)
+            instrumentation = Instrumentation()
+            with instrumentation.instrumented(sds_client) as client:
+                client.Types.getTypes('default')
+                with self.assertRaises(ValueError):
+                    Instrumentation().instrument(sds_client)
+            sds_client.Types.getTypes('default')
+            self.assertEqual(instrumentation.totals()['requests'], 1)
+            with Instrumentation().instrumented(sds_client) as client:
+                client.Types.getTypes('default')
+            self.assertEqual(instrumentation.totals()['requests'], 1)
+
+    def test_wave_batch(self):
+        """Tests that a WaveBatch round trips through the SDS JSON payload"""
+        waves = next_waves(range(0, 20, 2), 2.0)
+        self.assertEqual(len(waves), 10)
+        self.assertAlmostEqual(waves[3].sin, next_wave(6, 2.0).sin)
+
+        batch = WaveBatch.fromJson(waves.toJson(), WaveData)
+        self.assertEqual(batch.columns['Order'].tolist(), list(range(0, 20, 2)))
+        self.assertEqual(batch[-1].sin, waves[-1].sin)
+        self.assertNotIn('Multiplier', batch.columns)
+        self.assertEqual(next_waves(range(3), 2.5, WaveData)[1].sin,
+                         next_wave(1, 2.5).sin)
+        with self.assertRaises(ValueError):
+            next_waves(range(3), 2.5)
+        with self.assertRaises(ValueError):
+            next_waves([2 ** 31 + 5], 1.0)
+        self.assertEqual(next_waves(5, 1.0)[0].sin, next_wave(5, 1.0).sin)
+
+        joined = WaveBatch.concatenate([batch[:4], batch[4:]])
+        self.assertEqual(joined.toJson(), batch.toJson())
+
+    def test_compact_wave_data(self):
+        """Tests that CompactWaveData keeps the WaveData JSON contract"""
+        content = {'order': 2, 'sin': 0.5, 'cos': None}
+        self.assertEqual(CompactWaveData.fromJson(content).toJson(),
+                         WaveData.fromJson(content).toJson())
+        self.assertFalse(hasattr(CompactWaveData(), '__dict__'))
+
+    def test_json_payload(self):
+        """Tests that a streamed payload encodes the same events as toJson"""
+        waves = WaveBatch.fromJson(next_waves(range(10), 2.0).toJson(),
+                                   WaveData)
+        streamed = b''.join(JsonPayload([waves[:3], waves[3:]], 4))
+        self.assertEqual(json.loads(streamed), json.loads(waves.toJson()))
+        self.assertEqual(b''.join(JsonPayload([])), b'[]')
+
+    def test_chunk_payloads(self):
+        """Tests that bulk write chunks respect the count and size bounds"""
+        waves = [{'Order': order} for order in range(100)]
+        chunks = list(chunk_payloads(waves, max_events=30, max_bytes=200))
+        self.assertEqual(sum(count for count, _ in chunks), 100)
+        for count, payload in chunks:
+            self.assertLessEqual(count, 30)
+            self.assertLessEqual(len(payload), 200)
+            self.assertEqual(len(json.loads(payload)), count)
+
+    def test_delete_in_tiers(self):
+        """Tests that a cleanup tier starts only after the previous one"""
+        calls = []
+
+        def delete(name):
+            calls.append(name)
+            if name == 'type':
+                raise ValueError('in use')
+
+        outcomes = delete_in_tiers([
+            [('stream 1', lambda: delete('stream')),
+             ('stream 2', lambda: delete('stream'))],
+            [('type', lambda: delete('type'))]])
+        self.assertEqual(calls, ['stream', 'stream', 'type'])
+        self.assertEqual([name for name, _, _ in outcomes],
+                         ['stream 1', 'stream 2', 'type'])
+        self.assertIsInstance(outcomes[2][1], ValueError)
+
+    def test_iter_window(self):
+        """Tests that a paged window read yields every event in order"""
+        with SdsStandIn() as stand_in:
+            sds_client = EDSClient('v1', stand_in.uri)
+            sds_client.Types.getOrCreateType('default',
+                                             get_wave_data_type('Wave'))
+            sds_client.Streams.createOrUpdateStream('default',
+                                                    SdsStream('Paged', 'Wave'))
+            sds_client.Streams.insertValues(
+                'default', 'Paged', next_waves(range(25), 2.0).toJson())
+
+            for prefetch in (True, False):
+                waves = iter_window(sds_client, 'default', 'Paged', 0, 100,
+                                    page_size=10, prefetch=prefetch)
+                self.assertEqual([wave['Order'] for wave in waves],
+                                 list(range(25)))
+            batches = iter_window_batches(sds_client, 'default', 'Paged', 0,
+                                          100, WaveData, page_size=10)
+            self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+
+    def test_json_backends(self):
+        """Tests that every JSON backend encodes the same events"""
+        names = ['Order', 'Sin']
+        columns = [[1, 2], [0.5, -1.25]]
+        for backend in BACKENDS.values():
+            rows = backend.dumps_rows(names, columns)
+            self.assertEqual([backend.loads(row) for row in rows],
+                             [{'Order': 1, 'Sin': 0.5},
+                              {'Order': 2, 'Sin': -1.25}])
+            self.assertEqual(backend.loads(backend.dumps([{'Order': 1}])),
+                             [{'Order': 1}])
+            self.assertTrue(math.isnan(backend.loads('[NaN]')[0]))
+
+    def test_decode_table(self):
+        """Tests that a tableh window decodes into typed NumPy columns"""
+        content = {'Name': 'Wave',
+                   'Columns': {'Order': 'Int32', 'Sin': 'Double'},
+                   'Rows': [['Order', 'Sin'], [0, 0.0], [2, 0.5], [4, 1e-3]]}
+        for table in (json.dumps(content), content):
+            columns = decode_table(table)
+            self.assertEqual(columns['Order'].dtype.name, 'int32')
+            self.assertEqual(columns['Order'].tolist(), [0, 2, 4])
+            self.assertEqual(columns['Sin'].tolist(), [0.0, 0.5, 1e-3])
+        content['Rows'][2][1] = None
+        self.assertIsNone(decode_numeric_table(json.dumps(content)))
+        strings = {'Columns': {'Order': 'Int32', 'S': 'String'},
+                   'Rows': [['Order', 'S'], [0, 'a]]b'], [1, 'c']]}
+        for order in (strings, dict(reversed(list(strings.items())))):
+            self.assertEqual(decode_table(json.dumps(order))['S'].tolist(),
+                             ['a]]b', 'c'])
+        columns = decode_table(json.dumps(content))
+        self.assertTrue(math.isnan(columns['Sin'][1]))
+
+    def test_interpolate(self):
+        """Tests that local interpolation follows the modes of each property"""
+        window = {'Order': np.array([0, 2, 4], dtype=np.int32),
+                  'Sin': np.array([0.0, 1.0, 3.0]),
+                  'Radians': np.array([0.0, 2.0, 4.0])}
+        modes = {'Radians': 'discrete'}
+        values = interpolate(window, [-1, 1, 2, 5], modes=modes,
+                             extrapolation=SdsExtrapolationMode.Forward)
+        self.assertEqual(values['Order'].tolist(), [-1, 1, 2, 5])
+        self.assertTrue(math.isnan(values['Sin'][0]))
+        self.assertEqual(values['Sin'][1:].tolist(), [0.5, 1.0, 3.0])
+        self.assertTrue(math.isnan(values['Radians'][1]))
+        self.assertEqual(values['Radians'][2], 2.0)
+        values = range_values(window, 1, 2, modes={'Sin': 1},
+                              boundary_type=SdsBoundaryType.ExactOrCalculated)
+        self.assertEqual(values['Order'].tolist(), [1, 2])
+        self.assertEqual(values['Sin'].tolist(), [0.0, 1.0])
+        with self.assertRaises(ValueError):
+            interpolate(window, [1], modes={'Sin': 'Smooth'})
+
+    def test_sample(self):
+        """Tests that sampling keeps the first, last, min and max events"""
+        window = {'Order': np.arange(8),
+                  'Sin': np.array([0.5, 0.9, -0.2, 0.1, np.nan, 0.3, -1.0,
+                                   0.0])}
+        values = sample(window, 0, 7, 'sin', 2)
+        self.assertEqual(values['Order'].tolist(), [0, 1, 2, 3, 4, 5, 6, 7])
+        values = sample(window, 2, 5, ['Sin'], 1)
+        self.assertEqual(values['Order'].tolist(), [2, 5])
+
+    def test_delta_update(self):
+        """Tests that only new and changed events are sent"""
+        with SdsStandIn() as stand_in:
+            sds_client = EDSClient('v1', stand_in.uri)
+            sds_client.Types.getOrCreateType('default',
+                                             get_wave_data_type('Wave'))
+            sds_client.Streams.createOrUpdateStream('default',
+                                                    SdsStream('Wave', 'Wave'))
+            waves = next_waves(range(10), 2.0, WaveData)
+            sds_client.Streams.insertValues('default', 'Wave',
+                                            waves.toJson())
+            updated = next_waves(range(12), 2.0, WaveData)
+            updated.columns['Sin'][3] = 5.0
+            updater = DeltaUpdater(sds_client, 'default')
+            result = updater.update('Wave', updated)
+            self.assertEqual((result['sent'], result['skipped']), (3, 9))
+            self.assertGreater(result['skipped_bytes'], result['bytes'])
+            self.assertEqual(updater.update('Wave', updated)['sent'], 0)
+            self.assertEqual(updater.stats()['reads'], 1)
+            events = sds_client.Streams.getWindowValues('default', 'Wave',
+                                                        0, 20)
+            self.assertEqual(len(events), 12)
+            self.assertEqual(events[3]['Sin'], 5.0)
+
+            # Properties the stream lacks, such as Multiplier, are ignored
+            for values in (next_waves(range(12), 2.0),
+                           [next_wave(order, 2.0) for order in range(5)]):
+                updater = DeltaUpdater(sds_client, 'default')
+                updater.update('Wave', values)
+                self.assertEqual(updater.update('Wave', values)['skipped'],
+                                 len(values))
+
+    def test_fan_out(self):
+        """Tests that fan_out skips existing streams and writes to all"""
+        with SdsStandIn() as stand_in:
+            sds_client = EDSClient('v1', stand_in.uri)
+            sds_client.Types.getOrCreateType('default',
+                                             get_wave_data_type('Wave'))
+            sds_client.Streams.createOrUpdateStream('default',
+                                                    SdsStream('Wave0', 'Wave'))
+            waves = next_waves(range(5), 1.0)
+            events = WaveBatch(WaveData, waves.columns)
+            summary = fan_out(sds_client, 'default', 'Wave',
+                              {f'Wave{number}': events[number:]
+                               for number in range(4)}, max_events=2)
+            self.assertEqual((summary['created'], summary['existing'],
+                              summary['failed_streams']), (3, 1, 0))
+            self.assertEqual(summary['events'], 5 + 4 + 3 + 2)
+            self.assertEqual(len(sds_client.Streams.getWindowValues(
+                'default', 'Wave3', 0, 10)), 2)
+
+    def test_filter_expression(self):
+        """Tests that filters compile into masks over columns"""
+        window = {'Order': np.arange(6),
+                  'Radians': np.array([0.0, 1.0, 2.0, 3.0, np.nan, 5.0])}
+        values = filter_window(window, 'radians lt 3')
+        self.assertEqual(values['Order'].tolist(), [0, 1, 2])
+        mask = compile_filter('not (Order lt 2 or Radians eq null) and '
+                              '(Order add 1) mod 2 eq 0')
+        self.assertEqual(mask(window).tolist(),
+                         [False, False, False, True, False, True])
+        self.assertIs(compile_filter('radians lt 3'),
+                      compile_filter('radians lt 3'))
+        with self.assertRaises(ValueError):
+            compile_filter('Radians lt')
+
+    def test_generate_waves(self):
+        """Tests that processes fill shared memory as next_waves does"""
+        with generate_waves(0, 1000, 3, 2.0, processes=2, block=100) as waves:
+            expected = next_waves(range(0, 1000, 3), 2.0)
+            for name, column in expected.columns.items():
+                np.testing.assert_array_equal(waves.batch.columns[name],
+                                              column)
+        with self.assertRaises(ValueError):
+            generate_waves(2 ** 31 - 2, 2 ** 31 + 2)
+
+    def test_compound_index(self):
+        """Tests compound key windows, ranges and inserts"""
+        index = CompoundIndex(next_waves([10, 1, 10, 3], [8, 10, 3, 1]))
+        index.insert(next_waves([2, 10], [2, 10]))
+        window = index.window(index.Key(Order=2, Multiplier=1), '10|8')
+        self.assertEqual(list(zip(window['Order'].tolist(),
+                                  window['Multiplier'].tolist())),
+                         [(2, 2), (3, 1), (10, 3), (10, 8)])
+        self.assertEqual(index.range((10, 3), 2, reverse=True)['Order']
+                         .tolist(), [10, 3])
+        self.assertEqual(index.find((10, 10)), 5)
+        self.assertEqual(index.formatKey(index.keyAt(0)), '1|10')
+        with self.assertRaises(ValueError):
+            index.insert(next_waves([3], [1]))
+        self.assertEqual(index.insert(next_waves([3, 4], [1, 1]),
+                                      replace=True), 1)
+
+    def test_secondary_index(self):
+        """Tests lookups by an indexed property after inserts"""
+        stream = SdsStream('Wave', 'Wave', indexes=[SdsStreamIndex('Sin')])
+        indexed = IndexedWindow.fromStream(
+            stream, {'Order': np.array([4, 1, 3]),
+                     'Sin': np.array([0.5, 0.2, 0.5])})
+        indexed.insert({'Order': np.array([2, 1]),
+                        'Sin': np.array([0.5, 0.9])}, replace=True)
+        self.assertEqual(indexed.lookup('sin', 0.5)['Order'].tolist(),
+                         [2, 3, 4])
+        self.assertEqual(indexed.lookup('Sin', 0.6, 1)['Order'].tolist(),
+                         [1])
+        with self.assertRaises(ValueError):
+            indexed.lookup('Order', 1)
+
+    def test_view_projection(self):
+        """Tests that a stream view renames, drops and converts columns"""
+        stream_view = SdsStreamView(
+            'View', 'Wave', 'Integer',
+            properties=[SdsStreamViewProperty('Order', 'OrderTarget'),
+                        SdsStreamViewProperty('Sin', 'SinInt')])
+        projection = ViewProjection.fromStreamView(
+            stream_view, get_wave_data_type('Wave'),
+            get_wave_data_integer_type('Integer'))
+        columns = projection.apply({'Order': np.arange(3),
+                                    'Sin': np.array([0.4, 1.6, -2.6]),
+                                    'Radians': np.zeros(3)})
+        self.assertEqual(list(columns), ['OrderTarget', 'SinInt', 'CosInt',
+                                         'TanInt'])
+        self.assertEqual(columns['SinInt'].dtype.name, 'int32')
+        self.assertEqual(columns['SinInt'].tolist(), [0, 2, -3])
+        self.assertEqual(columns['CosInt'].tolist(), [0, 0, 0])
+
+    def test_window_cache(self):
+        """Tests that cached windows merge and writes invalidate them"""
+        with SdsStandIn() as stand_in:
+            sds_client = EDSClient('v1', stand_in.uri)
+            sds_client.Types.getOrCreateType('default',
+                                             get_wave_data_type('Wave'))
+            sds_client.Streams.createOrUpdateStream('default',
+                                                    SdsStream('Wave', 'Wave'))
+            cache = WindowCache()
+            cached = cache.wrap(sds_client)
+            cached.Streams.insertValues('default', 'Wave',
+                                        next_waves(range(0, 100, 2), 2.0))
+            cached.Streams.getWindowValues('default', 'Wave', 0, 40)
+            cached.Streams.getWindowValues('default', 'Wave', 30, 60)
+            window = cached.Streams.getWindowValues('default', 'Wave', 10, 50)
+            self.assertEqual([event['Order'] for event in window],
+                             list(range(10, 51, 2)))
+            self.assertEqual(cache.stats()['hits'], 1)
+            self.assertEqual(cache.stats()['entries'], 1)
+            cached.Streams.insertValues('default', 'Wave',
+                                        [next_wave(101, 2.0)])
+            self.assertEqual(cache.stats()['invalidations'], 0)
+            cached.Streams.removeValue('default', 'Wave', 20)
+            window = cached.Streams.getWindowValues('default', 'Wave', 10, 50)
+            self.assertNotIn(20, [event['Order'] for event in window])
+            self.assertEqual(cache.stats()['invalidations'], 1)
+
+            # Paged reads, as iter_window makes, are cached page by page
+            for _ in range(2):
+                orders = [event['Order'] for event in iter_window(
+                    cached, 'default', 'Wave', 0, 40, page_size=8)]
+            self.assertEqual(orders, [order for order in range(0, 41, 2)
+                                      if order != 20])
+            self.assertEqual(cache.stats()['hits'], 1 + 3)
+            cached.Streams.updateValues('default', 'Wave',
+                                        [next_wave(30, 3.0)])
+            self.assertEqual(len(list(iter_window(
+                cached, 'default', 'Wave', 0, 40, page_size=8))), 20)
+            self.assertEqual(cache.stats()['hits'], 1 + 3)
+
+    def test_metadata_cache(self):
+        """Tests that recorded definitions are not created again"""
+        with SdsStandIn() as stand_in, \
+                tempfile.TemporaryDirectory() as directory:
+            sds_client = EDSClient('v1', stand_in.uri)
+            path = os.path.join(directory, 'metadata.json')
+
+            def setup(cache):
+                cached = cache.wrap(sds_client)
+                wave_type = cached.Types.getOrCreateType(
+                    'default', get_wave_data_type('Wave'))
+                cached.Streams.createOrUpdateStream(
+                    'default', SdsStream('Wave', wave_type.Id))
+                return wave_type
+
+            wave_type = setup(MetadataCache(path))
+            requests = stand_in.request_count
+            cache = MetadataCache(path)
+            self.assertEqual(setup(cache).toDictionary(),
+                             wave_type.toDictionary())
+            self.assertEqual(stand_in.request_count, requests)
+            self.assertEqual(cache.stats()['hits'], 2)
+
+            # A stream deleted elsewhere is created again by validation
+            sds_client.Streams.deleteStream('default', 'Wave')
+            cache = MetadataCache(path, validate=True)
+            setup(cache)
+            cache.close()
+            self.assertEqual(cache.stats()['repairs'], 1)
+            self.assertEqual(
+                sds_client.Streams.getStream('default', 'Wave').Id, 'Wave')
+
+            # Caches sharing the file keep each other's changes
+            first, second = MetadataCache(path), MetadataCache(path)
+            first.record('first', {}, {})
+            second.record('second', {}, {})
+            first.forget('second')
+            second.record('third', {}, {})
+            second.forget('first')
+            first.record('fourth', {}, {})
+            entries = MetadataCache(path).load()
+            self.assertEqual({'first', 'second', 'third', 'fourth'}
+                             & set(entries), {'third', 'fourth'})
+            self.assertEqual(first.stats()['entries'], len(entries))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,12 +1,53 @@
 """WaveData type definitions for SDS Python sample"""
 
-import json
 import inspect
+import types
+
+import numpy as np
+
+import json_backend
+
+
+def is_wave_property(value):
+    """Check whether a class member is a property or a __slots__ attribute"""
+    return isinstance(value, (property, types.MemberDescriptorType))
+
+
+def property_codec(wave_class):
+    """Returns the (json_key, getter, setter) of each property of a class
+
+    The tuple is built once per class and cached on it, so encoding and
+    decoding events does not inspect the class every time
+    """
+    codec = wave_class.__dict__.get('_property_codec')
+    if codec is None:
+        codec = []
+        for name, prop in inspect.getmembers(wave_class, is_wave_property):
+            if isinstance(prop, property):
+                codec.append((name, prop.fget, prop.fset))
+            else:
+                codec.append((name, prop.__get__, prop.__set__))
+        codec = tuple(codec)
+        wave_class._property_codec = codec
+    return codec
 
 
 class WaveData:
     """Represents a data point to be injected into Sds Service"""
 
+    # SDS property name, property name and NumPy dtype of each column
+    sds_columns = (
+        ('Order', 'order', np.int32),
+        ('Tau', 'tau', np.float64),
+        ('Radians', 'radians', np.float64),
+        ('Sin', 'sin', np.float64),
+        ('Cos', 'cos', np.float64),
+        ('Tan', 'tan', np.float64),
+        ('Sinh', 'sinh', np.float64),
+        ('Cosh', 'cosh', np.float64),
+        ('Tanh', 'tanh', np.float64),
+    )
+
     def __init__(self):
         self._order = None
         self._tau = None
@@ -105,17 +146,12 @@ class WaveData:
 
     def toJson(self):
         """Converts the object into JSON"""
-        return json.dumps(self.toDictionary())
+        return json_backend.dumps(self.toDictionary())
 
     def toDictionary(self):
         """Converts the object into a dictionary"""
-        dictionary = {}
-        for prop in inspect.getmembers(type(self),
-                                       lambda v: isinstance(v, property)):
-            if hasattr(self, prop[0]):
-                dictionary[prop[0]] = prop[1].fget(self)
-
-        return dictionary
+        return {key: getter(self)
+                for key, getter, _ in property_codec(type(self))}
 
     @staticmethod
     def fromJson(json_obj):
@@ -130,16 +166,10 @@ class WaveData:
         if len(content) == 0:
             return wave
 
-        for prop in inspect.getmembers(type(wave),
-                                       lambda v: isinstance(v, property)):
-            # Pre-Assign the default
-            prop[1].fset(wave, 0)
-
-            # If found in JSON object, then set
-            if prop[0] in content:
-                value = content[prop[0]]
-                if value is not None:
-                    prop[1].fset(wave, value)
+        for key, _, setter in property_codec(type(wave)):
+            # Pre-Assign the default, overridden if found in JSON object
+            value = content.get(key)
+            setter(wave, 0 if value is None else value)
 
         return wave
 
@@ -147,6 +177,14 @@ class WaveData:
 class WaveDataInteger:
     """Represents a data point to be injected into Sds Service"""
 
+    # SDS property name, property name and NumPy dtype of each column
+    sds_columns = (
+        ('OrderTarget', 'order_target', np.int32),
+        ('SinInt', 'sin_int', np.int32),
+        ('CosInt', 'cos_int', np.int32),
+        ('TanInt', 'tan_int', np.int32),
+    )
+
     def __init__(self):
         self._order_target = None
         self._sin_int = None
@@ -195,17 +233,12 @@ class WaveDataInteger:
 
     def toJson(self):
         """Converts the object into JSON"""
-        return json.dumps(self.toDictionary())
+        return json_backend.dumps(self.toDictionary())
 
     def toDictionary(self):
         """Converts the object into a dictionary"""
-        dictionary = {}
-        for prop in inspect.getmembers(type(self),
-                                       lambda v: isinstance(v, property)):
-            if hasattr(self, prop[0]):
-                dictionary[prop[0]] = prop[1].fget(self)
-
-        return dictionary
+        return {key: getter(self)
+                for key, getter, _ in property_codec(type(self))}
 
     @staticmethod
     def fromJson(json_obj):
@@ -220,22 +253,29 @@ class WaveDataInteger:
         if len(content) == 0:
             return wave
 
-        for prop in inspect.getmembers(type(wave),
-                                       lambda v: isinstance(v, property)):
-            # Pre-Assign the default
-            prop[1].fset(wave, 0)
-
-            # If found in JSON object, then set
-            if prop[0] in content:
-                value = content[prop[0]]
-                if value is not None:
-                    prop[1].fset(wave, value)
+        for key, _, setter in property_codec(type(wave)):
+            # Pre-Assign the default, overridden if found in JSON object
+            value = content.get(key)
+            setter(wave, 0 if value is None else value)
         return wave
 
 
 class WaveDataTarget:
     """Represents a data point to be injected into Sds Service"""
 
+    # SDS property name, property name and NumPy dtype of each column
+    sds_columns = (
+        ('OrderTarget', 'order_target', np.int32),
+        ('TauTarget', 'tau_target', np.float64),
+        ('RadiansTarget', 'radians_target', np.float64),
+        ('SinTarget', 'sin_target', np.float64),
+        ('CosTarget', 'cos_target', np.float64),
+        ('TanTarget', 'tan_target', np.float64),
+        ('SinhTarget', 'sinh_target', np.float64),
+        ('CoshTarget', 'cosh_target', np.float64),
+        ('TanhTarget', 'tanh_target', np.float64),
+    )
+
     def __init__(self):
         self._order_target = None
         self._tau_target = None
@@ -334,17 +374,12 @@ class WaveDataTarget:
 
     def toJson(self):
         """Converts the object into JSON"""
-        return json.dumps(self.toDictionary())
+        return json_backend.dumps(self.toDictionary())
 
     def toDictionary(self):
         """Converts the object into a dictionary"""
-        dictionary = {}
-        for prop in inspect.getmembers(type(self),
-                                       lambda v: isinstance(v, property)):
-            if hasattr(self, prop[0]):
-                dictionary[prop[0]] = prop[1].fget(self)
-
-        return dictionary
+        return {key: getter(self)
+                for key, getter, _ in property_codec(type(self))}
 
     @staticmethod
     def fromJson(json_obj):
@@ -359,16 +394,10 @@ class WaveDataTarget:
         if len(content) == 0:
             return wave
 
-        for prop in inspect.getmembers(type(wave),
-                                       lambda v: isinstance(v, property)):
-            # Pre-Assign the default
-            prop[1].fset(wave, 0)
-
-            # If found in JSON object, then set
-            if prop[0] in content:
-                value = content[prop[0]]
-                if value is not None:
-                    prop[1].fset(wave, value)
+        for key, _, setter in property_codec(type(wave)):
+            # Pre-Assign the default, overridden if found in JSON object
+            value = content.get(key)
+            setter(wave, 0 if value is None else value)
 
         return wave
 
@@ -376,6 +405,20 @@ class WaveDataTarget:
 class WaveDataCompound:
     """Represents a data point to be injected into Sds Service"""
 
+    # SDS property name, property name and NumPy dtype of each column
+    sds_columns = (
+        ('Order', 'order', np.int32),
+        ('Multiplier', 'multiplier', np.int32),
+        ('Tau', 'tau', np.float64),
+        ('Radians', 'radians', np.float64),
+        ('Sin', 'sin', np.float64),
+        ('Cos', 'cos', np.float64),
+        ('Tan', 'tan', np.float64),
+        ('Sinh', 'sinh', np.float64),
+        ('Cosh', 'cosh', np.float64),
+        ('Tanh', 'tanh', np.float64),
+    )
+
     def __init__(self):
         self._order = None
         self._multiplier = None
@@ -484,17 +527,12 @@ class WaveDataCompound:
 
     def toJson(self):
         """Converts the object into JSON"""
-        return json.dumps(self.toDictionary())
+        return json_backend.dumps(self.toDictionary())
 
     def toDictionary(self):
         """Converts the object into a dictionary"""
-        dictionary = {}
-        for prop in inspect.getmembers(type(self),
-                                       lambda v: isinstance(v, property)):
-            if hasattr(self, prop[0]):
-                dictionary[prop[0]] = prop[1].fget(self)
-
-        return dictionary
+        return {key: getter(self)
+                for key, getter, _ in property_codec(type(self))}
 
     @staticmethod
     def fromJson(json_obj):
@@ -509,15 +547,332 @@ class WaveDataCompound:
         if len(content) == 0:
             return wave
 
-        for prop in inspect.getmembers(type(wave),
-                                       lambda v: isinstance(v, property)):
-            # Pre-Assign the default
-            prop[1].fset(wave, 0)
+        for key, _, setter in property_codec(type(wave)):
+            # Pre-Assign the default, overridden if found in JSON object
+            value = content.get(key)
+            setter(wave, 0 if value is None else value)
+
+        return wave
+
+
+class CompactWave:
+    """Base of the memory-compact wave classes, storing values in __slots__"""
 
-            # If found in JSON object, then set
-            if prop[0] in content:
-                value = content[prop[0]]
-                if value is not None:
-                    prop[1].fset(wave, value)
+    __slots__ = ()
+
+    def __init__(self):
+        for _, _, setter in property_codec(type(self)):
+            setter(self, None)
+
+    def toJson(self):
+        """Converts the object into JSON"""
+        return json_backend.dumps(self.toDictionary())
+
+    def toDictionary(self):
+        """Converts the object into a dictionary"""
+        return {key: getter(self)
+                for key, getter, _ in property_codec(type(self))}
+
+    @classmethod
+    def fromJson(cls, json_obj):
+        """Creates the object from JSON"""
+        return cls.fromDictionary(json_obj)
+
+    @classmethod
+    def fromDictionary(cls, content):
+        """Creates the object from a dictionary"""
+        wave = cls()
+
+        if len(content) == 0:
+            return wave
+
+        for key, _, setter in property_codec(cls):
+            # Pre-Assign the default, overridden if found in JSON object
+            value = content.get(key)
+            setter(wave, 0 if value is None else value)
 
         return wave
+
+
+class CompactWaveData(CompactWave):
+    """A WaveData event without a per-instance __dict__"""
+
+    __slots__ = ('order', 'tau', 'radians', 'sin', 'cos', 'tan', 'sinh',
+                 'cosh', 'tanh')
+    sds_columns = WaveData.sds_columns
+
+
+class CompactWaveDataInteger(CompactWave):
+    """A WaveDataInteger event without a per-instance __dict__"""
+
+    __slots__ = ('order_target', 'sin_int', 'cos_int', 'tan_int')
+    sds_columns = WaveDataInteger.sds_columns
+
+
+class CompactWaveDataTarget(CompactWave):
+    """A WaveDataTarget event without a per-instance __dict__"""
+
+    __slots__ = ('order_target', 'tau_target', 'radians_target', 'sin_target',
+                 'cos_target', 'tan_target', 'sinh_target', 'cosh_target',
+                 'tanh_target')
+    sds_columns = WaveDataTarget.sds_columns
+
+
+class CompactWaveDataCompound(CompactWave):
+    """A WaveDataCompound event without a per-instance __dict__"""
+
+    __slots__ = ('order', 'multiplier', 'tau', 'radians', 'sin', 'cos', 'tan',
+                 'sinh', 'cosh', 'tanh')
+    sds_columns = WaveDataCompound.sds_columns
+
+
+class WaveRow:
+    """A view of one event of a WaveBatch, reading and writing its columns"""
+
+    def __init__(self, batch, index):
+        object.__setattr__(self, '_batch', batch)
+        object.__setattr__(self, '_index', index)
+
+    def __getattr__(self, name):
+        batch = self._batch
+        if name not in batch.property_names:
+            raise AttributeError(name)
+        return batch.columns[batch.property_names[name]][self._index].item()
+
+    def __setattr__(self, name, value):
+        batch = self._batch
+        if name not in batch.property_names:
+            raise AttributeError(name)
+        batch.columns[batch.property_names[name]][self._index] = value
+
+    def toJson(self):
+        """Converts the event into JSON"""
+        return json_backend.dumps(self.toDictionary())
+
+    def toDictionary(self):
+        """Converts the event into a dictionary keyed by SDS property name"""
+        return {name: column[self._index].item()
+                for name, column in self._batch.columns.items()}
+
+
+class WaveBatch:
+    """A batch of wave events stored as one contiguous array per property"""
+
+    def __init__(self, wave_class, columns=None, size=0):
+        self.wave_class = wave_class
+        self.property_names = {prop: name for name, prop, _
+                               in wave_class.sds_columns}
+        columns = columns or {}
+        if columns:
+            size = len(next(iter(columns.values())))
+        self.columns = {}
+        for name, _, dtype in wave_class.sds_columns:
+            if name in columns:
+                column = np.ascontiguousarray(columns[name], dtype=dtype)
+            else:
+                column = np.zeros(size, dtype=dtype)
+            if column.shape != (size,):
+                raise ValueError(f'Column {name} does not have {size} values')
+            self.columns[name] = column
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())))
+
+    def __getitem__(self, key):
+        """Returns a row view for an integer, otherwise a sliced WaveBatch"""
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError('WaveBatch index out of range')
+            return WaveRow(self, key)
+        return WaveBatch(self.wave_class,
+                         {name: column[key] for name, column in self.columns.items()})
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield WaveRow(self, index)
+
+    @property
+    def nbytes(self):
+        """Returns the number of bytes held by the columns"""
+        return sum(column.nbytes for column in self.columns.values())
+
+    @staticmethod
+    def concatenate(batches):
+        """Joins batches of the same wave class into a new WaveBatch"""
+        batches = list(batches)
+        if len(batches) == 0:
+            raise ValueError('No batches to concatenate')
+        wave_class = batches[0].wave_class
+        if any(batch.wave_class is not wave_class for batch in batches):
+            raise ValueError('Cannot concatenate batches of different wave classes')
+        return WaveBatch(wave_class, {
+            name: np.concatenate([batch.columns[name] for batch in batches])
+            for name in batches[0].columns})
+
+    def toJson(self):
+        """Converts the batch into an SDS JSON array of events"""
+        if not all(np.isfinite(column).all() for column in self.columns.values()):
+            return '[' + ', '.join(self.jsonRows()) + ']'
+        return json_backend.get_backend().dumps_table(
+            list(self.columns),
+            [column.tolist() for column in self.columns.values()])
+
+    def jsonRows(self):
+        """Converts each event of the batch into a JSON object string"""
+        if not all(np.isfinite(column).all() for column in self.columns.values()):
+            # Let the backend encode NaN and Infinity its own way
+            return [json_backend.dumps(row.toDictionary()) for row in self]
+        return json_backend.get_backend().dumps_rows(
+            list(self.columns),
+            [column.tolist() for column in self.columns.values()])
+
+    @staticmethod
+    def fromJson(content, wave_class):
+        """Creates the batch from an SDS JSON array, or its parsed list"""
+        if isinstance(content, (str, bytes)):
+            content = json_backend.loads(content)
+        size = len(content)
+        columns = {}
+        for name, _, dtype in wave_class.sds_columns:
+            # Many JSON implementations leave default values out
+            columns[name] = np.fromiter(
+                (event.get(name) or 0 for event in content), dtype, size)
+        return WaveBatch(wave_class, columns, size)
+
+    def toWaves(self):
+        """Converts the batch into a list of wave_class events"""
+        waves = []
+        for values in zip(*(column.tolist() for column in self.columns.values())):
+            wave = self.wave_class()
+            for (_, prop, _), value in zip(self.wave_class.sds_columns, values):
+                setattr(wave, prop, value)
+            waves.append(wave)
+        return waves
+
+    @staticmethod
+    def fromWaves(waves, wave_class):
+        """Creates the batch from a list of wave_class events"""
+        waves = list(waves)
+        columns = {}
+        for name, prop, dtype in wave_class.sds_columns:
+            columns[name] = np.fromiter(
+                (getattr(wave, prop) or 0 for wave in waves), dtype, len(waves))
+        return WaveBatch(wave_class, columns, len(waves))
+
+
+def check_waves(wave_class, low, high, multiplier):
+    """Raises ValueError for waves that wave_class cannot hold: orders from
+    low to high outside its Order type, or multipliers that are not whole
+    numbers when it has a Multiplier, which is an integer key
+    """
+    columns = {name: dtype for name, _, dtype in wave_class.sds_columns}
+    if 'Order' in columns:
+        limits = np.iinfo(columns['Order'])
+        if low < limits.min or high > limits.max:
+            raise ValueError(f'Orders from {low} to {high} do not fit the '
+                             f'{limits.dtype} Order of {wave_class.__name__}')
+    if 'Multiplier' in columns and np.any(
+            np.asarray(multiplier) != np.round(multiplier)):
+        raise ValueError(f'{wave_class.__name__} multipliers must be whole '
+                         'numbers')
+
+
+def is_batch(events):
+    """Check whether events are a WaveBatch, also when wave_data was
+    imported under another module name, as through the package
+    """
+    return hasattr(events, 'columns') and hasattr(events, 'wave_class')
+
+
+def encode_events(events):
+    """Converts a WaveBatch or a list of wave events or dictionaries into an
+    SDS JSON array in one call to the JSON backend
+    """
+    if is_batch(events):
+        return events.toJson()
+    return json_backend.dumps([
+        event.toDictionary() if hasattr(event, 'toDictionary') else event
+        for event in events])
+
+
+def decode_events(content, wave_class):
+    """Creates wave_class events from an SDS JSON array parsed in one call
+    to the JSON backend
+    """
+    if isinstance(content, (str, bytes)):
+        content = json_backend.loads(content)
+    from_dictionary = wave_class.fromDictionary
+    return [from_dictionary(event) for event in content]
+
+
+def iter_json(events, chunk_size=1000):
+    """Yields an SDS JSON array of events as a sequence of encoded chunks
+
+    events can be a WaveBatch, or an iterable of wave events, dictionaries or
+    WaveBatches that is consumed lazily, so only chunk_size events are held
+    encoded at any time
+    """
+    if is_batch(events):
+        events = [events]
+
+    separator = '['
+    pending = []
+    for item in events:
+        if is_batch(item):
+            chunks = (item[start:start + chunk_size].toJson()
+                      for start in range(0, len(item), chunk_size))
+        else:
+            pending.append(item.toDictionary()
+                           if hasattr(item, 'toDictionary') else item)
+            if len(pending) < chunk_size:
+                continue
+            chunks = [json_backend.dumps(pending)]
+            pending = []
+        for chunk in chunks:
+            yield (separator + chunk[1:-1]).encode()
+            separator = ', '
+
+    if pending:
+        yield (separator + json_backend.dumps(pending)[1:-1]).encode()
+        separator = ', '
+    yield b']' if separator == ', ' else b'[]'
+
+
+def iter_json_rows(events, chunk_size=1000):
+    """Yields each event of a WaveBatch or of an iterable of wave events,
+    dictionaries or WaveBatches as a JSON object string
+    """
+    if is_batch(events):
+        events = [events]
+
+    for item in events:
+        if is_batch(item):
+            for start in range(0, len(item), chunk_size):
+                yield from item[start:start + chunk_size].jsonRows()
+        else:
+            yield json_backend.dumps(item.toDictionary()
+                             if hasattr(item, 'toDictionary') else item)
+
+
+class JsonPayload:
+    """A streamed SDS JSON array for insertValues, updateValues and
+    replaceValues
+
+    requests sends it with chunked transfer encoding. Those calls only look
+    at values[0] to tell a JSON payload from a list of events, so indexing
+    returns the opening bracket of the array as it would for a str payload
+    """
+
+    def __init__(self, events, chunk_size=1000):
+        self.events = events
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        return iter_json(self.events, self.chunk_size)
+
+    def __getitem__(self, index):
+        if index != 0:
+            raise IndexError('JsonPayload only exposes its first character')
+        return '['
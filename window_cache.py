@@ -0,0 +1,621 @@
+"""Read-through cache of SDS window and range reads
+
+Wrap an SDS client with WindowCache.wrap and read through the wrapper as
+usual. Window reads of a stream are held as segments of its index, which
+overlapping reads are merged into, so a read inside a segment is served
+without a request and a read that overlaps one only requests what is
+missing. Range reads and the pages of paged window reads are held per set
+of arguments. Writes through the same wrapper invalidate the entries that
+hold the written indexes. The cache works on streams with a single numeric
+index; other reads go to SDS unchanged
+"""
+
+import math
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+import numpy as np
+from adh_sample_library_preview import SdsBoundaryType
+
+import json_backend
+from interpolation import as_mode
+
+COUNTERS = ('hits', 'misses', 'requests', 'bypasses', 'evictions',
+            'invalidations')
+
+
+def index_value(value):
+    """Returns an index as a float, or None when it is not a number"""
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def index_param(value):
+    """Formats an index for a request, writing whole numbers as integers"""
+    return int(value) if float(value).is_integer() else value
+
+
+def find_name(names, name):
+    """Finds a property name, ignoring case as SDS does"""
+    for candidate in names:
+        if candidate.lower() == name.lower():
+            return candidate
+    return None
+
+
+def object_bytes(obj):
+    """Estimates the memory of an event and of its attribute values"""
+    size = sys.getsizeof(obj)
+    content = obj if isinstance(obj, dict) else getattr(obj, '__dict__', None)
+    if content is None:
+        return size + sum(sys.getsizeof(getattr(obj, name, None))
+                          for name in getattr(obj, '__slots__', ()))
+    if content is not obj:
+        size += sys.getsizeof(content)
+    return size + sum(sys.getsizeof(key) + sys.getsizeof(value)
+                      for key, value in content.items())
+
+
+def estimate_bytes(value):
+    """Estimates the memory of a cached result from its first event"""
+    if not isinstance(value, list):
+        return object_bytes(value)
+    if not value:
+        return sys.getsizeof(value)
+    return sys.getsizeof(value) + len(value) * object_bytes(value[0])
+
+
+def written_keys(values, name):
+    """Returns the sorted indexes of the events of a write
+
+    Returns None when they cannot be read without consuming the payload,
+    such as for a generator of JSON chunks
+    """
+    values = getattr(values, 'events', values)
+    if isinstance(values, (str, bytes)):
+        values = json_backend.loads(values)
+    columns = getattr(values, 'columns', None)
+    if columns is not None:
+        column = find_name(columns, name)
+        if column is None:
+            return None
+        return np.sort(np.asarray(columns[column], dtype=np.float64))
+    if isinstance(values, dict):
+        values = [values]
+    if not isinstance(values, (list, tuple)):
+        return None
+
+    keys = []
+    for event in values:
+        if not isinstance(event, dict):
+            if not callable(getattr(event, 'toDictionary', None)):
+                return None
+            event = event.toDictionary()
+        key = find_name(event, name)
+        keys.append(None if key is None else index_value(event[key]))
+    if None in keys:
+        return None
+    return np.sort(np.asarray(keys, dtype=np.float64))
+
+
+def convert(events, value_class):
+    """Converts JSON events with value_class.fromJson, as SDS reads do"""
+    if value_class is None:
+        return events
+    return [value_class.fromJson(event) for event in events]
+
+
+class CacheEntry:
+    """A cached result and the indexes of the stream it depends on
+
+    A write at an index from low to high invalidates the entry. A window
+    segment also holds the index of each of its events in keys
+    """
+
+    def __init__(self, stream, key, low, high, value, keys=None, view=''):
+        self.stream = stream
+        self.key = key
+        self.low = low
+        self.high = high
+        self.value = value
+        self.keys = keys
+        self.view = view
+        self.size = estimate_bytes(value)
+        if keys is not None:
+            self.size += sys.getsizeof(keys) + 24 * len(keys)
+
+
+class WindowCache:
+    """Caches the window and range reads of SDS clients wrapped by wrap()
+
+    Entries are evicted least recently used first once their estimated
+    size exceeds budget bytes. Cached events are shared between the reads
+    that return them, so they should not be modified
+    """
+
+    def __init__(self, budget=64 << 20):
+        self.budget = budget
+        self.size = 0
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
+        self.__lock = threading.RLock()
+        self.__lru = OrderedDict()
+        self.__windows = {}
+        self.__calls = {}
+        self.__streams = {}
+        self.__generations = {}
+        self.__indexes = {}
+
+    def wrap(self, sds_client):
+        """Returns sds_client with its reads served by the cache
+
+        Works with an EDSClient, an ADHClient or a BlockingSdsClient
+        """
+        return CachedClient(self, sds_client)
+
+    def stats(self):
+        """Returns the counters, entries and estimated bytes of the cache"""
+        with self.__lock:
+            stats = {counter: getattr(self, counter) for counter in COUNTERS}
+            stats['entries'] = len(self.__lru)
+            stats['bytes'] = self.size
+            return stats
+
+    def clear(self):
+        """Drops every entry"""
+        with self.__lock:
+            for entry in list(self.__lru):
+                self.drop(entry)
+            self.__indexes.clear()
+
+    def index_name(self, sds_client, namespace_id, stream_id,
+                   stream_view_id=''):
+        """Returns the index property of the events read from a stream
+
+        The events of a stream view have the index of its target type.
+        Returns None for a compound index
+        """
+        lookup = (namespace_id, stream_id, stream_view_id or '')
+        with self.__lock:
+            if lookup in self.__indexes:
+                return self.__indexes[lookup]
+        if stream_view_id:
+            stream_view = sds_client.StreamViews.getStreamView(
+                namespace_id, stream_view_id)
+            sds_type = sds_client.Types.getType(namespace_id,
+                                                stream_view.TargetTypeId)
+        else:
+            sds_type = sds_client.Streams.getStreamType(namespace_id,
+                                                        stream_id)
+        keys = [prop.Id for prop in sds_type.Properties if prop.IsKey]
+        name = keys[0] if len(keys) == 1 else None
+        with self.__lock:
+            self.__indexes[lookup] = name
+        return name
+
+    def window_values(self, sds_client, namespace_id, stream_id, start, end,
+                      value_class=None, filter=''):
+        """Reads a window, requesting only what no segment holds"""
+        stream = (namespace_id, stream_id)
+        low, high = index_value(start), index_value(end)
+        name = None if low is None or high is None or high < low \
+            else self.index_name(sds_client, namespace_id, stream_id)
+        if name is None:
+            self.count('bypasses')
+            return sds_client.Streams.getWindowValues(
+                namespace_id, stream_id, start, end, value_class, filter)
+        key = ('window', stream, value_class, filter)
+
+        with self.__lock:
+            segments = sorted(
+                (segment for segment in self.__windows.get(key, [])
+                 if segment.low <= high and segment.high >= low),
+                key=lambda segment: segment.low)
+            if (len(segments) == 1 and segments[0].low <= low
+                    and high <= segments[0].high):
+                segment = segments[0]
+                self.__lru.move_to_end(segment)
+                self.hits += 1
+                return segment.value[bisect_left(segment.keys, low):
+                                     bisect_right(segment.keys, high)]
+            self.misses += 1
+            generation = self.__generations.get(stream, 0)
+
+        # Request the parts of the window between the overlapping segments;
+        # events at the edges of a segment are requested again
+        gaps = []
+        cursor, cursor_param = low, start
+        for segment in segments:
+            if segment.low > cursor:
+                gaps.append((cursor_param, index_param(segment.low)))
+            if segment.high > cursor:
+                cursor, cursor_param = segment.high, index_param(segment.high)
+        if cursor < high:
+            gaps.append((cursor_param, end))
+
+        merged = {}
+        for segment in segments:
+            merged.update(zip(segment.keys, segment.value))
+        for gap_start, gap_end in gaps:
+            events = sds_client.Streams.getWindowValues(
+                namespace_id, stream_id, gap_start, gap_end, None, filter)
+            self.count('requests')
+            for event, value in zip(events, convert(events, value_class)):
+                merged[index_value(event.get(name))] = value
+        if None in merged:
+            # Events without a numeric index are returned, not cached
+            return [value for index, value in merged.items()
+                    if index is None or low <= index <= high]
+
+        keys = sorted(merged)
+        segment = CacheEntry(
+            stream, key, min([low, *(s.low for s in segments)]),
+            max([high, *(s.high for s in segments)]),
+            [merged[index] for index in keys], keys)
+        with self.__lock:
+            if self.__generations.get(stream, 0) == generation:
+                for old in segments:
+                    if old in self.__lru:
+                        self.drop(old)
+                self.store(segment)
+        return segment.value[bisect_left(keys, low):bisect_right(keys, high)]
+
+    def range_values(self, sds_client, namespace_id, stream_id, value_class,
+                     start, skip, count, reversed, boundary_type, filter='',
+                     stream_view_id=''):
+        """Reads a range of count events from start, once per set of
+        arguments
+        """
+        origin = index_value(start)
+        name = None if origin is None else self.index_name(
+            sds_client, namespace_id, stream_id, stream_view_id)
+        if name is None:
+            self.count('bypasses')
+            return sds_client.Streams.getRangeValues(
+                namespace_id, stream_id, value_class, start, skip, count,
+                reversed, boundary_type, filter, stream_view_id)
+        boundary = as_mode(boundary_type, SdsBoundaryType,
+                           SdsBoundaryType.Exact)
+
+        def read():
+            events = sds_client.Streams.getRangeValues(
+                namespace_id, stream_id, None, start, skip, count, reversed,
+                boundary_type, filter, stream_view_id)
+            # The range ends at the last event if it holds count events;
+            # a boundary other than Exact or Inside can use the events
+            # before the start
+            last = index_value(events[-1].get(name)) if events else None
+            if len(events) < count or last is None:
+                last = math.inf if not reversed else -math.inf
+            first = origin if boundary in (SdsBoundaryType.Exact,
+                                           SdsBoundaryType.Inside) \
+                else (-math.inf if not reversed else math.inf)
+            low, high = (first, last) if not reversed else (last, first)
+            return convert(events, value_class), low, high
+
+        return self.call(
+            (namespace_id, stream_id),
+            ('range', namespace_id, stream_id, value_class, origin, skip,
+             count, bool(reversed), boundary, filter, stream_view_id or ''),
+            read, stream_view_id)
+
+    def window_page(self, sds_client, namespace_id, stream_id, start, end,
+                    count, continuation_token='', value_class=None, filter='',
+                    *boundaries):
+        """Reads a page of a window, once per set of arguments
+
+        A page depends on every index of its window, as its continuation
+        token does
+        """
+        low, high = index_value(start), index_value(end)
+        name = None if low is None or high is None else self.index_name(
+            sds_client, namespace_id, stream_id)
+        if name is None:
+            self.count('bypasses')
+            return sds_client.Streams.getWindowValuesPaged(
+                namespace_id, stream_id, start, end, count,
+                continuation_token, value_class, filter, *boundaries)
+
+        def read():
+            return sds_client.Streams.getWindowValuesPaged(
+                namespace_id, stream_id, start, end, count,
+                continuation_token, value_class, filter, *boundaries), \
+                low, high
+
+        return self.call(
+            (namespace_id, stream_id),
+            ('page', namespace_id, stream_id, value_class, low, high, count,
+             continuation_token or '', filter, *map(str, boundaries)), read)
+
+    def call(self, stream, key, read, stream_view_id=''):
+        """Returns the cached result of a read, or reads and caches it
+
+        read returns the result and the indexes it depends on
+        """
+        with self.__lock:
+            entry = self.__calls.get(key)
+            if entry is not None:
+                self.__lru.move_to_end(entry)
+                self.hits += 1
+                return list(entry.value) if isinstance(entry.value, list) \
+                    else entry.value
+            self.misses += 1
+            generation = self.__generations.get(stream, 0)
+        value, low, high = read()
+        self.count('requests')
+        entry = CacheEntry(stream, key, low, high, value,
+                           view=stream_view_id or '')
+        with self.__lock:
+            if self.__generations.get(stream, 0) == generation:
+                if key in self.__calls:
+                    self.drop(self.__calls[key])
+                self.store(entry)
+        return list(value) if isinstance(value, list) else value
+
+    def count(self, counter):
+        """Increments a counter"""
+        with self.__lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def store(self, entry):
+        """Adds an entry, then evicts entries until the budget is met"""
+        if entry.keys is not None:
+            self.__windows.setdefault(entry.key, []).append(entry)
+        else:
+            self.__calls[entry.key] = entry
+        self.__streams.setdefault(entry.stream, set()).add(entry)
+        self.__lru[entry] = None
+        self.size += entry.size
+        while self.size > self.budget and self.__lru:
+            self.drop(next(iter(self.__lru)))
+            self.evictions += 1
+
+    def drop(self, entry):
+        """Removes an entry"""
+        del self.__lru[entry]
+        self.size -= entry.size
+        self.__streams[entry.stream].discard(entry)
+        if entry.keys is not None:
+            self.__windows[entry.key].remove(entry)
+        else:
+            del self.__calls[entry.key]
+
+    def holds(self, namespace_id, stream_id):
+        """Tells whether any entry holds events of a stream"""
+        with self.__lock:
+            return bool(self.__streams.get((namespace_id, stream_id)))
+
+    def invalidate(self, namespace_id, stream_id, low=-math.inf,
+                   high=math.inf, keys=None):
+        """Drops the entries of a stream that depend on an index from low to
+        high, or on one of the sorted keys, if given
+        """
+        stream = (namespace_id, stream_id)
+        with self.__lock:
+            self.__generations[stream] = self.__generations.get(stream, 0) + 1
+            for entry in list(self.__streams.get(stream, ())):
+                if entry.high < low or entry.low > high:
+                    continue
+                if keys is not None and np.searchsorted(
+                        keys, entry.low, 'left') == np.searchsorted(
+                        keys, entry.high, 'right'):
+                    continue
+                self.drop(entry)
+                self.invalidations += 1
+
+    def invalidate_stream(self, namespace_id, stream_id):
+        """Drops the entries and the index of a stream whose definition
+        changed
+        """
+        self.invalidate(namespace_id, stream_id)
+        with self.__lock:
+            self.__indexes.pop((namespace_id, stream_id, ''), None)
+
+    def invalidate_view(self, namespace_id, stream_view_id):
+        """Drops the entries read through a stream view that changed"""
+        with self.__lock:
+            for entry in list(self.__lru):
+                if entry.view == stream_view_id \
+                        and entry.stream[0] == namespace_id:
+                    self.drop(entry)
+                    self.invalidations += 1
+            for lookup in list(self.__indexes):
+                if lookup[0] == namespace_id and lookup[2] == stream_view_id:
+                    del self.__indexes[lookup]
+
+    def write(self, sds_client, namespace_id, stream_id, values):
+        """Invalidates the entries holding the indexes of a write"""
+        keys = None
+        if self.holds(namespace_id, stream_id):
+            name = self.index_name(sds_client, namespace_id, stream_id)
+            keys = None if name is None else written_keys(values, name)
+        if keys is None:
+            self.invalidate(namespace_id, stream_id)
+        elif len(keys):
+            self.invalidate(namespace_id, stream_id, keys[0], keys[-1], keys)
+
+
+class CachedClient:
+    """An SDS client whose reads go through a WindowCache"""
+
+    def __init__(self, cache, sds_client):
+        self.__sds_client = sds_client
+        self.__streams = CachedStreams(cache, sds_client)
+        self.__stream_views = CachedStreamViews(cache, sds_client)
+
+    def __getattr__(self, name):
+        if name == 'Streams':
+            return self.__streams
+        if name == 'StreamViews':
+            return self.__stream_views
+        return getattr(self.__sds_client, name)
+
+
+class CachedStreams:
+    """The Streams calls of a CachedClient"""
+
+    def __init__(self, cache, sds_client):
+        self.__cache = cache
+        self.__sds_client = sds_client
+        self.__streams = sds_client.Streams
+
+    def __getattr__(self, name):
+        return getattr(self.__streams, name)
+
+    def getWindowValues(self, namespace_id, stream_id, start, end,
+                        value_class=None, filter=''):
+        """Reads a window through the cache"""
+        return self.__cache.window_values(self.__sds_client, namespace_id,
+                                          stream_id, start, end, value_class,
+                                          filter)
+
+    def getWindowValuesPaged(self, namespace_id, stream_id, start, end,
+                             count, continuation_token='', value_class=None,
+                             filter='', *boundaries):
+        """Reads a page of a window through the cache"""
+        return self.__cache.window_page(
+            self.__sds_client, namespace_id, stream_id, start, end, count,
+            continuation_token, value_class, filter, *boundaries)
+
+    def getRangeValues(self, namespace_id, stream_id, value_class, start,
+                       skip, count, reversed, boundary_type, filter='',
+                       stream_view_id=''):
+        """Reads a range through the cache"""
+        return self.__cache.range_values(
+            self.__sds_client, namespace_id, stream_id, value_class, start,
+            skip, count, reversed, boundary_type, filter, stream_view_id)
+
+    def getRangeValuesInterpolated(self, namespace_id, stream_id, value_class,
+                                   start, end, count, filter=''):
+        """Reads interpolated values through the cache"""
+        def read():
+            return self.__streams.getRangeValuesInterpolated(
+                namespace_id, stream_id, value_class, start, end, count,
+                filter), -math.inf, math.inf
+        return self.__cache.call(
+            (namespace_id, stream_id),
+            ('interpolated', namespace_id, stream_id, value_class, str(start),
+             str(end), count, filter), read)
+
+    def getSampledValues(self, namespace_id, stream_id, value_class, start,
+                         end, sample_by, intervals, filter='',
+                         stream_view_id=''):
+        """Reads sampled values through the cache"""
+        def read():
+            low, high = index_value(start), index_value(end)
+            return self.__streams.getSampledValues(
+                namespace_id, stream_id, value_class, start, end, sample_by,
+                intervals, filter, stream_view_id), \
+                -math.inf if low is None else low, \
+                math.inf if high is None else high
+        return self.__cache.call(
+            (namespace_id, stream_id),
+            ('sampled', namespace_id, stream_id, value_class, str(start),
+             str(end), sample_by, intervals, filter, stream_view_id or ''),
+            read, stream_view_id)
+
+    def insertValues(self, namespace_id, stream_id, values):
+        """Inserts values, then invalidates the entries they change"""
+        try:
+            return self.__streams.insertValues(namespace_id, stream_id,
+                                               values)
+        finally:
+            self.__cache.write(self.__sds_client, namespace_id, stream_id,
+                               values)
+
+    def updateValues(self, namespace_id, stream_id, values):
+        """Updates values, then invalidates the entries they change"""
+        try:
+            return self.__streams.updateValues(namespace_id, stream_id,
+                                               values)
+        finally:
+            self.__cache.write(self.__sds_client, namespace_id, stream_id,
+                               values)
+
+    def replaceValues(self, namespace_id, stream_id, values):
+        """Replaces values, then invalidates the entries they change"""
+        try:
+            return self.__streams.replaceValues(namespace_id, stream_id,
+                                                values)
+        finally:
+            self.__cache.write(self.__sds_client, namespace_id, stream_id,
+                               values)
+
+    def removeValue(self, namespace_id, stream_id, key):
+        """Removes a value, then invalidates the entries that hold it"""
+        try:
+            return self.__streams.removeValue(namespace_id, stream_id, key)
+        finally:
+            index = index_value(key)
+            if index is None:
+                self.__cache.invalidate(namespace_id, stream_id)
+            else:
+                self.__cache.invalidate(namespace_id, stream_id, index, index)
+
+    def removeWindowValues(self, namespace_id, stream_id, start, end):
+        """Removes a window, then invalidates the entries that overlap it"""
+        try:
+            return self.__streams.removeWindowValues(namespace_id, stream_id,
+                                                     start, end)
+        finally:
+            low, high = index_value(start), index_value(end)
+            self.__cache.invalidate(
+                namespace_id, stream_id,
+                -math.inf if low is None else low,
+                math.inf if high is None else high)
+
+    def createOrUpdateStream(self, namespace_id, stream):
+        """Creates or updates a stream, then drops its entries"""
+        try:
+            return self.__streams.createOrUpdateStream(namespace_id, stream)
+        finally:
+            self.__cache.invalidate_stream(namespace_id, stream.Id)
+
+    def updateStreamType(self, namespace_id, stream_id, stream_view_id):
+        """Changes the type of a stream, then drops its entries"""
+        try:
+            return self.__streams.updateStreamType(namespace_id, stream_id,
+                                                   stream_view_id)
+        finally:
+            self.__cache.invalidate_stream(namespace_id, stream_id)
+
+    def deleteStream(self, namespace_id, stream_id):
+        """Deletes a stream, then drops its entries"""
+        try:
+            return self.__streams.deleteStream(namespace_id, stream_id)
+        finally:
+            self.__cache.invalidate_stream(namespace_id, stream_id)
+
+
+class CachedStreamViews:
+    """The StreamViews calls of a CachedClient"""
+
+    def __init__(self, cache, sds_client):
+        self.__cache = cache
+        self.__stream_views = sds_client.StreamViews
+
+    def __getattr__(self, name):
+        return getattr(self.__stream_views, name)
+
+    def createOrUpdateStreamView(self, namespace_id, stream_view):
+        """Creates or updates a stream view, then drops its entries"""
+        try:
+            return self.__stream_views.createOrUpdateStreamView(
+                namespace_id, stream_view)
+        finally:
+            self.__cache.invalidate_view(namespace_id, stream_view.Id)
+
+    def deleteStreamView(self, namespace_id, stream_view_id):
+        """Deletes a stream view, then drops its entries"""
+        try:
+            return self.__stream_views.deleteStreamView(namespace_id,
+                                                        stream_view_id)
+        finally:
+            self.__cache.invalidate_view(namespace_id, stream_view_id)